@@ -1,7 +1,10 @@
 import pandas as pd
+import glob
+import gzip
 import json
 import os
 import re
+import sys
 from datetime import datetime
 
 def parse_log_file(filepath, questionarios_set):
@@ -32,12 +35,17 @@ def parse_log_file(filepath, questionarios_set):
     hora_inicial_dt = None
     hora_final_dt = None
     falha_detectada = False
+    # O back-end grava "--- Resposta com erro: <tipo> ---" antes de cada resposta de erro; uma resposta
+    # marcada conta um erro, e as sem marcação (logs anteriores a ela e respostas do Gemini) são verificadas pelo texto
+    resposta_marcada = False
     
     datetime_pattern = r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}"
 
     with open(filepath, 'r', encoding='utf-8') as f:
         for line in f:
-            if "Tipo de Atendimento:" in line:
+            if line.startswith("--- Resposta com erro:"):
+                resposta_marcada = True
+            elif "Tipo de Atendimento:" in line:
                 data["Tipo de chat"] = line.split(":")[1].strip()
             elif "--- Início da interação:" in line:
                 match = re.search(datetime_pattern, line)
@@ -57,16 +65,20 @@ def parse_log_file(filepath, questionarios_set):
                 data["Msg Bot"] += 1
                 
                 bot_message = line.split("] Bot:")[1].strip()
-                if "Não temos um item com esse número" in bot_message or \
-                    "Por favor, informe apenas a quantidade em números" in bot_message or \
-                    "Desculpa, não entendi" in bot_message or \
-                    "Número inválido" in bot_message:
-                    data["Contagem de Erros do Bot"] += 1
-                
-                if "não entendi o que você quis dizer" in bot_message.lower() or \
-                    "não tenho como saber" in bot_message.lower() or \
-                    "não tenho como te dar essa resposta" in bot_message.lower():
+                if resposta_marcada:
                     data["Contagem de Erros do Bot"] += 1
+                    resposta_marcada = False
+                else:
+                    if "Não temos um item com esse número" in bot_message or \
+                        "Por favor, informe apenas a quantidade em números" in bot_message or \
+                        "Desculpa, não entendi" in bot_message or \
+                        "Número inválido" in bot_message:
+                        data["Contagem de Erros do Bot"] += 1
+
+                    if "não entendi o que você quis dizer" in bot_message.lower() or \
+                        "não tenho como saber" in bot_message.lower() or \
+                        "não tenho como te dar essa resposta" in bot_message.lower():
+                        data["Contagem de Erros do Bot"] += 1
 
                 if "atendimento está encerrado" in bot_message.lower():
                     falha_detectada = True
@@ -124,24 +136,171 @@ def parse_questionnaire_file(filepath, data):
             data["Pergunta 4"] = p4_block.split("Resposta:")[1].strip()
         except IndexError: pass
 
-def main():
-    print("Iniciando análise dos logs...")
+_DATA_ARQUIVO = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.txt$")
 
-    logs_base_path = os.path.join('..', 'Back-end', 'logs')
+def _data_do_arquivo(nome_arquivo):
+    # Os nomes terminam com a data de criação (AAAA-MM-DD_HH-MM-SS), que ordena corretamente como texto
+    encontrada = _DATA_ARQUIVO.search(nome_arquivo)
+    return encontrada.group(1) if encontrada else ""
+
+def carregar_indice(caminho_json):
+    """
+    Lê um índice de logs do back-end da mesma forma que log_index.ler_indice: a lista compactada (.json),
+    as entradas registradas depois da última compactação (.jsonl) e as de uma compactação interrompida
+    (.jsonl.*.compactando). Retorna os arquivos da conversa mais recente para a mais antiga.
+    Levanta FileNotFoundError se o índice não existir em nenhuma dessas formas.
+    """
+    caminho_jsonl = caminho_json + 'l'
+    pendentes = sorted(glob.glob(caminho_jsonl + '.*.compactando'))
+    if os.path.exists(caminho_jsonl):
+        pendentes.append(caminho_jsonl)
+    if not pendentes and not os.path.exists(caminho_json):
+        raise FileNotFoundError(caminho_json)
+
+    arquivos = []
+    if os.path.exists(caminho_json):
+        with open(caminho_json, 'r', encoding='utf-8') as f:
+            arquivos = json.load(f)
+
+    registrados = []
+    for caminho in pendentes:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    registrados.append(json.loads(line)["arquivo"])
+                except (ValueError, KeyError):
+                    pass
+
+    # Entradas pendentes primeiro (mais novas antes), como no back-end, para desempatar arquivos do mesmo segundo
+    arquivos = list(dict.fromkeys(registrados[::-1] + arquivos))
+    return sorted(arquivos, key=_data_do_arquivo, reverse=True)
+
+def carregar_eventos(events_path):
+    """
+    Lê os eventos por mensagem gravados pelo back-end (logs/events): os arquivos rotacionados
+    (eventos_*.jsonl.gz) e o arquivo atual (eventos.jsonl). Uma rotação interrompida pode deixar
+    o mesmo arquivo com e sem .gz; nesse caso só o .gz é lido. Linhas incompletas (gravação
+    interrompida) são ignoradas.
+    """
+    comprimidos = sorted(glob.glob(os.path.join(events_path, 'eventos_*.jsonl.gz')))
+    arquivos = comprimidos + [
+        caminho for caminho in sorted(glob.glob(os.path.join(events_path, 'eventos_*.jsonl')))
+        if caminho + '.gz' not in comprimidos
+    ]
+    atual = os.path.join(events_path, 'eventos.jsonl')
+    if os.path.exists(atual):
+        arquivos.append(atual)
+
+    eventos = []
+    for caminho in arquivos:
+        abrir = gzip.open if caminho.endswith('.gz') else open
+        with abrir(caminho, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    continue
+                try:
+                    eventos.append(json.loads(line))
+                except ValueError:
+                    pass
+    return eventos
+
+def consolidar_eventos(eventos):
+    """
+    Monta uma linha por conversa (as mesmas colunas de parse_log_file) a partir dos eventos por
+    mensagem. Estado, erros e encerramento vêm registrados em cada evento, sem depender do texto
+    das respostas: cada mensagem respondida com erro conta um erro, e o resultado é "Falha"
+    quando o bot encerrou o atendimento.
+    """
+    por_sessao = {}
+    for evento in eventos:
+        por_sessao.setdefault(evento["session_id"], []).append(evento)
+
+    conversas = []
+    for session_id, eventos_sessao in por_sessao.items():
+        eventos_sessao.sort(key=lambda evento: evento["ts"])
+        data = None
+        fase_anterior = None
+        for evento in eventos_sessao:
+            fase = evento["phase"]
+            if evento["error_kind"] == "overloaded":
+                # Mensagem recusada com o Gemini sobrecarregado: o cliente a reenvia e ela não entra na conversa
+                continue
+            if fase == "conversation":
+                # Uma conversa nova começa na primeira mensagem depois da avaliação ou do questionário
+                if data is None or fase_anterior != "conversation":
+                    data = {
+                        "Código da conversa": session_id,
+                        "Tipo de chat": None,
+                        "Hora inicial": evento["ts"][:19],
+                        "Hora final": None,
+                        "Tempo total": None,
+                        "Msg Usuário": 0,
+                        "Msg Bot": 0,
+                        "Total Mensagens": 0,
+                        "Contagem de Erros do Bot": 0,
+                        "Respondeu o questionario?": "Não",
+                        "Pergunta 1": "N/A",
+                        "Pergunta 2": "N/A",
+                        "Pergunta 3": "N/A",
+                        "Pergunta 4": "N/A",
+                        "Resultado Inferido": "Sucesso",
+                        "_respostas": {},
+                        "_falha": False,
+                    }
+                    conversas.append(data)
+                data["Msg Usuário"] += 1
+                if evento["reply_chars"]:
+                    data["Msg Bot"] += 1
+                if evento["error"]:
+                    data["Contagem de Erros do Bot"] += 1
+                if evento["ended_by_bot"]:
+                    data["_falha"] = True
+                data["Hora final"] = evento["ts"][:19]
+            elif fase == "questionnaire" and data is not None:
+                numero = evento["state_before"].rsplit('_', 1)[-1]
+                data["_respostas"][f"Pergunta {numero}"] = evento.get("questionnaire_answer")
+            if data is not None and evento["bot_type"]:
+                data["Tipo de chat"] = evento["bot_type"]
+            fase_anterior = fase
+
+    for data in conversas:
+        if data["Tipo de chat"] is None:
+            data["Tipo de chat"] = "Desconhecido"
+        data["Total Mensagens"] = data["Msg Usuário"] + data["Msg Bot"]
+        inicio = datetime.strptime(data["Hora inicial"], '%Y-%m-%d %H:%M:%S')
+        fim = datetime.strptime(data["Hora final"], '%Y-%m-%d %H:%M:%S')
+        data["Tempo total"] = str(fim - inicio)
+
+        if data.pop("_falha"):
+            data["Resultado Inferido"] = "Falha"
+        elif data["Contagem de Erros do Bot"] > 0:
+            data["Resultado Inferido"] = "Sucesso com Erros"
+
+        # O questionário só é gravado depois da última pergunta, então só ele conta como respondido
+        respostas = data.pop("_respostas")
+        if "Pergunta 4" in respostas:
+            data["Respondeu o questionario?"] = "Sim"
+            data.update(respostas)
+
+    return conversas
+
+def analisar_logs_texto(logs_base_path):
+    """
+    Uma linha por conversa a partir dos logs em texto (conversations/ e questionarios/), ou None se
+    os índices não forem encontrados.
+    """
     conversations_path = os.path.join(logs_base_path, 'conversations')
     
     log_list_file = os.path.join(logs_base_path, 'log-list.json')
     questionario_list_file = os.path.join(logs_base_path, 'questionario-list.json')
 
     try:
-        with open(log_list_file, 'r', encoding='utf-8') as f:
-            conversation_files = json.load(f)
-        with open(questionario_list_file, 'r', encoding='utf-8') as f:
-            questionario_files = json.load(f)
+        conversation_files = carregar_indice(log_list_file)
+        questionario_files = carregar_indice(questionario_list_file)
     except FileNotFoundError as e:
         print(f"ERRO: Arquivo não encontrado - {e}.")
         print("Verifique se os caminhos no script estão corretos e se os arquivos JSON existem em 'Back-end/logs/'.")
-        return
+        return None
 
     questionarios_set = set(questionario_files)
     all_conversation_data = []
@@ -155,6 +314,23 @@ def main():
         else:
             print(f"AVISO: Arquivo de log não encontrado em {filepath}")
 
+    return all_conversation_data
+
+def main():
+    print("Iniciando análise dos logs...")
+
+    logs_base_path = os.path.join('..', 'Back-end', 'logs')
+
+    if '--eventos' in sys.argv[1:]:
+        # Eventos por mensagem (logs/events) em vez dos logs em texto
+        events_path = os.path.join(logs_base_path, 'events')
+        all_conversation_data = consolidar_eventos(carregar_eventos(events_path))
+        print(f"{len(all_conversation_data)} conversas encontradas nos eventos de {events_path}")
+    else:
+        all_conversation_data = analisar_logs_texto(logs_base_path)
+        if all_conversation_data is None:
+            return
+
     if not all_conversation_data:
         print("Nenhum dado foi processado. Verifique os caminhos e os arquivos JSON.")
         return
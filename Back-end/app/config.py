@@ -3,6 +3,10 @@ import os
 from dotenv import load_dotenv
 import logging
 
+# Pasta Back-end/: os caminhos padrão de dados, logs e bancos partem dela, qualquer que seja o diretório atual
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Bancos SQLite, diário de sessões e perfis gravados pelo servidor
+INSTANCE_DIR = os.path.join(PROJECT_ROOT, "instance")
 
 def load_configurations(app):
     load_dotenv()
@@ -0,0 +1,118 @@
+import json
+import os
+from collections import namedtuple
+
+from ..config import PROJECT_ROOT
+
+CATALOGO_PATH = os.getenv("CATALOGO_PATH", os.path.join(PROJECT_ROOT, "app", "data", "cardapio.json"))
+
+# O número 9 é a opção "voltar ao menu principal" do fluxo tradicional
+_NUMERO_RESERVADO = 9
+
+Item = namedtuple("Item", ["numero", "nome", "preco", "categoria"])
+
+
+def formatar_preco(preco):
+    """Preço no formato brasileiro: 10.0 -> 'R$ 10,00'."""
+    return f"R$ {preco:.2f}".replace(".", ",")
+
+
+class Catalogo:
+    """
+    Cardápio carregado uma única vez do arquivo de dados (app/data/cardapio.json).
+
+    É a fonte única dos itens e preços para os dois fluxos: o texto do cardápio do fluxo tradicional
+    e a lista de itens das instruções da Sara são montados aqui na carga e reutilizados em toda mensagem.
+    """
+
+    def __init__(self, itens):
+        self.itens = tuple(sorted(itens, key=lambda item: item.numero))
+        self.por_numero = {item.numero: item for item in self.itens}
+        self.por_nome = {item.nome: item for item in self.itens}
+        self._validar()
+
+        linhas = "\n".join(f"{item.numero} - {item.nome}: {formatar_preco(item.preco)}" for item in self.itens)
+        self.texto_cardapio = (
+            f"📋 *Cardápio*\n\n{linhas}\n\n"
+            "Para fazer um pedido, informe o número do item desejado.\n\n Ou digite *9* para voltar ao menu principal."
+        )
+
+        comidas = [f"- {item.nome}: {formatar_preco(item.preco)}" for item in self.itens if item.categoria != "bebida"]
+        bebidas = [f"- {item.nome}: {formatar_preco(item.preco)}" for item in self.itens if item.categoria == "bebida"]
+        self.texto_prompt = "\n".join(comidas + (["- Bebidas:"] + bebidas if bebidas else []))
+
+    def _validar(self):
+        if not self.itens:
+            raise ValueError("O cardápio não tem itens.")
+        if len(self.por_numero) != len(self.itens):
+            raise ValueError("O cardápio tem números de item repetidos.")
+        if _NUMERO_RESERVADO in self.por_numero:
+            raise ValueError(f"O número {_NUMERO_RESERVADO} é reservado para voltar ao menu principal.")
+        for item in self.itens:
+            if item.preco <= 0:
+                raise ValueError(f"Preço inválido para o item '{item.nome}'.")
+
+    def item(self, numero):
+        return self.por_numero.get(numero)
+
+
+def carregar_catalogo(caminho=CATALOGO_PATH):
+    with open(caminho, "r", encoding="utf-8") as f:
+        dados = json.load(f)
+    return Catalogo(
+        Item(int(item["numero"]), item["nome"], float(item["preco"]), item.get("categoria", "comida"))
+        for item in dados["itens"]
+    )
+
+
+catalogo = carregar_catalogo()
+
+
+# --- Pedido ---
+# O pedido fica em sessao["customer_data"] (serializável): {"pedido": [{"item", "quantidade", "preco"}, ...],
+# "nome", "valor_total"}. As funções abaixo mantêm "valor_total" atualizado a cada alteração, sem somar o
+# pedido inteiro de novo, e juntam itens repetidos em uma única linha.
+
+def novo_pedido():
+    return {"pedido": [], "nome": None, "valor_total": 0.0}
+
+
+def _somar_total(dados, valor):
+    # Arredondado a cada passo para os centavos não acumularem erro de ponto flutuante
+    dados["valor_total"] = round(dados["valor_total"] + valor, 2)
+
+
+def adicionar_item(dados, item, quantidade):
+    """Acrescenta `quantidade` unidades de `item`; se ele já está no pedido, soma na mesma linha."""
+    for linha in dados["pedido"]:
+        if linha["item"] == item.nome:
+            linha["quantidade"] += quantidade
+            break
+    else:
+        dados["pedido"].append({"item": item.nome, "quantidade": quantidade, "preco": item.preco})
+    _somar_total(dados, item.preco * quantidade)
+
+
+def alterar_quantidade(dados, indice, quantidade):
+    linha = dados["pedido"][indice]
+    _somar_total(dados, linha["preco"] * (quantidade - linha["quantidade"]))
+    linha["quantidade"] = quantidade
+
+
+def remover_item(dados, indice):
+    linha = dados["pedido"].pop(indice)
+    _somar_total(dados, -linha["preco"] * linha["quantidade"])
+    if not dados["pedido"]:
+        dados["valor_total"] = 0.0
+    return linha
+
+
+def cancelar_pedido(dados):
+    dados["pedido"] = []
+    dados["valor_total"] = 0.0
+
+
+def resumo_pedido(dados):
+    """Resumo usado em "Ver meu pedido" e depois de alterar quantidades."""
+    linhas = "\n".join(f"- {linha['quantidade']}x {linha['item']}" for linha in dados["pedido"])
+    return f"*Seu pedido atual:*\n{linhas}\n\n*Valor Total: R$ {dados['valor_total']:.2f}*"
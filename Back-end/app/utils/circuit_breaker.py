@@ -0,0 +1,145 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+BREAKER_WINDOW_SECONDS = float(os.getenv("GEMINI_BREAKER_WINDOW", "60"))
+BREAKER_MIN_REQUESTS = int(os.getenv("GEMINI_BREAKER_MIN_REQUESTS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("GEMINI_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_P95_SECONDS = float(os.getenv("GEMINI_BREAKER_P95_SECONDS", "10"))
+BREAKER_OPEN_SECONDS = float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", "30"))
+
+FECHADO = "closed"
+ABERTO = "open"
+MEIO_ABERTO = "half_open"
+# Retorno de disponivel(reservar=True) quando quem chamou ficou com o teste de recuperação
+TESTE = "probe"
+
+
+def percentil(valores, p):
+    """Percentil simples (nearest-rank) de uma lista de números."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p / 100.0 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de um modelo, baseado na taxa de erro e na latência p95 dos últimos segundos.
+
+    - fechado: as requisições passam normalmente e os resultados entram na janela;
+    - aberto: a taxa de erro ou o p95 passou do limite, e o modelo fica fora do rodízio
+      por `tempo_aberto` segundos;
+    - meio aberto: passado esse tempo, uma requisição de teste é liberada. Se der certo o
+      circuito fecha, se falhar ele abre de novo. Se ela terminar sem resultado (cliente
+      desconectado, modelo não usado), `cancelar` libera o teste para a próxima requisição.
+    """
+
+    def __init__(self, nome, janela=BREAKER_WINDOW_SECONDS, minimo_requisicoes=BREAKER_MIN_REQUESTS,
+                 taxa_erro=BREAKER_ERROR_RATE, p95_maximo=BREAKER_P95_SECONDS, tempo_aberto=BREAKER_OPEN_SECONDS):
+        self.nome = nome
+        self.janela = janela
+        self.minimo_requisicoes = minimo_requisicoes
+        self.taxa_erro = taxa_erro
+        self.p95_maximo = p95_maximo
+        self.tempo_aberto = tempo_aberto
+        self._lock = threading.Lock()
+        self._resultados = deque(maxlen=500)  # (instante, sucesso, latencia)
+        self._estado = FECHADO
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+        self._aberturas = 0
+
+    def disponivel(self, reservar=False):
+        """
+        Indica se o modelo pode receber uma requisição agora.
+
+        Com `reservar=True`, um circuito que já pode ser testado passa a meio aberto com o teste reservado
+        na mesma operação (duas threads nunca ficam com o mesmo teste) e o retorno é TESTE; quem o recebe
+        precisa registrar o resultado da requisição ou devolver o teste com `cancelar`.
+        """
+        with self._lock:
+            if self._estado == FECHADO:
+                return True
+            if self._estado == ABERTO:
+                if time.monotonic() < self._aberto_ate:
+                    return False
+                if not reservar:
+                    return True
+                self._estado = MEIO_ABERTO
+                logging.info(f"Circuit breaker do modelo {self.nome} meio aberto: testando recuperação.")
+            elif self._teste_em_andamento:
+                return False
+            elif not reservar:
+                return True
+            self._teste_em_andamento = True
+            return TESTE
+
+    def cancelar(self):
+        """Devolve o teste reservado por disponivel(reservar=True) sem registrar resultado."""
+        with self._lock:
+            if self._estado == MEIO_ABERTO:
+                self._teste_em_andamento = False
+
+    def registrar_sucesso(self, latencia):
+        self._registrar(True, latencia)
+
+    def registrar_falha(self, latencia):
+        self._registrar(False, latencia)
+
+    def _registrar(self, sucesso, latencia):
+        with self._lock:
+            agora = time.monotonic()
+            if self._estado == MEIO_ABERTO:
+                self._teste_em_andamento = False
+                if sucesso and latencia <= self.p95_maximo:
+                    self._estado = FECHADO
+                    self._resultados.clear()
+                    logging.info(f"Circuit breaker do modelo {self.nome} fechado: modelo recuperado.")
+                else:
+                    self._abrir(agora, "teste de recuperação falhou")
+                return
+
+            self._resultados.append((agora, sucesso, latencia))
+            self._descartar_antigos(agora)
+            if self._estado != FECHADO or len(self._resultados) < self.minimo_requisicoes:
+                return
+            taxa, p95 = self._metricas()
+            if taxa >= self.taxa_erro:
+                self._abrir(agora, f"taxa de erro de {taxa:.0%}")
+            elif p95 >= self.p95_maximo:
+                self._abrir(agora, f"latência p95 de {p95:.1f}s")
+
+    def _abrir(self, agora, motivo):
+        self._estado = ABERTO
+        self._aberto_ate = agora + self.tempo_aberto
+        self._aberturas += 1
+        logging.warning(f"Circuit breaker do modelo {self.nome} aberto ({motivo}) por {self.tempo_aberto:.0f}s.")
+
+    def _descartar_antigos(self, agora):
+        while self._resultados and agora - self._resultados[0][0] > self.janela:
+            self._resultados.popleft()
+
+    def _metricas(self):
+        total = len(self._resultados)
+        if total == 0:
+            return 0.0, None
+        erros = sum(1 for _, sucesso, _ in self._resultados if not sucesso)
+        return erros / total, percentil([latencia for _, _, latencia in self._resultados], 95)
+
+    def estado(self):
+        with self._lock:
+            self._descartar_antigos(time.monotonic())
+            taxa, p95 = self._metricas()
+            return {
+                "state": self._estado,
+                "requests": len(self._resultados),
+                "error_rate": round(taxa, 3),
+                "p95_seconds": round(p95, 3) if p95 is not None else None,
+                "times_opened": self._aberturas,
+                "retry_in_seconds": round(max(0.0, self._aberto_ate - time.monotonic()), 1) if self._estado == ABERTO else 0,
+            }
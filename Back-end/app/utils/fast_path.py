@@ -0,0 +1,131 @@
+import logging
+import os
+import re
+import threading
+import unicodedata
+
+from .catalogo import formatar_preco
+
+# Respostas locais no modo inteligente (pode ser desligado pelo .env para comparação A/B)
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+
+MENSAGEM_AUDIO = "mensagem de audio recebida"
+
+_PALAVRAS_CARDAPIO = {"cardapio", "menu", "opcoes", "sabores", "produtos"}
+_FRASES_CARDAPIO = ("o que tem", "o que voces tem", "o que vende", "o que voces vendem")
+_PALAVRAS_PRECO = {"quanto", "preco", "precos", "valor", "valores", "custa", "custam"}
+# Mensagens com pedido, quantidade ou contexto a mais ficam com o Gemini
+_PALAVRAS_PEDIDO = {"quero", "queria", "quer", "manda", "mande", "pedir", "pedido", "vou", "adiciona", "coloca", "tira", "troca"}
+_MAXIMO_PALAVRAS = 8
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos e sem pontuação: 'Quanto custa a Pamonha?' -> 'quanto custa a pamonha'."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", texto).split())
+
+
+class RoteadorIntencoes:
+    """
+    Responde localmente, sem chamar o Gemini, perguntas previsíveis do modo inteligente:
+    pedido do cardápio, preço de itens e o aviso de mensagem de áudio.
+
+    Só mensagens curtas e sem números ou verbos de pedido são respondidas aqui; qualquer dúvida
+    fica com o Gemini. `itens` são os itens do catálogo (catalogo.itens), o mesmo usado pelo fluxo tradicional.
+    """
+
+    def __init__(self, itens, ativo=FAST_PATH_ENABLED):
+        self.ativo = ativo
+        self.cardapio = [(item.nome, item.preco) for item in itens]
+        self._lock = threading.Lock()
+        self._consultas = 0
+        self._acertos = {"cardapio": 0, "preco": 0, "audio": 0}
+
+        # Cada palavra dos nomes aponta para os itens que a contêm: "doce" -> Pamonha Doce,
+        # "pamonha" -> as três pamonhas
+        self._itens_por_palavra = {}
+        for nome, preco in self.cardapio:
+            for palavra in normalizar(nome).split():
+                self._itens_por_palavra.setdefault(palavra, []).append((nome, preco))
+
+    def responder(self, mensagem):
+        """Retorna (intenção, resposta) quando a mensagem pode ser respondida localmente, senão None."""
+        if not self.ativo:
+            return None
+        resultado = self._classificar(normalizar(mensagem))
+        with self._lock:
+            self._consultas += 1
+            if resultado is not None:
+                self._acertos[resultado[0]] += 1
+        if resultado is not None:
+            logging.info(f"Mensagem respondida localmente (intenção: {resultado[0]}), sem chamar o Gemini.")
+        return resultado
+
+    def menciona_pedido(self, mensagem):
+        """Indica se a mensagem traz contexto de pedido: números, verbos de pedido ou itens do cardápio."""
+        palavras = normalizar(mensagem).split()
+        if any(p.isdigit() for p in palavras) or set(palavras) & _PALAVRAS_PEDIDO:
+            return True
+        return bool(self._itens_mencionados(palavras))
+
+    def estatisticas(self):
+        with self._lock:
+            acertos = sum(self._acertos.values())
+            return {
+                "enabled": self.ativo,
+                "messages": self._consultas,
+                "hits": dict(self._acertos),
+                "saved_gemini_calls": acertos,
+                "hit_rate": round(acertos / self._consultas, 3) if self._consultas else 0.0,
+            }
+
+    # --- Métodos internos ---
+
+    def _classificar(self, texto):
+        if texto == MENSAGEM_AUDIO:
+            return "audio", "Desculpe, no momento não consigo ouvir áudios. Pode me mandar por mensagem de texto? 😊"
+
+        palavras = texto.split()
+        if not palavras or len(palavras) > _MAXIMO_PALAVRAS or any(p.isdigit() for p in palavras):
+            return None
+        conjunto = set(palavras)
+        if conjunto & _PALAVRAS_PEDIDO:
+            return None
+
+        if conjunto & _PALAVRAS_PRECO:
+            itens = self._itens_mencionados(palavras)
+            if itens:
+                return "preco", self._resposta_preco(itens)
+            if conjunto & {"precos", "valores"}:
+                return "cardapio", self._resposta_cardapio()
+            return None
+
+        if conjunto & _PALAVRAS_CARDAPIO or any(frase in texto for frase in _FRASES_CARDAPIO):
+            return "cardapio", self._resposta_cardapio()
+        return None
+
+    def _itens_mencionados(self, palavras):
+        # Palavras que identificam um único item ("doce", "curau") têm prioridade sobre as que
+        # identificam um grupo ("pamonha")
+        especificos, grupos = [], []
+        for palavra in palavras:
+            itens = self._itens_por_palavra.get(palavra)
+            if itens is None and palavra.endswith("s"):
+                itens = self._itens_por_palavra.get(palavra[:-1])
+            if itens is None:
+                continue
+            destino = especificos if len(itens) == 1 else grupos
+            destino.extend(item for item in itens if item not in destino)
+        return especificos or grupos
+
+    def _resposta_cardapio(self):
+        linhas = "\n".join(f"- {nome}: {formatar_preco(preco)}" for nome, preco in self.cardapio)
+        return f"Claro! Esse é o nosso cardápio 😊\n{linhas}\nO que você vai querer?"
+
+    def _resposta_preco(self, itens):
+        if len(itens) == 1:
+            nome, preco = itens[0]
+            return f"{nome} custa {formatar_preco(preco)}. Quantas unidades você vai querer?"
+        linhas = "\n".join(f"- {nome}: {formatar_preco(preco)}" for nome, preco in itens)
+        return f"Os preços são:\n{linhas}\nQual você vai querer?"
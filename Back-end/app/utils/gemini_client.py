@@ -0,0 +1,348 @@
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from .circuit_breaker import CircuitBreaker, TESTE
+from .gemini_quota import quota, MODELOS_GEMINI, GEMINI_QUOTA_MAX_WAIT
+from .metrics import duracao_gemini
+
+# Quantos níveis de modelo uma mensagem pode tentar antes de desistir
+GEMINI_FAILOVER_ATTEMPTS = int(os.getenv("GEMINI_FAILOVER_ATTEMPTS", "2"))
+# Segundos de espera antes de enviar uma requisição paralela ao próximo nível (0 desativa)
+GEMINI_HEDGE_DELAY = float(os.getenv("GEMINI_HEDGE_DELAY", "0"))
+GEMINI_HEDGE_WORKERS = int(os.getenv("GEMINI_HEDGE_WORKERS", "4"))
+# Cache de contexto do Gemini para a instrução de sistema (só vale a pena acima do tamanho mínimo aceito pela API)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# Segundos que um cache de contexto substituído ainda vale, para as requisições que já o usam terminarem
+_CARENCIA_CACHE_SUBSTITUIDO = 60
+
+ORDEM_MODELOS = [modelo for modelo, _, _ in MODELOS_GEMINI]
+breakers = {modelo: CircuitBreaker(modelo) for modelo in ORDEM_MODELOS}
+
+# SDK do Gemini, importado e configurado só quando é usado pela primeira vez (a importação leva quase 1 s)
+_genai = None
+_genai_lock = threading.Lock()
+
+_executor_hedge = concurrent.futures.ThreadPoolExecutor(max_workers=GEMINI_HEDGE_WORKERS, thread_name_prefix="gemini-hedge")
+
+# Um GenerativeModel por (modelo, instrução de sistema), compartilhado por todas as sessões:
+# chave -> (GenerativeModel, validade, CachedContent ou None). O lock só protege o dicionário; os
+# modelos são criados fora dele (a criação do cache de contexto é uma chamada à API)
+_modelos = {}
+_modelos_lock = threading.Lock()
+_renovando = set()
+
+_uso_lock = threading.Lock()
+# Os campos summary_* separam, dentro do total, as chamadas feitas para resumir o histórico
+_uso_total = {
+    modelo: {"requests": 0, "prompt_tokens": 0, "response_tokens": 0, "cached_tokens": 0,
+             "summary_requests": 0, "summary_prompt_tokens": 0, "summary_response_tokens": 0}
+    for modelo in ORDEM_MODELOS
+}
+
+
+class GeminiIndisponivel(Exception):
+    """Nenhum modelo pode atender agora: cota esgotada ou circuitos abertos em todos os níveis."""
+
+
+def modelo_ativo():
+    """Primeiro nível com circuito disponível e cota restante, sem consumir nada."""
+    restante = quota.restante()
+    for modelo in ORDEM_MODELOS:
+        if breakers[modelo].disponivel() and restante[modelo]["rpd_remaining"] > 0 and restante[modelo]["rpm_available"] >= 1:
+            return modelo
+    return None
+
+
+def escolher_modelo(excluir=(), espera_maxima=GEMINI_QUOTA_MAX_WAIT):
+    """
+    Reserva a cota do primeiro nível disponível que não esteja em `excluir`. Retorna None se não houver.
+
+    Os testes de recuperação (circuitos meio abertos) são reservados junto com a verificação, e os dos
+    níveis que não foram escolhidos são devolvidos logo em seguida.
+    """
+    candidatos, testes = [], []
+    for modelo in ORDEM_MODELOS:
+        if modelo in excluir:
+            continue
+        disponivel = breakers[modelo].disponivel(reservar=True)
+        if disponivel:
+            candidatos.append(modelo)
+            if disponivel == TESTE:
+                testes.append(modelo)
+    if not candidatos:
+        return None
+    escolhido = None
+    try:
+        escolhido = quota.adquirir(candidatos, espera_maxima)
+    finally:
+        for modelo in testes:
+            if modelo != escolhido:
+                breakers[modelo].cancelar()
+    return escolhido
+
+
+def _sdk():
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+
+                os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "credenciais_google.json")
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                _genai = genai
+    return _genai
+
+
+def _criar_modelo(modelo, instrucao):
+    """
+    Cria o GenerativeModel de um nível. Retorna (modelo, validade, cache de contexto), com validade None
+    quando não expira e cache None sem o cache de contexto.
+    """
+    genai = _sdk()
+    if instrucao and GEMINI_CONTEXT_CACHE:
+        try:
+            cache = genai.caching.CachedContent.create(
+                model=f"models/{modelo}",
+                system_instruction=instrucao,
+                ttl=timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL),
+            )
+            logging.info(f"Instrução de sistema armazenada no cache de contexto do modelo {modelo}.")
+            # Renova um pouco antes de o cache expirar no servidor
+            return (
+                genai.GenerativeModel.from_cached_content(cache), time.monotonic() + GEMINI_CONTEXT_CACHE_TTL * 0.9, cache
+            )
+        except Exception as e:
+            logging.warning(f"Cache de contexto indisponível para {modelo} ({e}). Usando system_instruction.")
+    if instrucao:
+        return genai.GenerativeModel(modelo, system_instruction=instrucao), None, None
+    return genai.GenerativeModel(modelo), None, None
+
+
+def _valido(entrada):
+    return entrada is not None and (entrada[1] is None or time.monotonic() < entrada[1])
+
+
+def _obter_modelo(modelo, instrucao):
+    chave = (modelo, instrucao)
+    with _modelos_lock:
+        existente = _modelos.get(chave)
+        if _valido(existente):
+            return existente[0]
+        if existente is not None and chave in _renovando:
+            # Outra thread já está renovando; o cache atual ainda vale no servidor até o fim do TTL
+            return existente[0]
+        _renovando.add(chave)
+    try:
+        novo = _criar_modelo(modelo, instrucao)
+    except BaseException:
+        with _modelos_lock:
+            _renovando.discard(chave)
+        raise
+    with _modelos_lock:
+        _renovando.discard(chave)
+        atual = _modelos.get(chave)
+        if atual is not existente and _valido(atual):
+            # Outra thread publicou um modelo enquanto este era criado (primeiro uso simultâneo)
+            usado, descartado, imediato = atual, novo, True
+        else:
+            _modelos[chave] = novo
+            usado, descartado, imediato = novo, existente, False
+    if descartado is not None and descartado[2] is not None:
+        _descartar_cache(modelo, descartado[2], imediato)
+    return usado[0]
+
+
+def _descartar_cache(modelo, cache, imediato):
+    """Apaga um cache de contexto que não foi usado, ou encurta a validade de um que foi substituído."""
+    try:
+        if imediato:
+            cache.delete()
+        else:
+            cache.update(ttl=timedelta(seconds=_CARENCIA_CACHE_SUBSTITUIDO))
+    except Exception as e:
+        logging.warning(f"Não foi possível descartar o cache de contexto antigo do modelo {modelo}: {e}")
+
+
+def _extrair_uso(resposta):
+    metadados = getattr(resposta, "usage_metadata", None)
+    if metadados is None:
+        return None
+    return {
+        "prompt_tokens": getattr(metadados, "prompt_token_count", 0) or 0,
+        "response_tokens": getattr(metadados, "candidates_token_count", 0) or 0,
+        "cached_tokens": getattr(metadados, "cached_content_token_count", 0) or 0,
+        "total_tokens": getattr(metadados, "total_token_count", 0) or 0,
+    }
+
+
+def _contabilizar(modelo, uso, destino, resumo=False):
+    if uso is None:
+        return
+    with _uso_lock:
+        total = _uso_total[modelo]
+        total["requests"] += 1
+        for campo in ("prompt_tokens", "response_tokens", "cached_tokens"):
+            total[campo] += uso[campo]
+        if resumo:
+            total["summary_requests"] += 1
+            total["summary_prompt_tokens"] += uso["prompt_tokens"]
+            total["summary_response_tokens"] += uso["response_tokens"]
+    if destino is not None:
+        destino.update(uso)
+
+
+def _registrar_latencia(modelo, duracao, sucesso):
+    if sucesso:
+        breakers[modelo].registrar_sucesso(duracao)
+    else:
+        breakers[modelo].registrar_falha(duracao)
+    duracao_gemini.observar(duracao, modelo, "ok" if sucesso else "error")
+
+
+def _chamar(modelo, historico, mensagem, instrucao):
+    inicio = time.monotonic()
+    try:
+        chat = _obter_modelo(modelo, instrucao).start_chat(history=historico)
+        resposta = chat.send_message(mensagem)
+        texto = resposta.text
+    except Exception:
+        _registrar_latencia(modelo, time.monotonic() - inicio, False)
+        raise
+    _registrar_latencia(modelo, time.monotonic() - inicio, True)
+    return modelo, texto, _extrair_uso(resposta)
+
+
+def _chamar_com_hedge(modelo, historico, mensagem, instrucao, tentados):
+    principal = _executor_hedge.submit(_chamar, modelo, historico, mensagem, instrucao)
+    try:
+        return principal.result(timeout=GEMINI_HEDGE_DELAY)
+    except concurrent.futures.TimeoutError:
+        pass
+
+    # A resposta está demorando: dispara a mesma mensagem no próximo nível e fica com a que chegar primeiro
+    modelo_hedge = escolher_modelo(excluir=tentados, espera_maxima=0)
+    if modelo_hedge is None:
+        return principal.result()
+    tentados.append(modelo_hedge)
+    logging.info(f"Modelo {modelo} demorou mais de {GEMINI_HEDGE_DELAY}s. Requisição paralela enviada para {modelo_hedge}.")
+    pendentes = {principal, _executor_hedge.submit(_chamar, modelo_hedge, historico, mensagem, instrucao)}
+    erro = None
+    while pendentes:
+        concluidas, pendentes = concurrent.futures.wait(pendentes, return_when=concurrent.futures.FIRST_COMPLETED)
+        for futuro in concluidas:
+            if futuro.exception() is None:
+                return futuro.result()
+            erro = futuro.exception()
+    raise erro
+
+
+def enviar(historico, mensagem, instrucao=None, uso=None, resumo=False):
+    """
+    Envia `mensagem` continuando a conversa `historico` e retorna (modelo, texto).
+
+    Usa o primeiro nível com cota e circuito fechado; se a chamada falhar, registra a falha no
+    circuit breaker do modelo e tenta o próximo nível (até GEMINI_FAILOVER_ATTEMPTS níveis).
+    `instrucao` é a instrução de sistema do modelo; se `uso` for um dicionário, recebe a contagem
+    de tokens da requisição (prompt_tokens, response_tokens, cached_tokens, total_tokens).
+    `resumo` marca as chamadas que resumem o histórico, contadas à parte no total de tokens.
+    """
+    tentados = []
+    ultimo_erro = None
+    for _ in range(GEMINI_FAILOVER_ATTEMPTS):
+        modelo = escolher_modelo(excluir=tentados)
+        if modelo is None:
+            break
+        tentados.append(modelo)
+        try:
+            if GEMINI_HEDGE_DELAY > 0:
+                modelo_usado, texto, uso_requisicao = _chamar_com_hedge(modelo, historico, mensagem, instrucao, tentados)
+            else:
+                modelo_usado, texto, uso_requisicao = _chamar(modelo, historico, mensagem, instrucao)
+            _contabilizar(modelo_usado, uso_requisicao, uso, resumo)
+            return modelo_usado, texto
+        except Exception as e:
+            ultimo_erro = e
+            logging.warning(f"Falha no modelo {modelo}: {e}. Tentando o próximo nível.")
+    if ultimo_erro is not None:
+        raise ultimo_erro
+    raise GeminiIndisponivel("Nenhum modelo do Gemini disponível (cota esgotada ou circuitos abertos).")
+
+
+def enviar_stream(historico, mensagem, instrucao=None, uso=None):
+    """
+    Versão em streaming de `enviar`: gera tuplas (modelo, trecho) à medida que o Gemini responde.
+
+    O failover para o próximo nível só acontece se o erro vier antes do primeiro trecho; depois disso
+    parte da resposta já foi entregue ao usuário e o erro é repassado. Não há requisição paralela (hedge).
+    """
+    tentados = []
+    ultimo_erro = None
+    for _ in range(GEMINI_FAILOVER_ATTEMPTS):
+        modelo = escolher_modelo(excluir=tentados)
+        if modelo is None:
+            break
+        tentados.append(modelo)
+        inicio = time.monotonic()
+        entregou = False
+        concluido = False
+        try:
+            chat = _obter_modelo(modelo, instrucao).start_chat(history=historico)
+            resposta = chat.send_message(mensagem, stream=True)
+            for parte in resposta:
+                trecho = parte.text
+                if trecho:
+                    entregou = True
+                    yield modelo, trecho
+            concluido = True
+        except Exception as e:
+            concluido = True
+            _registrar_latencia(modelo, time.monotonic() - inicio, False)
+            if entregou:
+                raise
+            ultimo_erro = e
+            logging.warning(f"Falha no modelo {modelo}: {e}. Tentando o próximo nível.")
+            continue
+        finally:
+            if not concluido:
+                # O consumidor fechou o stream no meio (cliente desconectado): não é uma falha do modelo,
+                # mas um teste de recuperação em andamento precisa ser liberado
+                breakers[modelo].cancelar()
+        _registrar_latencia(modelo, time.monotonic() - inicio, True)
+        _contabilizar(modelo, _extrair_uso(resposta), uso)
+        return
+    if ultimo_erro is not None:
+        raise ultimo_erro
+    raise GeminiIndisponivel("Nenhum modelo do Gemini disponível (cota esgotada ou circuitos abertos).")
+
+
+def aquecer(instrucao=None, modelos=None):
+    """
+    Importa o SDK e cria antes do primeiro uso os GenerativeModel de `modelos` (padrão: o nível ativo).
+    Não faz chamadas à API. Retorna os segundos gastos.
+    """
+    inicio = time.monotonic()
+    for modelo in modelos or [modelo_ativo() or ORDEM_MODELOS[0]]:
+        _obter_modelo(modelo, instrucao)
+    return time.monotonic() - inicio
+
+
+def estado():
+    """Situação de cada nível (circuit breaker, cota e tokens consumidos), usada pelo endpoint de status."""
+    restante = quota.restante()
+    with _uso_lock:
+        uso_total = {modelo: dict(valores) for modelo, valores in _uso_total.items()}
+    return {
+        "active_model": modelo_ativo(),
+        "hedge_delay_seconds": GEMINI_HEDGE_DELAY,
+        "context_cache": GEMINI_CONTEXT_CACHE,
+        "models": [
+            {"model": modelo, "breaker": breakers[modelo].estado(), "quota": restante[modelo], "tokens": uso_total[modelo]}
+            for modelo in ORDEM_MODELOS
+        ],
+    }
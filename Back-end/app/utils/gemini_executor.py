@@ -0,0 +1,145 @@
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+
+# Executor das chamadas ao Gemini
+GEMINI_MAX_CONCURRENT = int(os.getenv("GEMINI_MAX_CONCURRENT", "4"))
+# Requisições que podem esperar por uma vaga; acima disso a mensagem é recusada na hora (HTTP 429)
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "4"))
+# Tempo máximo de uma chamada (no streaming, tempo máximo entre dois trechos)
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+# Valor do cabeçalho Retry-After das respostas 429
+GEMINI_RETRY_AFTER_SECONDS = int(os.getenv("GEMINI_RETRY_AFTER_SECONDS", "5"))
+
+_FIM = object()
+
+
+class GeminiSobrecarregado(Exception):
+    """Todas as vagas do executor e da fila estão ocupadas: a mensagem deve ser reenviada mais tarde."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Executor do Gemini cheio. Tente novamente em {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class GeminiTempoEsgotado(Exception):
+    """O Gemini não respondeu dentro de GEMINI_TIMEOUT_SECONDS."""
+
+
+class ExecutorGemini:
+    """
+    Pool de threads exclusivo para as chamadas ao Gemini, com limite de chamadas simultâneas e de fila.
+
+    As threads do servidor (waitress) são poucas e são as mesmas que atendem o fluxo tradicional. Com o
+    limite, no máximo `max_simultaneas + max_fila` delas ficam esperando o Gemini; as próximas mensagens
+    do modo inteligente são recusadas com GeminiSobrecarregado em vez de ocupar mais threads, e o fluxo
+    tradicional continua com threads livres. Uma chamada que passa do tempo limite é abandonada pela
+    requisição, mas continua ocupando a vaga até terminar de fato.
+    """
+
+    def __init__(self, max_simultaneas=GEMINI_MAX_CONCURRENT, max_fila=GEMINI_MAX_QUEUE,
+                 timeout=GEMINI_TIMEOUT_SECONDS, retry_after=GEMINI_RETRY_AFTER_SECONDS):
+        self.max_simultaneas = max_simultaneas
+        self.max_fila = max_fila
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_simultaneas, thread_name_prefix="gemini")
+        self._lock = threading.Lock()
+        self._admitidas = 0  # em execução + na fila
+        self._contadores = {"submitted": 0, "rejected": 0, "timeouts": 0, "completed": 0, "max_admitted": 0}
+
+    def _admitir(self):
+        with self._lock:
+            if self._admitidas >= self.max_simultaneas + self.max_fila:
+                self._contadores["rejected"] += 1
+                raise GeminiSobrecarregado(self.retry_after)
+            self._admitidas += 1
+            self._contadores["submitted"] += 1
+            self._contadores["max_admitted"] = max(self._contadores["max_admitted"], self._admitidas)
+
+    def _liberar(self, _futuro=None):
+        with self._lock:
+            self._admitidas -= 1
+            self._contadores["completed"] += 1
+
+    def _submeter(self, funcao, *args):
+        self._admitir()
+        try:
+            futuro = self._executor.submit(funcao, *args)
+        except Exception:
+            self._liberar()
+            raise
+        futuro.add_done_callback(self._liberar)
+        return futuro
+
+    def _tempo_esgotado(self):
+        with self._lock:
+            self._contadores["timeouts"] += 1
+        logging.warning(f"O Gemini não respondeu em {self.timeout:.0f}s. Requisição abandonada.")
+        return GeminiTempoEsgotado(f"Sem resposta do Gemini em {self.timeout:.0f}s.")
+
+    def executar(self, funcao, *args):
+        """Executa `funcao(*args)` no pool e retorna o resultado, esperando no máximo `timeout` segundos."""
+        futuro = self._submeter(funcao, *args)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise self._tempo_esgotado() from None
+
+    def executar_stream(self, gerador, *args):
+        """
+        Consome `gerador(*args)` no pool e retorna um iterador com os mesmos itens.
+
+        A vaga é reservada já na chamada (GeminiSobrecarregado sai daqui, antes do primeiro item).
+        Fechar o iterador antes do fim avisa o pool para parar de consumir o gerador.
+        """
+        fila = queue.Queue()
+        cancelado = threading.Event()
+
+        def produzir():
+            itens = gerador(*args)
+            try:
+                for item in itens:
+                    if cancelado.is_set():
+                        return
+                    fila.put((True, item))
+            except Exception as e:
+                fila.put((False, e))
+                return
+            finally:
+                itens.close()
+            fila.put((True, _FIM))
+
+        self._submeter(produzir)
+        return self._consumir(fila, cancelado)
+
+    def _consumir(self, fila, cancelado):
+        try:
+            while True:
+                try:
+                    ok, item = fila.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise self._tempo_esgotado() from None
+                if not ok:
+                    raise item
+                if item is _FIM:
+                    return
+                yield item
+        finally:
+            cancelado.set()
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados["admitted"] = self._admitidas
+        dados["in_flight"] = min(dados["admitted"], self.max_simultaneas)
+        dados["queued"] = dados["admitted"] - dados["in_flight"]
+        dados["max_concurrent"] = self.max_simultaneas
+        dados["max_queue"] = self.max_fila
+        dados["timeout_seconds"] = self.timeout
+        return dados
+
+
+executor_gemini = ExecutorGemini()
@@ -0,0 +1,67 @@
+import logging
+import os
+
+# Política de histórico enviado ao Gemini
+# Número máximo de trocas (mensagem do cliente + resposta) mantidas na íntegra
+GEMINI_HISTORY_MAX_TURNS = int(os.getenv("GEMINI_HISTORY_MAX_TURNS", "10"))
+# Limite estimado de tokens do histórico enviado a cada requisição
+GEMINI_HISTORY_MAX_TOKENS = int(os.getenv("GEMINI_HISTORY_MAX_TOKENS", "2000"))
+# Trocas mantidas na íntegra depois de um resumo (o restante entra no resumo)
+GEMINI_HISTORY_KEEP_TURNS = int(os.getenv("GEMINI_HISTORY_KEEP_TURNS", "5"))
+
+PROMPT_RESUMO = (
+    "Resuma em até 120 palavras a conversa abaixo entre um cliente e a atendente Sara de uma pamonharia. "
+    "Mantenha o nome do cliente, os itens e quantidades do pedido, o que já foi confirmado e dúvidas em aberto. "
+    "Responda apenas com o resumo.\n\n"
+    "Resumo anterior: {resumo}\n\n"
+    "Conversa:\n{conversa}"
+)
+
+
+def estimar_tokens(historico):
+    """Estimativa simples (4 caracteres por token), suficiente para decidir quando resumir."""
+    return sum(len(parte) for mensagem in historico for parte in mensagem["parts"]) // 4
+
+
+def historico_para_envio(sessao):
+    """Histórico enviado ao Gemini: o resumo das mensagens antigas (se houver) seguido da janela recente."""
+    resumo = sessao.get("gemini_resumo")
+    if not resumo:
+        return sessao["gemini_historico"]
+    return [
+        {"role": "user", "parts": [f"Resumo da conversa até aqui: {resumo}"]},
+        {"role": "model", "parts": ["Certo, vou continuar o atendimento a partir daí."]},
+    ] + sessao["gemini_historico"]
+
+
+def limitar_historico(sessao, resumir):
+    """
+    Mantém o histórico da sessão dentro de GEMINI_HISTORY_MAX_TURNS trocas e GEMINI_HISTORY_MAX_TOKENS.
+
+    Quando um dos limites é ultrapassado, as trocas mais antigas (deixando as últimas
+    GEMINI_HISTORY_KEEP_TURNS) são condensadas no resumo da sessão por `resumir(prompt)`. Resumir de uma vez
+    várias trocas faz com que a chamada extra aconteça só de tempos em tempos. Se o resumo falhar, o
+    histórico fica como está e a próxima mensagem tenta de novo.
+    """
+    historico = sessao["gemini_historico"]
+    if len(historico) <= GEMINI_HISTORY_MAX_TURNS * 2 and estimar_tokens(historico) <= GEMINI_HISTORY_MAX_TOKENS:
+        return
+
+    manter = min(GEMINI_HISTORY_KEEP_TURNS, GEMINI_HISTORY_MAX_TURNS) * 2
+    while manter > 2 and estimar_tokens(historico[-manter:]) > GEMINI_HISTORY_MAX_TOKENS:
+        manter -= 2
+    antigas, recentes = historico[:-manter], historico[-manter:]
+    if not antigas:
+        return
+
+    conversa = "\n".join(
+        f"{'Cliente' if mensagem['role'] == 'user' else 'Sara'}: {' '.join(mensagem['parts'])}" for mensagem in antigas
+    )
+    try:
+        resumo = resumir(PROMPT_RESUMO.format(resumo=sessao.get("gemini_resumo") or "nenhum", conversa=conversa))
+    except Exception as e:
+        logging.warning(f"Não foi possível resumir o histórico do Gemini: {e}")
+        return
+    sessao["gemini_resumo"] = resumo.strip()
+    sessao["gemini_historico"] = recentes
+    logging.info(f"Histórico do Gemini resumido: {len(antigas)} mensagens condensadas, {len(recentes)} mantidas.")
@@ -0,0 +1,152 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from ..config import INSTANCE_DIR
+
+# Níveis de modelo em ordem de preferência, com os limites do plano gratuito:
+# (modelo, requisições por minuto, requisições por dia)
+MODELOS_GEMINI = [
+    ("gemini-2.0-flash-lite", 30, 1500),
+    ("gemini-2.0-flash", 15, 1000),
+    ("gemini-1.5-flash", 15, 500),
+]
+
+GEMINI_QUOTA_DB = os.getenv("GEMINI_QUOTA_DB", os.path.join(INSTANCE_DIR, "gemini_quota.db"))
+# Tempo máximo (em segundos) que uma requisição espera por uma vaga no limite por minuto
+GEMINI_QUOTA_MAX_WAIT = float(os.getenv("GEMINI_QUOTA_MAX_WAIT", "2"))
+
+
+class GeminiQuota:
+    """
+    Limitador de requisições do Gemini por nível de modelo.
+
+    O limite por minuto é um token bucket (capacidade = RPM, reposição contínua) e o limite diário
+    é um contador zerado na virada do dia. Os contadores ficam em um banco SQLite, então sobrevivem
+    a reinícios e são compartilhados entre workers; cada consumo roda em uma transação
+    `BEGIN IMMEDIATE`, que serializa threads e processos sem perder incrementos.
+    """
+
+    def __init__(self, caminho=GEMINI_QUOTA_DB, modelos=MODELOS_GEMINI):
+        self.caminho = caminho
+        self.modelos = list(modelos)
+        self._limites = {modelo: (rpm, rpd) for modelo, rpm, rpd in self.modelos}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._esquema_criado = False
+
+    def _conexao(self):
+        # O banco (e a pasta dele) só é aberto na primeira consulta à cota, não ao importar o módulo
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            with self._lock:
+                if not self._esquema_criado:
+                    conexao.execute("""
+                        CREATE TABLE IF NOT EXISTS cota (
+                            modelo TEXT PRIMARY KEY,
+                            dia TEXT NOT NULL,
+                            usadas_dia INTEGER NOT NULL,
+                            tokens REAL NOT NULL,
+                            atualizado_em REAL NOT NULL
+                        )
+                    """)
+                    self._esquema_criado = True
+            self._local.conexao = conexao
+        return conexao
+
+    def _estado(self, conexao, modelo, agora, hoje):
+        """Lê o estado de um modelo já com os tokens repostos e o contador diário zerado se o dia mudou."""
+        rpm, _ = self._limites[modelo]
+        linha = conexao.execute(
+            "SELECT dia, usadas_dia, tokens, atualizado_em FROM cota WHERE modelo = ?", (modelo,)
+        ).fetchone()
+        if linha is None:
+            return 0, float(rpm)
+        dia, usadas_dia, tokens, atualizado_em = linha
+        if dia != hoje:
+            usadas_dia = 0
+        tokens = min(float(rpm), tokens + max(0.0, agora - atualizado_em) * rpm / 60.0)
+        return usadas_dia, tokens
+
+    def _tentar(self, modelos):
+        """Consome uma requisição do primeiro modelo com cota. Retorna (modelo, espera_minima)."""
+        conexao = self._conexao()
+        agora = time.time()
+        hoje = date.today().isoformat()
+        espera_minima = None
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            for modelo in modelos:
+                rpm, rpd = self._limites[modelo]
+                usadas_dia, tokens = self._estado(conexao, modelo, agora, hoje)
+                if usadas_dia >= rpd:
+                    continue
+                if tokens < 1:
+                    espera = (1 - tokens) * 60.0 / rpm
+                    espera_minima = espera if espera_minima is None else min(espera_minima, espera)
+                    continue
+                conexao.execute(
+                    "INSERT INTO cota (modelo, dia, usadas_dia, tokens, atualizado_em) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (modelo) DO UPDATE SET dia = excluded.dia, usadas_dia = excluded.usadas_dia, "
+                    "tokens = excluded.tokens, atualizado_em = excluded.atualizado_em",
+                    (modelo, hoje, usadas_dia + 1, tokens - 1, agora),
+                )
+                conexao.execute("COMMIT")
+                return modelo, None
+            conexao.execute("COMMIT")
+        except Exception:
+            conexao.execute("ROLLBACK")
+            raise
+        return None, espera_minima
+
+    def adquirir(self, modelos=None, espera_maxima=GEMINI_QUOTA_MAX_WAIT):
+        """
+        Reserva uma requisição no primeiro modelo (em ordem de preferência) que ainda tenha cota
+        por minuto e por dia, e retorna o nome dele. Se só faltar cota por minuto, espera até
+        `espera_maxima` segundos por uma vaga. Retorna None se nenhum modelo estiver disponível.
+        """
+        modelos = modelos or [modelo for modelo, _, _ in self.modelos]
+        limite = time.monotonic() + espera_maxima
+        while True:
+            modelo, espera = self._tentar(modelos)
+            if modelo is not None:
+                if modelo != modelos[0]:
+                    logging.warning(f"Cota do modelo {modelos[0]} indisponível. Usando {modelo}.")
+                return modelo
+            if espera is None or time.monotonic() + espera > limite:
+                logging.warning("Cota do Gemini esgotada em todos os modelos disponíveis.")
+                return None
+            time.sleep(espera)
+
+    def restante(self):
+        """Cota restante de cada modelo: requisições disponíveis neste minuto e no dia."""
+        conexao = self._conexao()
+        agora = time.time()
+        hoje = date.today().isoformat()
+        resultado = {}
+        for modelo, rpm, rpd in self.modelos:
+            usadas_dia, tokens = self._estado(conexao, modelo, agora, hoje)
+            resultado[modelo] = {
+                "rpm_limit": rpm,
+                "rpd_limit": rpd,
+                "rpm_available": int(tokens),
+                "rpd_used": usadas_dia,
+                "rpd_remaining": max(0, rpd - usadas_dia),
+            }
+        return resultado
+
+    def modelo_disponivel(self):
+        """Primeiro modelo com cota por minuto e por dia, sem consumir nada. Retorna None se não houver."""
+        for modelo, dados in self.restante().items():
+            if dados["rpd_remaining"] > 0 and dados["rpm_available"] >= 1:
+                return modelo
+        return None
+
+
+quota = GeminiQuota()
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Tabela de mensagens já recebidas
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "300"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# Quanto tempo uma repetição espera a mensagem original terminar
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+
+
+class _Entrada:
+    __slots__ = ("concluida", "resposta", "criada_em")
+
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resposta = None
+        self.criada_em = time.monotonic()
+
+
+class TabelaIdempotencia:
+    """
+    Respostas recentes por (session_id, messageId), para que um reenvio da mesma mensagem não seja
+    processado de novo.
+
+    A primeira requisição de uma chave recebe `nova=True` e deve chamar `concluir` (com a resposta) ou
+    `descartar` (em caso de erro, para que um reenvio possa tentar de novo). Repetições recebem a mesma
+    entrada e usam `aguardar`, que espera a original terminar se ela ainda estiver em andamento.
+    A tabela é limitada em tamanho (as mais antigas saem primeiro) e as entradas expiram depois de `ttl` segundos;
+    as que ainda estão em andamento só saem depois de `concluir` ou `descartar`, para que um reenvio
+    continue esperando a original em vez de processar a mensagem de novo.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL_SECONDS, max_entradas=IDEMPOTENCY_MAX_ENTRIES, espera=IDEMPOTENCY_WAIT_SECONDS):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.espera = espera
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {
+            "requests": 0,
+            "hits": 0,
+            "hits_in_flight": 0,
+            "wait_timeouts": 0,
+            "evictions": 0,
+        }
+
+    def iniciar(self, session_id, message_id):
+        """Retorna (entrada, nova)."""
+        chave = (session_id, message_id)
+        agora = time.monotonic()
+        with self._lock:
+            self._contadores["requests"] += 1
+            self._expirar(agora)
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._contadores["hits"] += 1
+                if not entrada.concluida.is_set():
+                    self._contadores["hits_in_flight"] += 1
+                return entrada, False
+            entrada = _Entrada()
+            self._entradas[chave] = entrada
+            self._remover_excedentes()
+            return entrada, True
+
+    def concluir(self, entrada, resposta):
+        entrada.resposta = resposta
+        entrada.concluida.set()
+
+    def descartar(self, session_id, message_id, entrada):
+        with self._lock:
+            if self._entradas.get((session_id, message_id)) is entrada:
+                del self._entradas[(session_id, message_id)]
+        # Quem estava esperando recebe None e trata como falha da original
+        entrada.concluida.set()
+
+    def aguardar(self, entrada):
+        """Resposta da requisição original, ou None se ela falhou ou não terminou a tempo."""
+        if not entrada.concluida.wait(self.espera):
+            with self._lock:
+                self._contadores["wait_timeouts"] += 1
+            return None
+        return entrada.resposta
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados["entries"] = len(self._entradas)
+        dados["hit_rate"] = round(dados["hits"] / dados["requests"], 3) if dados["requests"] else 0.0
+        dados["ttl_seconds"] = self.ttl
+        dados["max_entries"] = self.max_entradas
+        return dados
+
+    def _expirar(self, agora):
+        # As entradas estão em ordem de criação, então as expiradas ficam no começo
+        expiradas = []
+        for chave, entrada in self._entradas.items():
+            if agora - entrada.criada_em <= self.ttl:
+                break
+            if entrada.concluida.is_set():
+                expiradas.append(chave)
+        for chave in expiradas:
+            del self._entradas[chave]
+
+    def _remover_excedentes(self):
+        excedente = len(self._entradas) - self.max_entradas
+        if excedente <= 0:
+            return
+        # As mais antigas que já terminaram (se todas estiverem em andamento, o limite fica excedido
+        # até a próxima mensagem)
+        escolhidas = []
+        for chave, entrada in self._entradas.items():
+            if entrada.concluida.is_set():
+                escolhidas.append(chave)
+                if len(escolhidas) == excedente:
+                    break
+        for chave in escolhidas:
+            del self._entradas[chave]
+        self._contadores["evictions"] += len(escolhidas)
+
+
+tabela_idempotencia = TabelaIdempotencia()
@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import time
+
+# Desligamento do servidor
+# Tempo máximo (s) esperando as mensagens em andamento terminarem depois do SIGTERM
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+# Valor do Retry-After (s) das mensagens recusadas durante o desligamento
+SHUTDOWN_RETRY_AFTER = int(os.getenv("SHUTDOWN_RETRY_AFTER", "5"))
+# Gravação das conversas abertas no desligamento: "auto" (só quando as sessões não sobrevivem ao reinício,
+# ou seja, em memória sem diário), "1" (sempre) ou "0" (nunca)
+SHUTDOWN_FLUSH_SESSIONS = os.getenv("SHUTDOWN_FLUSH_SESSIONS", "auto")
+
+AQUECIMENTO_DESLIGADO = "disabled"
+AQUECIMENTO_PENDENTE = "pending"
+AQUECIMENTO_OK = "ok"
+AQUECIMENTO_FALHOU = "failed"
+
+
+class CicloDeVida:
+    """
+    Estado do processo usado pelos endpoints /healthz e /readyz e pelo desligamento gracioso.
+
+    As mensagens do chat são contadas do início ao fim (em streaming, até o último trecho). Depois de
+    `drenar`, novas mensagens são recusadas e o /readyz passa a responder 503, para o balanceador tirar
+    o processo da rotação enquanto as mensagens em andamento terminam.
+    """
+
+    def __init__(self):
+        self._condicao = threading.Condition()
+        self._em_andamento = 0
+        self._recusadas = 0
+        self.encerrando = False
+        self.aquecimento = AQUECIMENTO_DESLIGADO
+        self.iniciado_em = time.time()
+
+    def iniciar_requisicao(self):
+        """Registra uma mensagem em andamento. Retorna False se o servidor está encerrando (a mensagem deve ser recusada)."""
+        with self._condicao:
+            if self.encerrando:
+                self._recusadas += 1
+                return False
+            self._em_andamento += 1
+            return True
+
+    def finalizar_requisicao(self):
+        with self._condicao:
+            self._em_andamento -= 1
+            if self._em_andamento == 0:
+                self._condicao.notify_all()
+
+    def drenar(self, timeout=SHUTDOWN_DRAIN_TIMEOUT):
+        """Para de aceitar mensagens e espera as em andamento terminarem. Retorna quantas ainda restavam no fim do prazo."""
+        with self._condicao:
+            self.encerrando = True
+            self._condicao.wait_for(lambda: self._em_andamento == 0, timeout)
+            return self._em_andamento
+
+    def aquecer(self, funcao):
+        """Executa o aquecimento do Gemini; o /readyz só fica pronto quando ele termina com sucesso."""
+        self.aquecimento = AQUECIMENTO_PENDENTE
+        try:
+            segundos = funcao()
+        except Exception as e:
+            self.aquecimento = AQUECIMENTO_FALHOU
+            logging.error(f"Não foi possível aquecer o Gemini: {e}")
+            return
+        self.aquecimento = AQUECIMENTO_OK
+        logging.info(f"Gemini aquecido em {segundos:.2f}s")
+
+    def prontidao(self, log_writer_saudavel):
+        """Retorna (pronto, verificações) para o /readyz."""
+        verificacoes = {
+            "gemini_warmup": self.aquecimento,
+            "log_writer": "ok" if log_writer_saudavel else "failed",
+            "draining": self.encerrando,
+        }
+        pronto = (
+            not self.encerrando
+            and log_writer_saudavel
+            and self.aquecimento in (AQUECIMENTO_OK, AQUECIMENTO_DESLIGADO)
+        )
+        return pronto, verificacoes
+
+    def estatisticas(self):
+        with self._condicao:
+            return {
+                "in_flight": self._em_andamento,
+                "rejected_while_draining": self._recusadas,
+                "draining": self.encerrando,
+                "gemini_warmup": self.aquecimento,
+                "uptime_seconds": round(time.time() - self.iniciado_em, 1),
+            }
+
+
+def gravar_sessoes_no_desligamento(persistente):
+    """Decide, por SHUTDOWN_FLUSH_SESSIONS, se as conversas abertas são gravadas em logs/ ao desligar."""
+    if SHUTDOWN_FLUSH_SESSIONS == "auto":
+        return not persistente
+    return SHUTDOWN_FLUSH_SESSIONS == "1"
+
+
+ciclo_de_vida = CicloDeVida()
@@ -0,0 +1,177 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from ..config import PROJECT_ROOT
+
+# Índices lidos pelo visualizador de logs (logs.js) e pela análise de dados (analise_dados.py)
+INDICE_CONVERSAS = "log-list"
+INDICE_QUESTIONARIOS = "questionario-list"
+
+LOGS_DIR = os.path.join(PROJECT_ROOT, "logs")
+
+# Intervalo mínimo (em segundos) entre duas compactações automáticas do mesmo índice
+LOG_INDEX_COMPACT_INTERVAL = int(os.getenv("LOG_INDEX_COMPACT_INTERVAL", "60"))
+# Uma trava de compactação mais velha que isso é considerada abandonada (processo que caiu no meio)
+_TRAVA_EXPIRADA_SEGUNDOS = 120
+
+_DATA_ARQUIVO = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.txt$")
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+_lock = threading.Lock()
+_ultima_compactacao = {}
+# (indice, diretorio) com entradas registradas depois da última compactação feita por este processo
+_pendentes = set()
+
+
+def _caminhos(nome_indice, diretorio):
+    base = os.path.join(diretorio, nome_indice)
+    return base + ".json", base + ".jsonl", base + ".lock"
+
+
+def registrar(nome_indice, nome_arquivo, diretorio=LOGS_DIR):
+    """
+    Acrescenta um arquivo ao índice em O(1): uma única linha JSON no fim do `<indice>.jsonl`.
+
+    A escrita usa O_APPEND em uma única chamada, então linhas de threads ou processos diferentes
+    nunca se misturam. A lista ordenada `<indice>.json` é gerada depois por `compactar`.
+    """
+    registrar_lote(nome_indice, [nome_arquivo], diretorio)
+
+
+def registrar_lote(nome_indice, nomes_arquivos, diretorio=LOGS_DIR):
+    """Mesmo que `registrar`, mas acrescenta vários arquivos com uma única escrita."""
+    _, caminho_jsonl, _ = _caminhos(nome_indice, diretorio)
+    agora = time.time()
+    linhas = "".join(
+        json.dumps({"arquivo": nome_arquivo, "ts": agora}, ensure_ascii=False) + "\n" for nome_arquivo in nomes_arquivos
+    )
+    os.makedirs(diretorio, exist_ok=True)
+    fd = os.open(caminho_jsonl, os.O_WRONLY | os.O_APPEND | os.O_CREAT | _O_BINARY, 0o644)
+    try:
+        os.write(fd, linhas.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+    if time.monotonic() - _ultima_compactacao.get((nome_indice, diretorio), 0) >= LOG_INDEX_COMPACT_INTERVAL:
+        compactar(nome_indice, diretorio)
+    else:
+        with _lock:
+            _pendentes.add((nome_indice, diretorio))
+
+
+def compactar_pendentes():
+    """
+    Compacta os índices com entradas registradas depois da última compactação. Sem isso, o último lote
+    antes de um período sem conversas só entraria no `.json` na gravação seguinte; o log_writer chama
+    esta função quando a fila fica ociosa e no desligamento.
+    """
+    with _lock:
+        pendentes = list(_pendentes)
+    for nome_indice, diretorio in pendentes:
+        compactar(nome_indice, diretorio)
+
+
+def _chave_ordenacao(nome_arquivo):
+    # Os nomes terminam com a data de criação (AAAA-MM-DD_HH-MM-SS), que ordena corretamente como texto
+    match = _DATA_ARQUIVO.search(nome_arquivo)
+    return match.group(1) if match else ""
+
+
+def _ler_pendentes(caminhos):
+    nomes = []
+    for caminho in caminhos:
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                for linha in f:
+                    linha = linha.strip()
+                    if not linha:
+                        continue
+                    try:
+                        nomes.append(json.loads(linha)["arquivo"])
+                    except (ValueError, KeyError):
+                        # Uma linha truncada por uma queda no meio da escrita é ignorada
+                        logging.warning(f"Linha inválida ignorada no índice {caminho}: {linha[:80]}")
+        except FileNotFoundError:
+            pass
+    return nomes
+
+
+def ler_indice(nome_indice, diretorio=LOGS_DIR):
+    """Retorna a lista completa do índice, da mais recente para a mais antiga, sem reescrever nada."""
+    caminho_json, caminho_jsonl, _ = _caminhos(nome_indice, diretorio)
+    nomes = []
+    if os.path.exists(caminho_json):
+        with open(caminho_json, "r", encoding="utf-8") as f:
+            nomes = json.load(f)
+    pendentes = sorted(glob.glob(caminho_jsonl + ".*.compactando")) + [caminho_jsonl]
+    # As entradas pendentes vêm primeiro (mais novas antes), mantendo a ordem de registro em caso de empate
+    nomes = list(dict.fromkeys(_ler_pendentes(pendentes)[::-1] + nomes))
+    return sorted(nomes, key=_chave_ordenacao, reverse=True)
+
+
+def _adquirir_trava(caminho_trava):
+    # Trava entre processos baseada na criação exclusiva de um arquivo (funciona no Windows e no Linux)
+    try:
+        fd = os.open(caminho_trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(caminho_trava) > _TRAVA_EXPIRADA_SEGUNDOS:
+                os.remove(caminho_trava)
+                return _adquirir_trava(caminho_trava)
+        except OSError:
+            pass
+        return False
+
+
+def compactar(nome_indice, diretorio=LOGS_DIR):
+    """
+    Incorpora as entradas do `<indice>.jsonl` na lista ordenada `<indice>.json`.
+
+    O `.jsonl` é primeiro renomeado (novas entradas vão para um arquivo novo), a lista é gravada em um
+    arquivo temporário e trocada com `os.replace`, e só então os pendentes são apagados. Se o processo
+    cair no meio, a próxima compactação encontra os `.compactando` e termina o trabalho.
+    """
+    caminho_json, caminho_jsonl, caminho_trava = _caminhos(nome_indice, diretorio)
+    with _lock:
+        _ultima_compactacao[(nome_indice, diretorio)] = time.monotonic()
+        if not _adquirir_trava(caminho_trava):
+            return False
+        _pendentes.discard((nome_indice, diretorio))
+        try:
+            if os.path.exists(caminho_jsonl):
+                os.replace(caminho_jsonl, f"{caminho_jsonl}.{time.time_ns()}.compactando")
+            pendentes = sorted(glob.glob(caminho_jsonl + ".*.compactando"))
+            if not pendentes and os.path.exists(caminho_json):
+                return True
+
+            nomes = ler_indice(nome_indice, diretorio)
+            caminho_tmp = caminho_json + ".tmp"
+            with open(caminho_tmp, "w", encoding="utf-8") as f:
+                json.dump(nomes, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(caminho_tmp, caminho_json)
+
+            for caminho in pendentes:
+                os.remove(caminho)
+            logging.info(f"Índice '{nome_indice}.json' compactado com {len(nomes)} entradas.")
+            return True
+        finally:
+            try:
+                os.remove(caminho_trava)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.utils.log_index  (compacta os dois índices imediatamente)
+    logging.basicConfig(level=logging.INFO)
+    for indice in (INDICE_CONVERSAS, INDICE_QUESTIONARIOS):
+        compactar(indice)
@@ -0,0 +1,266 @@
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from . import log_index, log_summary
+from ..config import INSTANCE_DIR
+
+# Índice de busca textual dos logs
+LOG_SEARCH = os.getenv("LOG_SEARCH", "1") == "1"
+LOG_SEARCH_DB = os.getenv("LOG_SEARCH_DB", os.path.join(INSTANCE_DIR, "log_search.db"))
+
+AUTOR_USUARIO = "user"
+AUTOR_BOT = "bot"
+AUTORES = (AUTOR_USUARIO, AUTOR_BOT)
+ORDEM_RECENTES = "recent"
+ORDEM_RELEVANCIA = "relevance"
+
+_TIPO_POR_INDICE = {
+    log_index.INDICE_CONVERSAS: log_summary.TIPO_CONVERSAS,
+    log_index.INDICE_QUESTIONARIOS: log_summary.TIPO_QUESTIONARIOS,
+}
+_FALA = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (Usuário|Bot): ?(.*)$")
+_TERMO = re.compile(r'"([^"]*)"|(\S+)')
+
+_ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS documentos (
+        id INTEGER PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        arquivo TEXT NOT NULL,
+        session_id TEXT,
+        tipo_atendimento TEXT,
+        inicio TEXT,
+        fim TEXT,
+        UNIQUE (tipo, arquivo)
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS falas USING fts5(
+        texto,
+        autor UNINDEXED,
+        momento UNINDEXED,
+        documento UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+"""
+
+
+def falas_conversa(conteudo):
+    """[(momento, autor, texto)] de um log de conversa; linhas sem carimbo continuam a fala anterior."""
+    falas = []
+    for linha in conteudo.split("\n"):
+        encontrada = _FALA.match(linha)
+        if encontrada:
+            momento, autor, texto = encontrada.groups()
+            falas.append([momento, AUTOR_USUARIO if autor == "Usuário" else AUTOR_BOT, texto])
+        elif falas and linha.strip() and not linha.startswith("--- "):
+            falas[-1][2] += "\n" + linha
+    return [tuple(fala) for fala in falas]
+
+
+def expressao_fts(consulta):
+    """
+    Converte o texto digitado em uma expressão FTS5 segura: cada palavra vira um termo entre aspas
+    (todos obrigatórios), trechos entre aspas viram frases e um * no fim de uma palavra busca pelo prefixo.
+    """
+    termos = []
+    for frase, palavra in _TERMO.findall(consulta):
+        if frase.strip():
+            termos.append('"' + frase.strip().replace('"', '""') + '"')
+        elif palavra:
+            prefixo = palavra.endswith("*") and len(palavra) > 1
+            palavra = palavra.rstrip("*").replace('"', '""')
+            if palavra:
+                termos.append(f'"{palavra}"' + ("*" if prefixo else ""))
+    if not termos:
+        raise ValueError("Consulta vazia")
+    return " ".join(termos)
+
+
+class IndiceBusca:
+    """
+    Índice de busca textual (SQLite FTS5) das conversas e questionários gravados em logs/.
+
+    Cada fala vira uma linha da tabela `falas` (texto, autor e horário), ligada ao arquivo de origem em
+    `documentos` (tipo, session_id, tipo de atendimento, início e fim). O log_writer indexa cada lote
+    logo depois de gravá-lo, com o conteúdo que já tem em memória, então o índice cresce junto com os
+    logs sem reler arquivos; `reindexar` cobre os arquivos gravados antes de o índice existir. A ordem
+    de inserção não segue a cronologia (um `reindexar` depois da indexação ao vivo insere logs antigos
+    por último), então a ordem "mais recentes" e o filtro de datas usam o horário gravado em cada fala.
+    """
+
+    def __init__(self, caminho=LOG_SEARCH_DB):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._esquema_criado = False
+        self._contadores = {"indexed_documents": 0, "indexed_utterances": 0, "failed": 0, "searches": 0}
+
+    def indexar_lote(self, itens):
+        """Indexa [(indice, nome_arquivo, conteudo)] em uma transação. Arquivos já indexados são ignorados."""
+        documentos = falas_total = 0
+        conexao = self._conexao()
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            for indice, nome_arquivo, conteudo in itens:
+                tipo = _TIPO_POR_INDICE.get(indice)
+                if tipo is None:
+                    continue
+                if tipo == log_summary.TIPO_CONVERSAS:
+                    resumo = log_summary.resumir_conversa(nome_arquivo, conteudo)
+                    falas = falas_conversa(conteudo)
+                else:
+                    resumo = log_summary.resumir_questionario(nome_arquivo, conteudo)
+                    falas = [(resumo["start"], AUTOR_USUARIO, resposta) for resposta in resumo["answers"].values()]
+                cursor = conexao.execute(
+                    "INSERT OR IGNORE INTO documentos (tipo, arquivo, session_id, tipo_atendimento, inicio, fim) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (tipo, nome_arquivo, resumo["session_id"], (resumo["bot_type"] or "").lower() or None,
+                     resumo["start"], resumo.get("end")),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                documento = cursor.lastrowid
+                conexao.executemany(
+                    "INSERT INTO falas (texto, autor, momento, documento) VALUES (?, ?, ?, ?)",
+                    [(texto, autor, momento, documento) for momento, autor, texto in falas],
+                )
+                documentos += 1
+                falas_total += len(falas)
+            conexao.execute("COMMIT")
+        except Exception:
+            conexao.execute("ROLLBACK")
+            self._incrementar("failed", len(itens))
+            raise
+        self._incrementar("indexed_documents", documentos)
+        self._incrementar("indexed_utterances", falas_total)
+        return documentos
+
+    def buscar(self, consulta, tipo=None, autor=None, tipo_atendimento=None, data_inicial=None, data_final=None,
+               ordem=ORDEM_RECENTES, limite=20, deslocamento=0):
+        """
+        Falas que contêm os termos de `consulta` (ver `expressao_fts`), com um trecho destacado entre [ ].
+        Retorna (itens, ha_mais). Levanta ValueError para uma consulta vazia.
+        """
+        expressao = expressao_fts(consulta)
+        condicoes = ["falas MATCH ?"]
+        parametros = [expressao]
+        for coluna, valor in (("d.tipo", tipo), ("falas.autor", autor), ("d.tipo_atendimento", tipo_atendimento)):
+            if valor:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(valor)
+        if data_inicial:
+            condicoes.append("substr(falas.momento, 1, 10) >= ?")
+            parametros.append(data_inicial)
+        if data_final:
+            condicoes.append("substr(falas.momento, 1, 10) <= ?")
+            parametros.append(data_final)
+        # Falas do mesmo horário ficam na ordem em que aparecem no arquivo (inserido de uma vez, com rowids seguidos)
+        ordenacao = "falas.rank" if ordem == ORDEM_RELEVANCIA else "falas.momento DESC, falas.rowid DESC"
+        # CROSS JOIN fixa a tabela FTS como a externa (o planejador poderia percorrer documentos e consultar o
+        # FTS uma vez por arquivo). Uma linha a mais que o limite indica se existe uma próxima página, sem contar todos os resultados
+        parametros += [limite + 1, deslocamento]
+        conexao = self._conexao()
+        encontradas = [rowid for (rowid,) in conexao.execute(
+            "SELECT falas.rowid FROM falas CROSS JOIN documentos d ON d.id = falas.documento "
+            f"WHERE {' AND '.join(condicoes)} ORDER BY {ordenacao} LIMIT ? OFFSET ?",
+            parametros,
+        )]
+        pagina = encontradas[:limite]
+        # O trecho destacado só é montado para as falas da página, depois da ordenação
+        linhas = {}
+        if pagina:
+            for rowid, *linha in conexao.execute(
+                "SELECT falas.rowid, d.arquivo, d.tipo, d.session_id, d.tipo_atendimento, falas.momento, falas.autor, "
+                "snippet(falas, 0, '[', ']', '…', 16) "
+                "FROM falas CROSS JOIN documentos d ON d.id = falas.documento "
+                f"WHERE falas MATCH ? AND falas.rowid IN ({', '.join('?' * len(pagina))})",
+                [expressao, *pagina],
+            ):
+                linhas[rowid] = linha
+        self._incrementar("searches")
+        itens = [
+            {"file": arquivo, "type": tipo, "session_id": session_id, "bot_type": tipo_atendimento,
+             "time": momento, "speaker": autor, "snippet": trecho}
+            for arquivo, tipo, session_id, tipo_atendimento, momento, autor, trecho in
+            (linhas[rowid] for rowid in pagina if rowid in linhas)
+        ]
+        return itens, len(encontradas) > limite
+
+    def reindexar(self, diretorio=log_index.LOGS_DIR, tamanho_lote=200):
+        """Indexa os arquivos listados nos índices de logs que ainda não estão no banco. Retorna quantos entraram."""
+        total = 0
+        for indice, tipo in _TIPO_POR_INDICE.items():
+            pasta = log_summary.TIPOS[tipo][1]
+            nomes = log_index.ler_indice(indice, diretorio)
+            for inicio in range(0, len(nomes), tamanho_lote):
+                lote = []
+                for nome_arquivo in nomes[inicio:inicio + tamanho_lote]:
+                    try:
+                        with open(os.path.join(diretorio, pasta, nome_arquivo), "r", encoding="utf-8") as f:
+                            lote.append((indice, nome_arquivo, f.read()))
+                    except (OSError, UnicodeDecodeError) as e:
+                        logging.warning(f"Log {nome_arquivo} não indexado: {e}")
+                total += self.indexar_lote(lote)
+        return total
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+        dados["db_bytes"] = os.path.getsize(self.caminho) if os.path.exists(self.caminho) else 0
+        return dados
+
+    # --- Métodos internos ---
+
+    def _incrementar(self, nome, valor=1):
+        with self._lock:
+            self._contadores[nome] += valor
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            with self._lock:
+                if not self._esquema_criado:
+                    conexao.executescript(_ESQUEMA)
+                    self._esquema_criado = True
+            self._local.conexao = conexao
+        return conexao
+
+
+indice_busca = IndiceBusca()
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.utils.log_search "não entendi" [--autor bot] [--tipo conversations] [--reindexar]
+    parser = argparse.ArgumentParser(description="Busca textual nos logs de conversas e questionários.")
+    parser.add_argument("consulta", nargs="?", help='termos (todos obrigatórios), "frase exata" ou prefixo*')
+    parser.add_argument("--tipo", choices=sorted(log_summary.TIPOS))
+    parser.add_argument("--autor", choices=AUTORES)
+    parser.add_argument("--atendimento", help="tradicional ou inteligente")
+    parser.add_argument("--de", help="data inicial (AAAA-MM-DD)")
+    parser.add_argument("--ate", help="data final (AAAA-MM-DD)")
+    parser.add_argument("--relevancia", action="store_true", help="ordena por relevância (padrão: mais recentes)")
+    parser.add_argument("--limite", type=int, default=20)
+    parser.add_argument("--reindexar", action="store_true", help="indexa os logs que ainda não estão no índice")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.reindexar:
+        inicio = time.perf_counter()
+        logging.info(f"{indice_busca.reindexar()} arquivos indexados em {time.perf_counter() - inicio:.2f}s")
+    if args.consulta:
+        inicio = time.perf_counter()
+        resultados, ha_mais = indice_busca.buscar(
+            args.consulta, tipo=args.tipo, autor=args.autor, tipo_atendimento=(args.atendimento or "").lower() or None,
+            data_inicial=args.de, data_final=args.ate,
+            ordem=ORDEM_RELEVANCIA if args.relevancia else ORDEM_RECENTES, limite=args.limite,
+        )
+        duracao = (time.perf_counter() - inicio) * 1000
+        for item in resultados:
+            print(f"{item['time']}  {item['speaker']:<4}  {item['file']}\n    {item['snippet']}")
+        print(f"{len(resultados)} resultados{' (há mais)' if ha_mais else ''} em {duracao:.1f} ms")
@@ -0,0 +1,240 @@
+import os
+import re
+import threading
+from datetime import datetime
+
+from . import log_index
+
+# API /logs do visualizador
+# Token exigido no cabeçalho Authorization (Bearer); vazio deixa a API aberta, como os demais endpoints
+LOGS_API_TOKEN = os.getenv("LOGS_API_TOKEN", "")
+LOGS_API_PER_PAGE = int(os.getenv("LOGS_API_PER_PAGE", "50"))
+LOGS_API_MAX_PER_PAGE = int(os.getenv("LOGS_API_MAX_PER_PAGE", "200"))
+
+# Tipos de log servidos pela API /logs: índice, pasta dentro de logs/ e função que resume cada arquivo
+TIPO_CONVERSAS = "conversations"
+TIPO_QUESTIONARIOS = "questionnaires"
+
+_DATA_HORA = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+_DATA_ARQUIVO = re.compile(r"_(\d{4}-\d{2}-\d{2})_(\d{2})-(\d{2})-(\d{2})\.txt$")
+_NOME_VALIDO = re.compile(r"^[\w.-]+\.txt$")
+
+# Mesmos critérios do analise_dados.py para contar erros do bot e inferir o resultado da conversa
+_ERROS_BOT = (
+    "Não temos um item com esse número",
+    "Por favor, informe apenas a quantidade em números",
+    "Desculpa, não entendi",
+    "Número inválido",
+)
+_ERROS_BOT_MINUSCULAS = ("não entendi o que você quis dizer", "não tenho como saber", "não tenho como te dar essa resposta")
+_FALHA = "atendimento está encerrado"
+# Linha que o whatsapp_utils grava antes de cada resposta de erro (MARCADOR_ERRO). Uma resposta marcada
+# conta um erro; as sem marcação (conversas gravadas antes dela e respostas do Gemini) são verificadas pelo texto
+_MARCADOR_ERRO = "--- Resposta com erro:"
+
+RESULTADO_SUCESSO = "success"
+RESULTADO_SUCESSO_COM_ERROS = "success_with_errors"
+RESULTADO_FALHA = "failure"
+RESULTADOS = (RESULTADO_SUCESSO, RESULTADO_SUCESSO_COM_ERROS, RESULTADO_FALHA)
+
+_PERGUNTAS = ("Pergunta 1:", "Pergunta 2:", "Pergunta 3:", "Pergunta 4 (Feedback):")
+
+
+def _data_do_nome(nome_arquivo):
+    """Data de gravação que faz parte do nome do arquivo, no formato AAAA-MM-DD HH:MM:SS."""
+    encontrada = _DATA_ARQUIVO.search(nome_arquivo)
+    if encontrada is None:
+        return None
+    data, hora, minuto, segundo = encontrada.groups()
+    return f"{data} {hora}:{minuto}:{segundo}"
+
+
+def _sessao_do_nome(nome_arquivo, prefixo=""):
+    nome = nome_arquivo[len(prefixo):] if nome_arquivo.startswith(prefixo) else nome_arquivo
+    encontrada = _DATA_ARQUIVO.search(nome)
+    return nome[:encontrada.start()] if encontrada else nome.rsplit(".", 1)[0]
+
+
+def resumir_conversa(nome_arquivo, conteudo):
+    """Resumo de um log de conversa (tipo, horários, mensagens, erros do bot e resultado inferido)."""
+    tipo = inicio = fim = None
+    mensagens_usuario = mensagens_bot = erros = 0
+    falha = marcada = False
+    for linha in conteudo.split("\n"):
+        if linha.startswith(_MARCADOR_ERRO):
+            marcada = True
+        elif linha.startswith("Tipo de Atendimento:"):
+            tipo = linha.split(":", 1)[1].strip()
+        elif "--- Início da interação:" in linha:
+            encontrada = _DATA_HORA.search(linha)
+            inicio = encontrada.group(0) if encontrada else inicio
+        elif "--- Fim da interação:" in linha:
+            encontrada = _DATA_HORA.search(linha)
+            fim = encontrada.group(0) if encontrada else fim
+        elif "] Usuário:" in linha:
+            mensagens_usuario += 1
+        elif "] Bot:" in linha:
+            mensagens_bot += 1
+            mensagem = linha.split("] Bot:", 1)[1].strip()
+            minusculas = mensagem.lower()
+            if marcada:
+                erros += 1
+                marcada = False
+            else:
+                if any(erro in mensagem for erro in _ERROS_BOT):
+                    erros += 1
+                if any(erro in minusculas for erro in _ERROS_BOT_MINUSCULAS):
+                    erros += 1
+            if _FALHA in minusculas:
+                falha = True
+
+    duracao = None
+    if inicio and fim:
+        formato = "%Y-%m-%d %H:%M:%S"
+        duracao = int((datetime.strptime(fim, formato) - datetime.strptime(inicio, formato)).total_seconds())
+    if falha:
+        resultado = RESULTADO_FALHA
+    elif erros:
+        resultado = RESULTADO_SUCESSO_COM_ERROS
+    else:
+        resultado = RESULTADO_SUCESSO
+    return {
+        "file": nome_arquivo,
+        "session_id": _sessao_do_nome(nome_arquivo),
+        "bot_type": tipo,
+        "start": inicio or _data_do_nome(nome_arquivo),
+        "end": fim,
+        "duration_seconds": duracao,
+        "user_messages": mensagens_usuario,
+        "bot_messages": mensagens_bot,
+        "bot_errors": erros,
+        "outcome": resultado,
+    }
+
+
+def resumir_questionario(nome_arquivo, conteudo):
+    """Resumo de um questionário (tipo de atendimento e as quatro respostas)."""
+    tipo = None
+    respostas = {}
+    pergunta = None
+    for linha in conteudo.split("\n"):
+        if linha.startswith("Tipo de Atendimento:"):
+            tipo = linha.split(":", 1)[1].strip()
+            continue
+        for numero, prefixo in enumerate(_PERGUNTAS, start=1):
+            if linha.startswith(prefixo):
+                pergunta = numero
+                break
+        else:
+            if linha.startswith("Resposta:") and pergunta is not None:
+                respostas[f"q{pergunta}"] = linha.split(":", 1)[1].strip()
+                pergunta = None
+    return {
+        "file": nome_arquivo,
+        "session_id": _sessao_do_nome(nome_arquivo, "questionario_"),
+        "bot_type": tipo,
+        "start": _data_do_nome(nome_arquivo),
+        "answers": respostas,
+    }
+
+
+TIPOS = {
+    TIPO_CONVERSAS: (log_index.INDICE_CONVERSAS, "conversations", resumir_conversa),
+    TIPO_QUESTIONARIOS: (log_index.INDICE_QUESTIONARIOS, "questionarios", resumir_questionario),
+}
+
+
+class CatalogoLogs:
+    """
+    Resumos dos logs de conversas e questionários para a API /logs, sem o visualizador precisar baixar os arquivos.
+
+    Os arquivos de log não mudam depois de gravados, então o resumo de cada um é calculado uma única
+    vez. A lista de um tipo só é refeita quando o índice dele muda (tamanho ou data de modificação dos
+    arquivos do índice), e essa mesma versão serve de ETag para as respostas.
+    """
+
+    def __init__(self, diretorio=log_index.LOGS_DIR):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        self._listas = {}  # tipo -> (versão, [resumos])
+        self._resumos = {}  # (tipo, arquivo) -> resumo
+        self._leituras = 0
+
+    def versao(self, tipo):
+        """Identifica o estado do índice do tipo; muda sempre que um arquivo é registrado ou o índice é compactado."""
+        indice, _, _ = TIPOS[tipo]
+        base = os.path.join(self.diretorio, indice)
+        partes = []
+        for caminho in (base + ".json", base + ".jsonl"):
+            try:
+                estado = os.stat(caminho)
+                partes.append(f"{estado.st_mtime_ns:x}-{estado.st_size:x}")
+            except FileNotFoundError:
+                partes.append("0")
+        return ".".join(partes)
+
+    def listar(self, tipo):
+        """Retorna (versão, resumos da mais recente para a mais antiga)."""
+        versao = self.versao(tipo)
+        with self._lock:
+            atual = self._listas.get(tipo)
+            if atual is not None and atual[0] == versao:
+                return versao, atual[1]
+            indice, pasta, resumir = TIPOS[tipo]
+            resumos = []
+            for nome_arquivo in log_index.ler_indice(indice, self.diretorio):
+                resumo = self._resumos.get((tipo, nome_arquivo))
+                if resumo is None:
+                    resumo = self._resumir(pasta, nome_arquivo, resumir)
+                    if resumo is None:
+                        continue
+                    self._resumos[(tipo, nome_arquivo)] = resumo
+                resumos.append(resumo)
+            self._listas[tipo] = (versao, resumos)
+            return versao, resumos
+
+    def caminho(self, tipo, nome_arquivo):
+        """Caminho do arquivo de log pedido, ou None se o nome for inválido ou o arquivo não existir."""
+        if tipo not in TIPOS or not _NOME_VALIDO.match(nome_arquivo):
+            return None
+        caminho = os.path.join(self.diretorio, TIPOS[tipo][1], nome_arquivo)
+        return caminho if os.path.isfile(caminho) else None
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "summaries_cached": len(self._resumos),
+                "files_read": self._leituras,
+                "lists": {tipo: len(lista) for tipo, (_, lista) in self._listas.items()},
+            }
+
+    def _resumir(self, pasta, nome_arquivo, resumir):
+        try:
+            with open(os.path.join(self.diretorio, pasta, nome_arquivo), "r", encoding="utf-8") as f:
+                conteudo = f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+        self._leituras += 1
+        return resumir(nome_arquivo, conteudo)
+
+
+def filtrar(resumos, data_inicial=None, data_final=None, tipo_atendimento=None, resultado=None, busca=None):
+    """Filtra os resumos por data (AAAA-MM-DD, inclusive), tipo de atendimento, resultado e trecho do nome do arquivo."""
+    selecionados = []
+    for resumo in resumos:
+        data = (resumo["start"] or "")[:10]
+        if data_inicial and data < data_inicial:
+            continue
+        if data_final and data > data_final:
+            continue
+        if tipo_atendimento and (resumo["bot_type"] or "").lower() != tipo_atendimento:
+            continue
+        if resultado and resumo.get("outcome") != resultado:
+            continue
+        if busca and busca not in resumo["file"].lower():
+            continue
+        selecionados.append(resumo)
+    return selecionados
+
+
+catalogo_logs = CatalogoLogs()
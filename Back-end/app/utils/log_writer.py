@@ -0,0 +1,187 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from . import log_index
+from .log_search import indice_busca, LOG_SEARCH
+from .metrics import atraso_gravacao_logs, duracao_gravacao_logs
+
+LOG_WRITER_QUEUE_SIZE = int(os.getenv("LOG_WRITER_QUEUE_SIZE", "1000"))
+LOG_WRITER_BATCH_SIZE = int(os.getenv("LOG_WRITER_BATCH_SIZE", "50"))
+LOG_WRITER_PUT_TIMEOUT = float(os.getenv("LOG_WRITER_PUT_TIMEOUT", "2"))
+
+_PARAR = object()
+
+
+class LogWriter:
+    """
+    Grava os logs de conversas e questionários em uma thread dedicada (write-behind).
+
+    As requisições apenas enfileiram o conteúdo já formatado; a thread de gravação junta o que estiver
+    na fila em lotes, grava e faz fsync de cada arquivo e só então registra os nomes no índice (e, com
+    LOG_SEARCH=1, indexa o conteúdo no índice de busca textual).
+    Quando a fila está cheia, quem enfileira espera até `timeout_enfileirar` segundos (backpressure)
+    e, se ainda assim não houver espaço, grava de forma síncrona para não perder a conversa.
+    Com a fila parada por LOG_INDEX_COMPACT_INTERVAL segundos, e no desligamento, os índices com entradas
+    novas são compactados, para a lista `.json` não ficar desatualizada depois da última conversa.
+    """
+
+    def __init__(self, tamanho_fila=LOG_WRITER_QUEUE_SIZE, tamanho_lote=LOG_WRITER_BATCH_SIZE,
+                 timeout_enfileirar=LOG_WRITER_PUT_TIMEOUT):
+        self.tamanho_lote = tamanho_lote
+        self.timeout_enfileirar = timeout_enfileirar
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._contadores = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "sync_fallbacks": 0,
+            "batches": 0,
+            "write_seconds_total": 0.0,
+            "write_seconds_max": 0.0,
+            "delay_seconds_total": 0.0,
+            "delay_seconds_max": 0.0,
+        }
+
+    def iniciar(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._executar, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def saudavel(self):
+        """Falso se a thread de gravação parou depois de iniciada ou se a fila está cheia (usado pelo /readyz)."""
+        return (self._thread is None or self._thread.is_alive()) and not self._fila.full()
+
+    def enfileirar(self, caminho, conteudo, indice=None, nome_arquivo=None):
+        """Agenda a gravação de `conteudo` em `caminho` e, depois, o registro de `nome_arquivo` no `indice`."""
+        if not self.ativo():
+            self.iniciar()
+        tarefa = (caminho, conteudo, indice, nome_arquivo, time.monotonic())
+        try:
+            self._fila.put(tarefa, timeout=self.timeout_enfileirar)
+        except queue.Full:
+            logging.warning(f"Fila de gravação de logs cheia. Gravando {caminho} de forma síncrona.")
+            self._incrementar("sync_fallbacks")
+            self._gravar_lote([tarefa])
+            return
+        self._incrementar("enqueued")
+
+    def parar(self, timeout=30):
+        """Grava tudo o que ainda está na fila e encerra a thread. Chamado no desligamento do servidor."""
+        if not self.ativo():
+            return
+        logging.info(f"Finalizando a gravação de logs ({self._fila.qsize()} pendentes)...")
+        self._fila.put(_PARAR)
+        self._thread.join(timeout)
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+        dados["queue_depth"] = self._fila.qsize()
+        dados["queue_capacity"] = self._fila.maxsize
+        dados["running"] = self.ativo()
+        return dados
+
+    # --- Métodos internos ---
+
+    def _incrementar(self, nome, valor=1):
+        with self._lock:
+            self._contadores[nome] += valor
+
+    def _executar(self):
+        ociosidade = max(1, log_index.LOG_INDEX_COMPACT_INTERVAL)
+        while True:
+            try:
+                tarefa = self._fila.get(timeout=ociosidade)
+            except queue.Empty:
+                self._compactar_indices()
+                continue
+            if tarefa is _PARAR:
+                self._compactar_indices()
+                return
+            lote = [tarefa]
+            parar = False
+            while len(lote) < self.tamanho_lote:
+                try:
+                    tarefa = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if tarefa is _PARAR:
+                    parar = True
+                    break
+                lote.append(tarefa)
+            self._gravar_lote(lote)
+            if parar:
+                self._compactar_indices()
+                return
+
+    def _compactar_indices(self):
+        try:
+            log_index.compactar_pendentes()
+        except Exception as e:
+            logging.error(f"Erro ao compactar os índices de logs: {e}")
+
+    def _gravar_lote(self, lote):
+        inicio = time.monotonic()
+        gravadas = []
+        for caminho, conteudo, indice, nome_arquivo, enfileirado_em in lote:
+            try:
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                with open(caminho, "w", encoding="utf-8") as arquivo:
+                    arquivo.write(conteudo)
+                    arquivo.flush()
+                    os.fsync(arquivo.fileno())
+                gravadas.append((indice, nome_arquivo, conteudo, enfileirado_em))
+                logging.info(f"Log salvo em: {caminho}")
+            except Exception as e:
+                self._incrementar("failed")
+                logging.error(f"Erro ao gravar o log {caminho}: {e}")
+
+        # Os nomes só entram no índice depois que os arquivos estão gravados em disco
+        por_indice = {}
+        for indice, nome_arquivo, _, _ in gravadas:
+            if indice is not None:
+                por_indice.setdefault(indice, []).append(nome_arquivo)
+        for indice, nomes in por_indice.items():
+            try:
+                log_index.registrar_lote(indice, nomes)
+            except Exception as e:
+                logging.error(f"Erro ao atualizar o índice '{indice}': {e}")
+        if LOG_SEARCH and por_indice:
+            try:
+                indice_busca.indexar_lote(
+                    [(indice, nome_arquivo, conteudo) for indice, nome_arquivo, conteudo, _ in gravadas if indice is not None]
+                )
+            except Exception as e:
+                # O arquivo já está gravado; `python -m app.utils.log_search --reindexar` o recupera depois
+                logging.error(f"Erro ao atualizar o índice de busca: {e}")
+
+        fim = time.monotonic()
+        duracao = fim - inicio
+        duracao_gravacao_logs.observar(duracao)
+        for _, _, _, enfileirado_em in gravadas:
+            atraso_gravacao_logs.observar(fim - enfileirado_em)
+        with self._lock:
+            c = self._contadores
+            c["batches"] += 1
+            c["written"] += len(gravadas)
+            c["write_seconds_total"] += duracao
+            c["write_seconds_max"] = max(c["write_seconds_max"], duracao)
+            for _, _, _, enfileirado_em in gravadas:
+                atraso = fim - enfileirado_em
+                c["delay_seconds_total"] += atraso
+                c["delay_seconds_max"] = max(c["delay_seconds_max"], atraso)
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.parar)
@@ -0,0 +1,165 @@
+import bisect
+import logging
+import threading
+
+# Limites (em segundos) dos histogramas de latência: do fluxo tradicional (sub-milissegundo) ao Gemini (segundos)
+BUCKETS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes, valores, extra=""):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _le(limite):
+    return 'le="%s"' % limite
+
+
+def _numero(valor):
+    if isinstance(valor, bool):
+        return "1" if valor else "0"
+    if isinstance(valor, float):
+        return repr(valor) if valor == valor and valor not in (float("inf"), float("-inf")) else "NaN"
+    return str(valor)
+
+
+class Contador:
+    """Contador com rótulos. Os valores dos rótulos são passados na ordem de `rotulos`."""
+
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *rotulos, valor=1):
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def exposicao(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}" for chave, valor in valores]
+
+
+class Histograma:
+    """Histograma cumulativo no formato do Prometheus (buckets `le`, `_sum` e `_count`)."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_LATENCIA):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # rótulos -> [contagens por bucket (não cumulativas) + 1 para +Inf, soma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *rotulos):
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+
+    def exposicao(self):
+        with self._lock:
+            series = sorted((chave, list(contagens), soma) for chave, (contagens, soma) in self._series.items())
+        linhas = []
+        for chave, contagens, soma in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, _le(limite))} {acumulado}")
+            acumulado += contagens[-1]
+            linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, _le('+Inf'))} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}")
+        return linhas
+
+
+class Registro:
+    """
+    Métricas expostas no /metrics (formato texto do Prometheus).
+
+    Contadores e histogramas são atualizados no caminho das requisições. Os valores que já existem em
+    outros componentes (sessões, cota, circuit breakers, fila de logs...) entram por coletores: funções
+    chamadas a cada leitura, que retornam [(nome, tipo, ajuda, [(rótulos, valor)])], com rótulos em um dict.
+    """
+
+    def __init__(self):
+        self._metricas = []
+        self._coletores = []
+        self._lock = threading.Lock()
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_LATENCIA):
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    def coletor(self, funcao):
+        with self._lock:
+            self._coletores.append(funcao)
+        return funcao
+
+    def _registrar(self, metrica):
+        with self._lock:
+            self._metricas.append(metrica)
+        return metrica
+
+    def exposicao(self):
+        with self._lock:
+            metricas = list(self._metricas)
+            coletores = list(self._coletores)
+        linhas = []
+        for metrica in metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.exposicao())
+        for coletor in coletores:
+            try:
+                coletadas = coletor()
+            except Exception as e:
+                logging.error(f"Erro no coletor de métricas {getattr(coletor, '__name__', coletor)}: {e}")
+                continue
+            for nome, tipo, ajuda, amostras in coletadas:
+                linhas.append(f"# HELP {nome} {ajuda}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for rotulos, valor in amostras:
+                    if valor is None:
+                        continue
+                    linhas.append(f"{nome}{_rotulos(rotulos.keys(), rotulos.values())} {_numero(valor)}")
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+
+# Métricas atualizadas no caminho das requisições
+duracao_mensagens = registro.histograma(
+    "chatbot_message_duration_seconds", "Tempo de processamento de cada mensagem, por estado da conversa e tipo de atendimento.",
+    ("state", "bot_type"),
+)
+duracao_gemini = registro.histograma(
+    "chatbot_gemini_request_duration_seconds", "Latência das chamadas ao Gemini, por modelo e resultado.", ("model", "outcome"),
+)
+requisicoes_http = registro.contador(
+    "chatbot_http_requests_total", "Requisições HTTP atendidas, por rota, método e código de status.", ("endpoint", "method", "status"),
+)
+duracao_gravacao_logs = registro.histograma(
+    "chatbot_log_writer_batch_seconds", "Tempo de gravação (com fsync) de cada lote de logs.",
+)
+atraso_gravacao_logs = registro.histograma(
+    "chatbot_log_writer_delay_seconds", "Tempo entre enfileirar um log e ele estar gravado em disco.",
+)
@@ -0,0 +1,130 @@
+import contextlib
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from ..config import INSTANCE_DIR
+
+
+# Profiling por requisição (desativado por padrão; pode ser ligado pelo .env)
+PROFILING = os.getenv("PROFILING", "0") == "1"
+# Permite ligar o profiling de uma requisição com o cabeçalho "X-Profile: 1"
+PROFILING_ALLOW_HEADER = os.getenv("PROFILING_ALLOW_HEADER", "0") == "1"
+# Fração das requisições perfiladas que rodam sob o cProfile
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.1"))
+# Só requisições a partir deste tempo têm o cProfile gravado em disco
+PROFILING_SLOW_MS = float(os.getenv("PROFILING_SLOW_MS", "500"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(INSTANCE_DIR, "profiles"))
+# Arquivos .prof mantidos na pasta (os mais antigos são apagados; 0 mantém todos)
+PROFILING_MAX_DUMPS = int(os.getenv("PROFILING_MAX_DUMPS", "50"))
+
+CABECALHO = "X-Profile"
+
+_local = threading.local()
+# Requisições sendo perfiladas agora; com 0, etapa() retorna sem consultar a thread atual
+em_andamento = 0
+_em_andamento_lock = threading.Lock()
+_etapa_nula = contextlib.nullcontext()
+# O cProfile não pode rodar em duas threads ao mesmo tempo (Python 3.12+); as outras requisições ficam só com as etapas
+_cprofile_lock = threading.Lock()
+
+
+class Medicao:
+    """Tempo acumulado de cada etapa de uma requisição, na ordem em que as etapas apareceram."""
+
+    def __init__(self):
+        self.etapas = {}
+        self.inicio = time.perf_counter()
+        self.total = None
+        self.perfil = None
+
+    def server_timing(self):
+        """Valor do cabeçalho Server-Timing (durações em milissegundos)."""
+        partes = [f"{nome};dur={segundos * 1000:.3f}" for nome, segundos in self.etapas.items()]
+        partes.append(f"total;dur={self.total * 1000:.3f}")
+        return ", ".join(partes)
+
+
+class _Etapa:
+    __slots__ = ("medicao", "nome", "inicio")
+
+    def __init__(self, medicao, nome):
+        self.medicao = medicao
+        self.nome = nome
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+
+    def __exit__(self, *_):
+        etapas = self.medicao.etapas
+        etapas[self.nome] = etapas.get(self.nome, 0.0) + time.perf_counter() - self.inicio
+
+
+def etapa(nome):
+    """Context manager que soma o tempo do bloco na etapa `nome` da requisição perfilada (sem custo fora dela)."""
+    if not em_andamento:
+        return _etapa_nula
+    medicao = getattr(_local, "medicao", None)
+    if medicao is None:
+        return _etapa_nula
+    return _Etapa(medicao, nome)
+
+
+def ativo_para(cabecalhos):
+    return PROFILING or (PROFILING_ALLOW_HEADER and cabecalhos.get(CABECALHO) == "1")
+
+
+@contextlib.contextmanager
+def requisicao(ativo, rotulo=""):
+    """
+    Mede as etapas da requisição feita dentro do bloco e produz a Medicao (ou None, se `ativo` for falso).
+
+    Uma fração das requisições (PROFILING_SAMPLE_RATE) roda sob o cProfile; se ela passar de
+    PROFILING_SLOW_MS, o perfil é gravado em PROFILING_DIR para ser aberto com pstats ou snakeviz.
+    """
+    global em_andamento
+    if not ativo:
+        yield None
+        return
+    medicao = Medicao()
+    perfil = None
+    if random.random() < PROFILING_SAMPLE_RATE and _cprofile_lock.acquire(blocking=False):
+        perfil = cProfile.Profile()
+        perfil.enable()
+    _local.medicao = medicao
+    with _em_andamento_lock:
+        em_andamento += 1
+    try:
+        yield medicao
+    finally:
+        with _em_andamento_lock:
+            em_andamento -= 1
+        _local.medicao = None
+        medicao.total = time.perf_counter() - medicao.inicio
+        if perfil is not None:
+            perfil.disable()
+            _cprofile_lock.release()
+            if medicao.total * 1000 >= PROFILING_SLOW_MS:
+                _gravar_perfil(perfil, medicao, rotulo)
+        logging.info(f"Profiling {rotulo}: {medicao.server_timing()}")
+
+
+def _gravar_perfil(perfil, medicao, rotulo):
+    try:
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        nome = f"{datetime.now():%Y-%m-%d_%H-%M-%S-%f}_{rotulo}_{medicao.total * 1000:.0f}ms.prof"
+        caminho = os.path.join(PROFILING_DIR, "".join(c if c.isalnum() or c in "._-" else "_" for c in nome))
+        perfil.dump_stats(caminho)
+        medicao.perfil = caminho
+        logging.warning(f"Requisição lenta ({medicao.total * 1000:.0f} ms). Perfil gravado em {caminho}")
+
+        if PROFILING_MAX_DUMPS > 0:
+            arquivos = sorted(f for f in os.listdir(PROFILING_DIR) if f.endswith(".prof"))
+            for antigo in arquivos[:-PROFILING_MAX_DUMPS]:
+                os.remove(os.path.join(PROFILING_DIR, antigo))
+    except OSError as e:
+        logging.error(f"Erro ao gravar o perfil da requisição: {e}")
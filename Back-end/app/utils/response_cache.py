@@ -0,0 +1,126 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .fast_path import normalizar
+
+# Cache de respostas do Gemini (desativado por padrão; pode ser ligado pelo .env)
+GEMINI_RESPONSE_CACHE = os.getenv("GEMINI_RESPONSE_CACHE", "0") == "1"
+GEMINI_RESPONSE_CACHE_SIZE = int(os.getenv("GEMINI_RESPONSE_CACHE_SIZE", "500"))
+GEMINI_RESPONSE_CACHE_TTL = int(os.getenv("GEMINI_RESPONSE_CACHE_TTL", "3600"))
+# Só as primeiras trocas de cada conversa são cacheáveis (depois disso as respostas dependem demais do contexto)
+GEMINI_RESPONSE_CACHE_MAX_TURNS = int(os.getenv("GEMINI_RESPONSE_CACHE_MAX_TURNS", "2"))
+# Arquivo para manter o cache entre reinícios (vazio desativa)
+GEMINI_RESPONSE_CACHE_PATH = os.getenv("GEMINI_RESPONSE_CACHE_PATH", "")
+
+
+def chave_resposta(mensagem, historico):
+    """Chave do cache: a mensagem normalizada mais uma impressão digital do histórico que vai junto com ela."""
+    impressao = hashlib.sha1()
+    for entrada in historico:
+        impressao.update(entrada["role"].encode("utf-8"))
+        for parte in entrada["parts"]:
+            impressao.update(b"\x00" + normalizar(parte).encode("utf-8"))
+        impressao.update(b"\x01")
+    return f"{normalizar(mensagem)}|{impressao.hexdigest()}"
+
+
+class CacheRespostas:
+    """
+    Cache LRU com expiração (TTL) de respostas do Gemini para mensagens repetidas no início das conversas.
+
+    Cada entrada é [resposta, gravada_em (epoch)]. Com `caminho`, o conteúdo é carregado na criação e
+    gravado no desligamento (arquivo temporário + os.replace), descartando o que já expirou.
+    """
+
+    def __init__(self, ativo=GEMINI_RESPONSE_CACHE, max_entradas=GEMINI_RESPONSE_CACHE_SIZE,
+                 ttl=GEMINI_RESPONSE_CACHE_TTL, caminho=GEMINI_RESPONSE_CACHE_PATH):
+        self.ativo = ativo
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.caminho = caminho
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+        if self.ativo and self.caminho:
+            self._carregar()
+
+    def obter(self, chave):
+        if not self.ativo:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and time.time() - entrada[1] > self.ttl:
+                del self._entradas[chave]
+                self._contadores["expirations"] += 1
+                entrada = None
+            if entrada is None:
+                self._contadores["misses"] += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self._contadores["hits"] += 1
+            return entrada[0]
+
+    def guardar(self, chave, resposta):
+        if not self.ativo:
+            return
+        with self._lock:
+            self._entradas[chave] = [resposta, time.time()]
+            self._entradas.move_to_end(chave)
+            self._contadores["stores"] += 1
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self._contadores["evictions"] += 1
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados["entries"] = len(self._entradas)
+        consultas = dados["hits"] + dados["misses"]
+        dados["hit_rate"] = round(dados["hits"] / consultas, 3) if consultas else 0.0
+        dados["enabled"] = self.ativo
+        dados["max_entries"] = self.max_entradas
+        dados["ttl_seconds"] = self.ttl
+        return dados
+
+    def salvar(self):
+        """Grava o cache em disco (se houver `caminho`). Chamado no desligamento."""
+        if not self.ativo or not self.caminho:
+            return
+        agora = time.time()
+        with self._lock:
+            entradas = [[chave, resposta, gravada_em] for chave, (resposta, gravada_em) in self._entradas.items()
+                        if agora - gravada_em <= self.ttl]
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            caminho_tmp = self.caminho + ".tmp"
+            with open(caminho_tmp, "w", encoding="utf-8") as f:
+                json.dump(entradas, f, ensure_ascii=False)
+            os.replace(caminho_tmp, self.caminho)
+            logging.info(f"Cache de respostas salvo com {len(entradas)} entradas em {self.caminho}.")
+        except OSError as e:
+            logging.error(f"Erro ao salvar o cache de respostas: {e}")
+
+    def _carregar(self):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                entradas = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Cache de respostas em {self.caminho} ignorado: {e}")
+            return
+        agora = time.time()
+        for chave, resposta, gravada_em in entradas[-self.max_entradas:]:
+            if agora - gravada_em <= self.ttl:
+                self._entradas[chave] = [resposta, gravada_em]
+        logging.info(f"Cache de respostas carregado com {len(self._entradas)} entradas.")
+
+
+cache_respostas = CacheRespostas()
+atexit.register(cache_respostas.salvar)
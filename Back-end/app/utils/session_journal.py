@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from ..config import INSTANCE_DIR
+
+# Diário das sessões em memória
+SESSION_JOURNAL = os.getenv("SESSION_JOURNAL", "1") == "1"
+SESSION_JOURNAL_DIR = os.getenv("SESSION_JOURNAL_DIR", os.path.join(INSTANCE_DIR, "sessoes"))
+# Tamanho do diário a partir do qual ele é compactado em um snapshot (limita o tempo de restauração)
+SESSION_JOURNAL_COMPACT_BYTES = int(os.getenv("SESSION_JOURNAL_COMPACT_BYTES", str(16 * 1024 * 1024)))
+# Intervalo máximo (s) entre dois fsync do diário; o flush para o sistema operacional é feito a cada lote
+SESSION_JOURNAL_FSYNC_INTERVAL = float(os.getenv("SESSION_JOURNAL_FSYNC_INTERVAL", "1"))
+
+ARQUIVO_DIARIO = "diario.jsonl"
+ARQUIVO_SNAPSHOT = "snapshot.jsonl"
+
+_PARAR = object()
+_DECODIFICADOR = json.JSONDecoder()
+_PREFIXO = '{"id":'
+_SUFIXO_REMOCAO = ',"removida":true}'
+
+
+def serializar(session_id, sessao, ultimo_acesso):
+    """Registro do diário com o estado completo da sessão (uma linha JSON)."""
+    return json.dumps({"id": session_id, "t": ultimo_acesso, "sessao": sessao}, ensure_ascii=False, separators=(",", ":"))
+
+
+def _ler_registro(linha):
+    """Retorna (session_id, removida) de uma linha do diário sem decodificar a sessão inteira."""
+    if linha.startswith(_PREFIXO):
+        session_id, fim = _DECODIFICADOR.raw_decode(linha, len(_PREFIXO))
+        return session_id, linha.startswith(_SUFIXO_REMOCAO, fim)
+    registro = json.loads(linha)
+    return registro["id"], bool(registro.get("removida"))
+
+
+class DiarioSessoes:
+    """
+    Diário (write-ahead) das sessões em memória, para que um reinício do servidor não perca os pedidos,
+    históricos e questionários em andamento.
+
+    Cada `salvar` do armazenamento registra o estado completo da sessão e cada remoção registra a saída
+    dela; as linhas são gravadas em lote por uma thread dedicada (flush a cada lote e fsync a cada
+    `intervalo_fsync` segundos). Quando o diário passa de `limite_compactacao` bytes, o estado atual de
+    todas as sessões vai para um snapshot (gravado em um arquivo temporário e renomeado) e o diário
+    recomeça vazio. Na inicialização, `restaurar` lê o snapshot e reaplica o diário, então o tempo de
+    restauração fica limitado ao tamanho do snapshot (até SESSION_MAX_ENTRIES sessões) mais o do diário.
+    """
+
+    def __init__(self, diretorio=SESSION_JOURNAL_DIR, limite_compactacao=SESSION_JOURNAL_COMPACT_BYTES,
+                 intervalo_fsync=SESSION_JOURNAL_FSYNC_INTERVAL):
+        self.diretorio = diretorio
+        self.limite_compactacao = limite_compactacao
+        self.intervalo_fsync = intervalo_fsync
+        self.caminho_diario = os.path.join(diretorio, ARQUIVO_DIARIO)
+        self.caminho_snapshot = os.path.join(diretorio, ARQUIVO_SNAPSHOT)
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # session_id -> última linha gravada (estado usado na compactação); só a thread de gravação altera
+        self._estado = {}
+        self._arquivo = None
+        self._bytes_diario = 0
+        self._ultimo_fsync = 0.0
+        self._pendente = False  # há linhas gravadas desde o último fsync
+        self._contadores = {
+            "records": 0,
+            "batches": 0,
+            "failed": 0,
+            "compactions": 0,
+            "compaction_seconds_last": None,
+            "restored_sessions": 0,
+            "restored_records": 0,
+            "restore_seconds": None,
+            "corrupted_lines": 0,
+        }
+
+    def restaurar(self):
+        """
+        Lê o snapshot e reaplica o diário. Retorna [(session_id, sessao, ultimo_acesso)] em ordem de
+        acesso (da mais antiga para a mais recente). Deve ser chamado antes do primeiro `salvar`.
+        """
+        inicio = time.monotonic()
+        registros = 0
+        for caminho in (self.caminho_snapshot, self.caminho_diario):
+            registros += self._aplicar(caminho)
+        sessoes = []
+        for session_id, linha in list(self._estado.items()):
+            try:
+                registro = json.loads(linha)
+                sessoes.append((session_id, registro["sessao"], registro["t"]))
+            except (ValueError, KeyError, TypeError):
+                self._estado.pop(session_id)
+                self._contadores["corrupted_lines"] += 1
+        sessoes.sort(key=lambda item: item[2])
+        duracao = time.monotonic() - inicio
+        with self._lock:
+            self._contadores["restored_sessions"] = len(sessoes)
+            self._contadores["restored_records"] = registros
+            self._contadores["restore_seconds"] = duracao
+        if registros:
+            logging.info(f"{len(sessoes)} sessões restauradas do diário ({registros} registros) em {duracao:.3f}s")
+        return sessoes
+
+    def salvar(self, session_id, linha):
+        """Agenda o registro do estado da sessão (`linha`, gerada por `serializar`)."""
+        self._enfileirar((session_id, linha))
+
+    def remover(self, session_id):
+        self._enfileirar((session_id, None))
+
+    def parar(self, timeout=30):
+        """Grava o que ainda está na fila, faz o fsync e encerra a thread. Chamado no desligamento."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._fila.put(_PARAR)
+        self._thread.join(timeout)
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados["journal_bytes"] = self._bytes_diario
+        dados["queue_depth"] = self._fila.qsize()
+        dados["compact_bytes"] = self.limite_compactacao
+        return dados
+
+    # --- Métodos internos ---
+
+    def _enfileirar(self, registro):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._executar, name="session-journal", daemon=True)
+                    self._thread.start()
+        self._fila.put(registro)
+
+    def _aplicar(self, caminho):
+        try:
+            arquivo = open(caminho, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return 0
+        registros = 0
+        with arquivo:
+            for linha in arquivo:
+                # Toda gravação termina com "\n"; sem ele, a linha foi cortada por uma queda no meio da gravação
+                if not linha.endswith("\n"):
+                    self._contadores["corrupted_lines"] += 1
+                    continue
+                linha = linha[:-1]
+                if not linha:
+                    continue
+                try:
+                    session_id, removida = _ler_registro(linha)
+                except (ValueError, KeyError, TypeError):
+                    self._contadores["corrupted_lines"] += 1
+                    continue
+                registros += 1
+                if removida:
+                    self._estado.pop(session_id, None)
+                else:
+                    self._estado[session_id] = linha
+        return registros
+
+    def _executar(self):
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            # O que foi restaurado (snapshot + diário) vira um snapshot novo, e o diário recomeça vazio
+            self._compactar()
+        except OSError as e:
+            logging.error(f"Erro ao preparar o diário de sessões em {self.diretorio}: {e}")
+        while True:
+            try:
+                registro = self._fila.get(timeout=self.intervalo_fsync)
+            except queue.Empty:
+                self._sincronizar(forcar=True)
+                continue
+            lote = []
+            parar = registro is _PARAR
+            if not parar:
+                lote.append(registro)
+                while True:
+                    try:
+                        registro = self._fila.get_nowait()
+                    except queue.Empty:
+                        break
+                    if registro is _PARAR:
+                        parar = True
+                        break
+                    lote.append(registro)
+            if lote:
+                self._gravar_lote(lote)
+            if parar:
+                self._sincronizar(forcar=True)
+                return
+
+    def _gravar_lote(self, lote):
+        linhas = []
+        for session_id, linha in lote:
+            if linha is None:
+                if self._estado.pop(session_id, None) is None:
+                    continue  # sessão que nunca chegou ao diário
+                linha = _PREFIXO + json.dumps(session_id, ensure_ascii=False) + _SUFIXO_REMOCAO
+            else:
+                self._estado[session_id] = linha
+            linhas.append(linha)
+        if not linhas:
+            return
+        conteudo = "\n".join(linhas) + "\n"
+        try:
+            if self._arquivo is None:
+                self._arquivo = open(self.caminho_diario, "a", encoding="utf-8")
+            self._arquivo.write(conteudo)
+            self._arquivo.flush()
+            self._pendente = True
+            self._sincronizar()
+            with self._lock:
+                self._bytes_diario += len(conteudo.encode("utf-8"))
+                self._contadores["records"] += len(linhas)
+                self._contadores["batches"] += 1
+        except OSError as e:
+            with self._lock:
+                self._contadores["failed"] += len(linhas)
+            logging.error(f"Erro ao gravar o diário de sessões: {e}")
+            return
+        if self._bytes_diario >= self.limite_compactacao:
+            try:
+                self._compactar()
+            except OSError as e:
+                logging.error(f"Erro ao compactar o diário de sessões: {e}")
+
+    def _sincronizar(self, forcar=False):
+        if self._arquivo is None or not self._pendente:
+            return
+        agora = time.monotonic()
+        if forcar or agora - self._ultimo_fsync >= self.intervalo_fsync:
+            try:
+                os.fsync(self._arquivo.fileno())
+            except OSError as e:
+                logging.error(f"Erro no fsync do diário de sessões: {e}")
+            self._ultimo_fsync = agora
+            self._pendente = False
+
+    def _compactar(self):
+        inicio = time.monotonic()
+        temporario = self.caminho_snapshot + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            for linha in self._estado.values():
+                arquivo.write(linha)
+                arquivo.write("\n")
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, self.caminho_snapshot)
+        # Só depois de o snapshot estar no lugar o diário é esvaziado; uma queda entre os dois passos
+        # apenas faz o diário ser reaplicado sobre um snapshot que já o contém
+        if self._arquivo is not None:
+            self._arquivo.close()
+        self._arquivo = open(self.caminho_diario, "w", encoding="utf-8")
+        os.fsync(self._arquivo.fileno())
+        self._ultimo_fsync = time.monotonic()
+        self._pendente = False
+        duracao = time.monotonic() - inicio
+        with self._lock:
+            self._bytes_diario = 0
+            self._contadores["compactions"] += 1
+            self._contadores["compaction_seconds_last"] = duracao
+        logging.info(f"Diário de sessões compactado: {len(self._estado)} sessões no snapshot em {duracao:.3f}s")
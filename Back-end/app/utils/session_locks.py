@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+import time
+
+from .circuit_breaker import percentil
+
+# Espera máxima por uma mensagem anterior da mesma sessão antes de desistir
+SESSION_LOCK_TIMEOUT = float(os.getenv("SESSION_LOCK_TIMEOUT", "30"))
+# Esperas acima disso são registradas no log
+SESSION_LOCK_WARN_SECONDS = float(os.getenv("SESSION_LOCK_WARN_SECONDS", "1"))
+
+
+class _Trava:
+    """Trava com fila por senha (ticket lock): quem chegou primeiro é atendido primeiro."""
+
+    __slots__ = ("condicao", "proxima_senha", "atendendo", "desistentes", "referencias")
+
+    def __init__(self):
+        self.condicao = threading.Condition(threading.Lock())
+        self.proxima_senha = 0
+        self.atendendo = 0
+        self.desistentes = set()
+        # Mensagens segurando ou esperando a trava (controlado por TravasSessao, sob o lock dela)
+        self.referencias = 0
+
+    def adquirir(self, timeout):
+        """Retorna (obtida, esperou)."""
+        with self.condicao:
+            senha = self.proxima_senha
+            self.proxima_senha += 1
+            if self.atendendo == senha:
+                return True, False
+            if self.condicao.wait_for(lambda: self.atendendo == senha, timeout):
+                return True, True
+            # Desistiu: a senha é pulada quando chegar a vez dela
+            self.desistentes.add(senha)
+            return False, True
+
+    def liberar(self):
+        with self.condicao:
+            self.atendendo += 1
+            while self.atendendo in self.desistentes:
+                self.desistentes.discard(self.atendendo)
+                self.atendendo += 1
+            self.condicao.notify_all()
+
+
+class TravasSessao:
+    """
+    Uma trava por session_id, criada na primeira mensagem e descartada quando nenhuma mensagem da sessão a usa.
+
+    Mensagens da mesma sessão são processadas uma de cada vez e na ordem de chegada; sessões diferentes
+    nunca esperam umas pelas outras, mesmo com a trava segurada durante toda a chamada ao Gemini ou
+    o streaming da resposta. O lock interno só protege o dicionário de travas (e as contagens de
+    referências), nunca o processamento. Vale dentro de um processo; com vários workers, as
+    requisições de uma sessão precisam ir sempre para o mesmo worker.
+    """
+
+    def __init__(self, timeout=SESSION_LOCK_TIMEOUT, aviso=SESSION_LOCK_WARN_SECONDS):
+        self.timeout = timeout
+        self.aviso = aviso
+        self._travas = {}
+        self._lock = threading.Lock()
+        self._esperas = []  # últimas esperas com disputa, para o p95
+        self._contadores = {
+            "acquisitions": 0,
+            "contended": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def adquirir(self, session_id):
+        """Trava a sessão e retorna a função que a libera, ou None se a espera passar de `timeout`."""
+        with self._lock:
+            trava = self._travas.get(session_id)
+            if trava is None:
+                trava = self._travas[session_id] = _Trava()
+            trava.referencias += 1
+        inicio = time.monotonic()
+        obtida, esperou = trava.adquirir(self.timeout)
+        espera = time.monotonic() - inicio
+        if not obtida:
+            self._soltar(session_id, trava)
+            with self._lock:
+                self._contadores["timeouts"] += 1
+            logging.warning(f"Sessão {session_id} ocupada há mais de {self.timeout:.0f}s. Mensagem recusada.")
+            return None
+        if esperou and espera >= self.aviso:
+            logging.warning(f"Mensagem da sessão {session_id} esperou {espera:.2f}s pela mensagem anterior.")
+        self._registrar(espera if esperou else 0.0, esperou)
+
+        def liberar():
+            trava.liberar()
+            self._soltar(session_id, trava)
+
+        return liberar
+
+    def _soltar(self, session_id, trava):
+        with self._lock:
+            trava.referencias -= 1
+            if trava.referencias == 0:
+                del self._travas[session_id]
+
+    def _registrar(self, espera, disputada):
+        with self._lock:
+            c = self._contadores
+            c["acquisitions"] += 1
+            if disputada:
+                c["contended"] += 1
+                c["wait_seconds_total"] += espera
+                c["wait_seconds_max"] = max(c["wait_seconds_max"], espera)
+                self._esperas.append(espera)
+                if len(self._esperas) > 1000:
+                    del self._esperas[:500]
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            p95 = percentil(self._esperas, 95)
+            dados["active_sessions"] = len(self._travas)
+        dados["wait_seconds_p95"] = round(p95, 4) if p95 is not None else None
+        dados["contention_rate"] = round(dados["contended"] / dados["acquisitions"], 3) if dados["acquisitions"] else 0.0
+        return dados
+
+
+travas_sessao = TravasSessao()
@@ -0,0 +1,503 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .session_journal import SESSION_JOURNAL, SESSION_JOURNAL_DIR, DiarioSessoes, serializar
+from .session_locks import SESSION_LOCK_TIMEOUT
+from ..config import INSTANCE_DIR
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "5000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "30"))
+
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", os.path.join(INSTANCE_DIR, "sessoes.db"))
+
+
+class SessaoAlterada(Exception):
+    """A sessão foi gravada (ou removida) por outro processo entre o `obter` e o `salvar` desta mensagem."""
+
+
+def nova_sessao():
+    """
+    Retorna o estado inicial de uma sessão de atendimento.
+    Todos os campos são serializáveis em JSON, para que a sessão possa ser guardada fora do processo.
+    """
+    return {
+        "status": None,
+        "tipo_atendimento": None,
+        "historico": [],
+        "historico_salvo": 0,
+        # Início (o mesmo horário da linha "Início da interação") e número de mensagens da conversa atual,
+        # usados nos eventos por mensagem para agrupar as mensagens de cada conversa
+        "conversa_inicio": None,
+        "conversa_turnos": 0,
+        "customer_data": None,
+        "respostas_questionario": None,
+        "gemini_modelo": None,
+        "gemini_historico": [],
+        "gemini_resumo": None,
+        "contexto_pedido": False,
+        "gemini_tokens": {"requisicoes": 0, "prompt": 0, "resposta": 0, "cache": 0, "resumos": 0},
+    }
+
+
+def estimar_bytes(sessao):
+    """Estimativa barata do tamanho de uma sessão, usada apenas para monitoramento."""
+    total = sum(len(linha) for linha in sessao.get("historico") or [])
+    total += sum(len(parte) for conteudo in sessao.get("gemini_historico") or [] for parte in conteudo["parts"])
+    dados = sessao.get("customer_data") or {}
+    for item in dados.get("pedido") or []:
+        total += len(item.get("item", "")) + 16
+    for resposta in (sessao.get("respostas_questionario") or {}).values():
+        total += len(resposta)
+    return total
+
+
+class SessionBackend:
+    """
+    Interface usada pela máquina de estados para ler e gravar as sessões.
+
+    Cada mensagem faz um `obter` no início e um `salvar` no fim do processamento. Sessões removidas
+    por inatividade (TTL) ou por excesso de entradas (LRU) são repassadas ao callback `ao_expirar`,
+    que recebe (session_id, sessao, ultimo_acesso) e pode, por exemplo, salvar o histórico parcial;
+    uma sessão com mensagem em processamento (entre o `obter` e o `salvar`) não deve ser removida.
+
+    Para usar um armazenamento em rede (ex.: Redis), basta implementar estes mesmos métodos
+    e registrá-lo em `criar_backend`.
+    """
+
+    def __init__(self, max_entradas=SESSION_MAX_ENTRIES, ttl_segundos=SESSION_TTL_SECONDS, ao_expirar=None):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.ao_expirar = ao_expirar
+
+    def obter(self, session_id):
+        """Retorna a sessão (criando uma nova se necessário) e a marca como usada recentemente."""
+        raise NotImplementedError
+
+    def salvar(self, session_id, sessao):
+        """
+        Grava a sessão ao final do processamento de uma mensagem. Levanta SessaoAlterada se um armazenamento
+        compartilhado entre processos detectar que outro processo gravou a sessão depois do `obter`.
+        """
+        raise NotImplementedError
+
+    def remover(self, session_id):
+        raise NotImplementedError
+
+    def listar(self):
+        """Retorna [(session_id, sessao, ultimo_acesso)] de todas as sessões (usado no desligamento do servidor)."""
+        raise NotImplementedError
+
+    @property
+    def persistente(self):
+        """Se as sessões sobrevivem a um reinício do processo."""
+        return False
+
+    def expirar(self):
+        """Remove as sessões inativas há mais de `ttl_segundos`. Retorna quantas foram removidas."""
+        raise NotImplementedError
+
+    def estatisticas(self):
+        raise NotImplementedError
+
+    def __contains__(self, session_id):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def _notificar(self, removidas):
+        # O callback roda fora de qualquer lock para não bloquear as outras sessões durante a escrita em disco.
+        for session_id, sessao, ultimo_acesso in removidas:
+            logging.info(f"Sessão {session_id} removida do armazenamento. Estatísticas: {self.estatisticas()}")
+            if self.ao_expirar is None:
+                continue
+            try:
+                self.ao_expirar(session_id, sessao, ultimo_acesso)
+            except Exception as e:
+                logging.error(f"Erro ao finalizar a sessão expirada {session_id}: {e}")
+
+
+class MemorySessionBackend(SessionBackend):
+    """
+    Sessões em memória, com limite de entradas (LRU) e expiração por inatividade (TTL). Atende um único processo.
+
+    Uma sessão entre o `obter` e o `salvar` de uma mensagem (em processamento) nunca é removida: a remoção
+    passaria o histórico ainda em uso para o `ao_expirar`, e o `salvar` seguinte colocaria a sessão de volta.
+
+    Com um `diario` (DiarioSessoes), cada gravação e remoção é registrada em disco, e `restaurar` recoloca
+    na memória as sessões que estavam ativas quando o processo anterior parou.
+    """
+
+    def __init__(self, max_entradas=SESSION_MAX_ENTRIES, ttl_segundos=SESSION_TTL_SECONDS, ao_expirar=None, diario=None):
+        super().__init__(max_entradas, ttl_segundos, ao_expirar)
+        self.diario = diario
+        self._lock = threading.Lock()
+        # session_id -> [sessao, ultimo_acesso (monotonic), ultimo_acesso (epoch), bytes]
+        self._sessoes = OrderedDict()
+        # session_id -> mensagens da sessão entre o obter e o salvar
+        self._em_uso = {}
+        self._bytes = 0
+        self._evictions = 0
+        self._expiracoes = 0
+
+    def obter(self, session_id):
+        with self._lock:
+            removidas = self._remover_expiradas(time.monotonic())
+            self._em_uso[session_id] = self._em_uso.get(session_id, 0) + 1
+            entrada = self._sessoes.get(session_id)
+            if entrada is None:
+                entrada = [nova_sessao(), time.monotonic(), time.time(), 0]
+                self._sessoes[session_id] = entrada
+                removidas += self._remover_excedentes()
+            else:
+                self._sessoes.move_to_end(session_id)
+                entrada[1] = time.monotonic()
+                entrada[2] = time.time()
+            sessao = entrada[0]
+        self._notificar(removidas)
+        return sessao
+
+    def salvar(self, session_id, sessao):
+        tamanho = estimar_bytes(sessao)
+        agora = time.time()
+        linha = serializar(session_id, sessao, agora) if self.diario is not None else None
+        with self._lock:
+            restantes = self._em_uso.pop(session_id, 0) - 1
+            if restantes > 0:
+                self._em_uso[session_id] = restantes
+            entrada = self._sessoes.get(session_id)
+            if entrada is None:
+                entrada = [sessao, 0, 0, 0]
+                self._sessoes[session_id] = entrada
+            self._sessoes.move_to_end(session_id)
+            entrada[0] = sessao
+            entrada[1] = time.monotonic()
+            entrada[2] = agora
+            self._bytes += tamanho - entrada[3]
+            entrada[3] = tamanho
+            # Registrado dentro do lock, para o diário ver gravações e remoções na mesma ordem que a memória
+            if linha is not None:
+                self.diario.salvar(session_id, linha)
+            removidas = self._remover_excedentes()
+        self._notificar(removidas)
+
+    def remover(self, session_id):
+        with self._lock:
+            entrada = self._sessoes.pop(session_id, None)
+            if entrada is not None:
+                self._bytes -= entrada[3]
+                if self.diario is not None:
+                    self.diario.remover(session_id)
+
+    def listar(self):
+        with self._lock:
+            return [(session_id, entrada[0], entrada[2]) for session_id, entrada in self._sessoes.items()]
+
+    @property
+    def persistente(self):
+        return self.diario is not None
+
+    def restaurar(self, sessoes):
+        """
+        Recoloca na memória as sessões [(session_id, sessao, ultimo_acesso)] lidas do diário, da mais antiga
+        para a mais recente. As que expiraram ou excedem o limite enquanto o servidor estava parado saem
+        na próxima limpeza, passando pelo `ao_expirar` (que grava o histórico parcial em logs/).
+        """
+        agora_monotonic = time.monotonic()
+        agora = time.time()
+        with self._lock:
+            for session_id, sessao, ultimo_acesso in sessoes:
+                tamanho = estimar_bytes(sessao)
+                self._sessoes[session_id] = [sessao, agora_monotonic - (agora - ultimo_acesso), ultimo_acesso, tamanho]
+                self._sessoes.move_to_end(session_id)
+                self._bytes += tamanho
+
+    def expirar(self):
+        with self._lock:
+            removidas = self._remover_expiradas(time.monotonic())
+        self._notificar(removidas)
+        return len(removidas)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessoes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessoes)
+
+    def estatisticas(self):
+        with self._lock:
+            dados = {
+                "backend": "memory",
+                "entries": len(self._sessoes),
+                "bytes": self._bytes,
+                "evictions": self._evictions,
+                "expirations": self._expiracoes,
+                "max_entries": self.max_entradas,
+                "ttl_seconds": self.ttl_segundos,
+            }
+        if self.diario is not None:
+            dados["journal"] = self.diario.estatisticas()
+        return dados
+
+    # --- Métodos internos (chamados com o lock adquirido) ---
+
+    def _remover_expiradas(self, agora):
+        # O OrderedDict está em ordem de acesso, então as sessões expiradas ficam sempre no início.
+        removidas = []
+        # Cada sessão é vista no máximo uma vez (as em processamento vão para o fim e não podem ser revisitadas)
+        for _ in range(len(self._sessoes)):
+            session_id, entrada = next(iter(self._sessoes.items()))
+            if agora - entrada[1] < self.ttl_segundos:
+                break
+            if session_id in self._em_uso:
+                # Mensagem em processamento há mais que o TTL: a sessão conta como acessada agora
+                entrada[1] = agora
+                self._sessoes.move_to_end(session_id)
+                continue
+            self._sessoes.popitem(last=False)
+            self._bytes -= entrada[3]
+            self._expiracoes += 1
+            if self.diario is not None:
+                self.diario.remover(session_id)
+            removidas.append((session_id, entrada[0], entrada[2]))
+        return removidas
+
+    def _remover_excedentes(self):
+        excedente = len(self._sessoes) - self.max_entradas
+        if excedente <= 0:
+            return []
+        # As menos usadas recentemente que não estejam em processamento (se todas estiverem, o limite
+        # fica excedido até a próxima gravação)
+        escolhidas = []
+        for session_id in self._sessoes:
+            if session_id not in self._em_uso:
+                escolhidas.append(session_id)
+                if len(escolhidas) == excedente:
+                    break
+        removidas = []
+        for session_id in escolhidas:
+            entrada = self._sessoes.pop(session_id)
+            self._bytes -= entrada[3]
+            self._evictions += 1
+            if self.diario is not None:
+                self.diario.remover(session_id)
+            removidas.append((session_id, entrada[0], entrada[2]))
+        return removidas
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Sessões gravadas em um banco SQLite em modo WAL, que pode ser compartilhado por vários
+    processos (workers) na mesma máquina. Cada thread usa a sua própria conexão.
+
+    As travas por sessão só valem dentro de um processo, então cada sessão tem um número de versão:
+    o `obter` guarda a versão lida e o `salvar` só grava se ela ainda for a do banco (compare-and-swap),
+    incrementando-a. Se outro worker gravou ou removeu a sessão no meio tempo, o `salvar` levanta
+    SessaoAlterada e as alterações desta mensagem são descartadas, em vez de sobrescrever as do outro.
+
+    A limpeza de sessões expiradas é feita no máximo uma vez a cada `SESSION_SWEEP_INTERVAL` segundos
+    por processo; o `DELETE ... RETURNING` garante que só um processo finaliza cada sessão removida.
+    O limite de sessões não remove as acessadas nos últimos `em_uso_segundos` (por padrão, o
+    SESSION_LOCK_TIMEOUT), que podem estar em processamento em outro worker.
+    """
+
+    def __init__(self, caminho=SESSION_SQLITE_PATH, max_entradas=SESSION_MAX_ENTRIES,
+                 ttl_segundos=SESSION_TTL_SECONDS, ao_expirar=None, em_uso_segundos=SESSION_LOCK_TIMEOUT):
+        super().__init__(max_entradas, ttl_segundos, ao_expirar)
+        self.caminho = caminho
+        self.em_uso_segundos = em_uso_segundos
+        self._local = threading.local()
+        self._ultima_limpeza = 0.0
+        # session_id -> versão lida no obter, até o salvar da mesma mensagem
+        self._versoes = {}
+        self._versoes_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        conexao = self._conexao()
+        conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS sessoes (
+                session_id TEXT PRIMARY KEY,
+                dados TEXT NOT NULL,
+                ultimo_acesso REAL NOT NULL,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                versao INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessoes_ultimo_acesso ON sessoes (ultimo_acesso);
+            CREATE TABLE IF NOT EXISTS contadores (
+                nome TEXT PRIMARY KEY,
+                valor INTEGER NOT NULL
+            );
+        """)
+        colunas = {linha[1] for linha in conexao.execute("PRAGMA table_info(sessoes)")}
+        if "versao" not in colunas:
+            try:
+                conexao.execute("ALTER TABLE sessoes ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass  # outro worker acabou de adicionar a coluna
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=10, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexao = conexao
+        return conexao
+
+    def obter(self, session_id):
+        conexao = self._conexao()
+        agora = time.time()
+        removidas = []
+        if time.monotonic() - self._ultima_limpeza >= SESSION_SWEEP_INTERVAL:
+            removidas += self._remover_expiradas(conexao, agora)
+
+        while True:
+            linha = conexao.execute(
+                "UPDATE sessoes SET ultimo_acesso = ? WHERE session_id = ? RETURNING dados, versao", (agora, session_id)
+            ).fetchone()
+            if linha is not None:
+                sessao, versao = json.loads(linha[0]), linha[1]
+                break
+            sessao, versao = nova_sessao(), 0
+            criada = conexao.execute(
+                "INSERT OR IGNORE INTO sessoes (session_id, dados, ultimo_acesso) VALUES (?, ?, ?)",
+                (session_id, json.dumps(sessao, ensure_ascii=False), agora),
+            ).rowcount
+            if criada:
+                removidas += self._remover_excedentes(conexao, agora)
+                break
+            # Outro worker criou a sessão entre o UPDATE e o INSERT: lê a versão dele
+        with self._versoes_lock:
+            self._versoes[session_id] = versao
+        self._notificar(removidas)
+        return sessao
+
+    def salvar(self, session_id, sessao):
+        conexao = self._conexao()
+        with self._versoes_lock:
+            versao = self._versoes.pop(session_id, None)
+        dados = (json.dumps(sessao, ensure_ascii=False), time.time(), estimar_bytes(sessao))
+        if versao is None:
+            # Gravação sem um obter antes (ex.: scripts): não há versão para comparar
+            conexao.execute(
+                "INSERT INTO sessoes (session_id, dados, ultimo_acesso, bytes) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET dados = excluded.dados, "
+                "ultimo_acesso = excluded.ultimo_acesso, bytes = excluded.bytes, versao = versao + 1",
+                (session_id, *dados),
+            )
+            return
+        gravadas = conexao.execute(
+            "UPDATE sessoes SET dados = ?, ultimo_acesso = ?, bytes = ?, versao = versao + 1 "
+            "WHERE session_id = ? AND versao = ?",
+            (*dados, session_id, versao),
+        ).rowcount
+        if not gravadas:
+            self._incrementar(conexao, "conflicts", 1)
+            raise SessaoAlterada(session_id)
+
+    def remover(self, session_id):
+        self._conexao().execute("DELETE FROM sessoes WHERE session_id = ?", (session_id,))
+
+    def listar(self):
+        linhas = self._conexao().execute("SELECT session_id, dados, ultimo_acesso FROM sessoes").fetchall()
+        return [(session_id, json.loads(dados), ultimo_acesso) for session_id, dados, ultimo_acesso in linhas]
+
+    @property
+    def persistente(self):
+        return True
+
+    def expirar(self):
+        removidas = self._remover_expiradas(self._conexao(), time.time())
+        self._notificar(removidas)
+        return len(removidas)
+
+    def __contains__(self, session_id):
+        linha = self._conexao().execute("SELECT 1 FROM sessoes WHERE session_id = ?", (session_id,)).fetchone()
+        return linha is not None
+
+    def __len__(self):
+        return self._conexao().execute("SELECT COUNT(*) FROM sessoes").fetchone()[0]
+
+    def estatisticas(self):
+        conexao = self._conexao()
+        entradas, total_bytes = conexao.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessoes").fetchone()
+        contadores = dict(conexao.execute("SELECT nome, valor FROM contadores").fetchall())
+        return {
+            "backend": "sqlite",
+            "entries": entradas,
+            "bytes": total_bytes,
+            "evictions": contadores.get("evictions", 0),
+            "expirations": contadores.get("expirations", 0),
+            "conflicts": contadores.get("conflicts", 0),
+            "max_entries": self.max_entradas,
+            "ttl_seconds": self.ttl_segundos,
+        }
+
+    # --- Métodos internos ---
+
+    def _remover_expiradas(self, conexao, agora):
+        self._ultima_limpeza = time.monotonic()
+        linhas = conexao.execute(
+            "DELETE FROM sessoes WHERE ultimo_acesso < ? RETURNING session_id, dados, ultimo_acesso",
+            (agora - self.ttl_segundos,),
+        ).fetchall()
+        self._incrementar(conexao, "expirations", len(linhas))
+        return [(session_id, json.loads(dados), ultimo_acesso) for session_id, dados, ultimo_acesso in linhas]
+
+    def _remover_excedentes(self, conexao, agora):
+        excedente = conexao.execute("SELECT COUNT(*) FROM sessoes").fetchone()[0] - self.max_entradas
+        if excedente <= 0:
+            return []
+        # As travas por sessão não valem entre workers, então as acessadas há pouco (possivelmente em
+        # processamento em outro) ficam; se forem todas, o limite fica excedido até a próxima sessão nova
+        linhas = conexao.execute(
+            "DELETE FROM sessoes WHERE session_id IN "
+            "(SELECT session_id FROM sessoes WHERE ultimo_acesso < ? ORDER BY ultimo_acesso LIMIT ?) "
+            "RETURNING session_id, dados, ultimo_acesso",
+            (agora - self.em_uso_segundos, excedente),
+        ).fetchall()
+        self._incrementar(conexao, "evictions", len(linhas))
+        return [(session_id, json.loads(dados), ultimo_acesso) for session_id, dados, ultimo_acesso in linhas]
+
+    def _incrementar(self, conexao, nome, quantidade):
+        if quantidade:
+            conexao.execute(
+                "INSERT INTO contadores (nome, valor) VALUES (?, ?) "
+                "ON CONFLICT (nome) DO UPDATE SET valor = valor + excluded.valor",
+                (nome, quantidade),
+            )
+
+
+def criar_backend(ao_expirar=None):
+    """Cria o armazenamento de sessões configurado em SESSION_BACKEND ("memory" ou "sqlite")."""
+    if SESSION_BACKEND == "sqlite":
+        logging.info(f"Sessões armazenadas em SQLite: {SESSION_SQLITE_PATH}")
+        return SQLiteSessionBackend(ao_expirar=ao_expirar)
+    if SESSION_BACKEND != "memory":
+        logging.warning(f"SESSION_BACKEND desconhecido '{SESSION_BACKEND}'. Usando sessões em memória.")
+    return MemorySessionBackend(ao_expirar=ao_expirar)
+
+
+def ligar_diario(backend):
+    """
+    Restaura as sessões do diário (SESSION_JOURNAL) no armazenamento em memória e passa a registrar nele
+    cada gravação e remoção. Chamado pelo run.py na partida, antes da primeira mensagem, e não ao importar
+    o app: scripts, benchmarks e testes que importam os módulos não leem nem compactam o diário do servidor.
+    """
+    # O diário só existe para o backend em memória; o SQLite já guarda as sessões em disco
+    if not SESSION_JOURNAL or not isinstance(backend, MemorySessionBackend) or backend.diario is not None:
+        return
+    diario = DiarioSessoes()
+    logging.info(f"Sessões em memória com diário em: {SESSION_JOURNAL_DIR}")
+    backend.restaurar(diario.restaurar())
+    backend.diario = diario
+    atexit.register(diario.parar)
@@ -0,0 +1,319 @@
+import atexit
+import contextlib
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from ..config import PROJECT_ROOT
+
+# Eventos estruturados por mensagem
+TURN_EVENTS = os.getenv("TURN_EVENTS", "1") == "1"
+TURN_EVENTS_DIR = os.getenv("TURN_EVENTS_DIR", os.path.join(PROJECT_ROOT, "logs", "events"))
+# O arquivo atual é rotacionado (e comprimido com gzip) ao passar deste tamanho ou na virada do dia
+TURN_EVENTS_ROTATE_BYTES = int(os.getenv("TURN_EVENTS_ROTATE_BYTES", str(8 * 1024 * 1024)))
+# Arquivos comprimidos mantidos na pasta (os mais antigos são apagados; 0 mantém todos)
+TURN_EVENTS_MAX_FILES = int(os.getenv("TURN_EVENTS_MAX_FILES", "0"))
+# Eventos esperando gravação; com a fila cheia, novos eventos são descartados (a mensagem nunca espera)
+TURN_EVENTS_QUEUE_SIZE = int(os.getenv("TURN_EVENTS_QUEUE_SIZE", "10000"))
+
+ARQUIVO_ATUAL = "eventos.jsonl"
+_PREFIXO_ROTACIONADO = "eventos_"
+
+FASE_CONVERSA = "conversation"
+FASE_AVALIACAO = "evaluation"
+FASE_QUESTIONARIO = "questionnaire"
+
+ORIGEM_MAQUINA_ESTADOS = "state_machine"
+ORIGEM_GEMINI = "gemini"
+ORIGEM_RESPOSTA_LOCAL = "fast_path"
+ORIGEM_CACHE = "response_cache"
+
+_PARAR = object()
+_local = threading.local()
+_contexto_nulo = contextlib.nullcontext()
+
+
+class Turno:
+    """
+    Dados de uma mensagem processada, preenchidos por quem os conhece no momento em que acontecem:
+    process_web_message cria o turno e o conclui, e os pontos internos (Gemini, respostas locais,
+    respostas de erro do fluxo tradicional) marcam o turno ativo na thread com as funções do módulo.
+    """
+
+    __slots__ = ("session_id", "inicio", "primeiro_trecho", "origem", "modelo", "tokens", "tokens_resumo", "erro", "encerrada_pelo_bot")
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.inicio = time.perf_counter()
+        self.primeiro_trecho = None
+        self.origem = ORIGEM_MAQUINA_ESTADOS
+        self.modelo = None
+        self.tokens = None
+        self.tokens_resumo = None
+        self.erro = None
+        self.encerrada_pelo_bot = False
+
+
+def novo_turno(session_id):
+    """Turno de uma mensagem, ou None com TURN_EVENTS=0."""
+    return Turno(session_id) if TURN_EVENTS else None
+
+
+def ativo(turno):
+    """Context manager que torna `turno` o turno da thread atual (para as marcações feitas nos pontos internos)."""
+    if turno is None:
+        return _contexto_nulo
+    return _Ativo(turno)
+
+
+class _Ativo:
+    __slots__ = ("turno", "anterior")
+
+    def __init__(self, turno):
+        self.turno = turno
+
+    def __enter__(self):
+        self.anterior = getattr(_local, "turno", None)
+        _local.turno = self.turno
+
+    def __exit__(self, *_):
+        _local.turno = self.anterior
+
+
+def _turno_atual():
+    return getattr(_local, "turno", None)
+
+
+def marcar_origem(origem):
+    turno = _turno_atual()
+    if turno is not None:
+        turno.origem = origem
+
+
+def marcar_erro(tipo):
+    """Registra que a resposta da mensagem é um erro do bot (o primeiro tipo marcado no turno prevalece)."""
+    turno = _turno_atual()
+    if turno is not None and turno.erro is None:
+        turno.erro = tipo
+
+
+def marcar_encerramento_pelo_bot():
+    turno = _turno_atual()
+    if turno is not None:
+        turno.encerrada_pelo_bot = True
+
+
+def registrar_modelo(modelo, uso):
+    """Modelo que respondeu a mensagem e os tokens da chamada (uso do gemini_client)."""
+    turno = _turno_atual()
+    if turno is None:
+        return
+    turno.origem = ORIGEM_GEMINI
+    turno.modelo = modelo
+    if uso:
+        turno.tokens = uso
+
+
+def registrar_resumo(uso):
+    """Tokens da chamada que resumiu o histórico antes da resposta (não muda o modelo nem a origem do turno)."""
+    turno = _turno_atual()
+    if turno is not None and uso:
+        turno.tokens_resumo = uso
+
+
+def evento(turno, bot_type, conversa_inicio, conversa_turno, fase, estado_antes, estado_depois,
+           caracteres_usuario, caracteres_resposta, stream=False, resposta_questionario=None):
+    """Evento do turno (um objeto JSON por linha nos arquivos de eventos)."""
+    agora = time.perf_counter()
+    tokens = turno.tokens or {}
+    tokens_resumo = turno.tokens_resumo or {}
+    dados = {
+        # Horário formatado na thread de gravação, fora do caminho da mensagem
+        "ts": time.time(),
+        "session_id": turno.session_id,
+        "conversation_start": conversa_inicio,
+        "turn": conversa_turno,
+        "bot_type": bot_type,
+        "phase": fase,
+        "state_before": estado_antes,
+        "state_after": estado_depois,
+        "source": turno.origem,
+        "latency_ms": round((agora - turno.inicio) * 1000, 3),
+        "first_chunk_ms": round((turno.primeiro_trecho - turno.inicio) * 1000, 3) if turno.primeiro_trecho else None,
+        "stream": stream,
+        "model": turno.modelo,
+        "prompt_tokens": tokens.get("prompt_tokens"),
+        "response_tokens": tokens.get("response_tokens"),
+        "cached_tokens": tokens.get("cached_tokens"),
+        "summary_prompt_tokens": tokens_resumo.get("prompt_tokens"),
+        "summary_response_tokens": tokens_resumo.get("response_tokens"),
+        "error": turno.erro is not None,
+        "error_kind": turno.erro,
+        "ended_by_bot": turno.encerrada_pelo_bot,
+        "user_chars": caracteres_usuario,
+        "reply_chars": caracteres_resposta,
+    }
+    if resposta_questionario is not None:
+        dados["questionnaire_answer"] = resposta_questionario
+    return dados
+
+
+class RegistroEventos:
+    """
+    Grava os eventos por mensagem em JSONL, em uma thread dedicada.
+
+    As requisições só enfileiram o dicionário do evento; a serialização e a gravação acontecem em lote
+    nesta thread. O arquivo atual (eventos.jsonl) é rotacionado ao passar de `limite_bytes` ou na
+    virada do dia: ele é renomeado para eventos_<data>.jsonl, comprimido em .jsonl.gz e só então o
+    original é apagado, então uma queda no meio da rotação deixa no máximo um .jsonl que é
+    comprimido na próxima inicialização. Os eventos complementam o histórico em texto: os campos
+    (estado, latência, modelo, tokens e erro) são registrados na origem em vez de inferidos do texto.
+    """
+
+    def __init__(self, diretorio=TURN_EVENTS_DIR, limite_bytes=TURN_EVENTS_ROTATE_BYTES,
+                 maximo_arquivos=TURN_EVENTS_MAX_FILES, tamanho_fila=TURN_EVENTS_QUEUE_SIZE):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self.maximo_arquivos = maximo_arquivos
+        self.caminho_atual = os.path.join(diretorio, ARQUIVO_ATUAL)
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._arquivo = None
+        self._dia = None
+        self._bytes = 0
+        self._contadores = {"events": 0, "dropped": 0, "failed": 0, "rotations": 0, "rotation_seconds_last": None}
+
+    def emitir(self, dados):
+        """Agenda a gravação do evento. Nunca bloqueia: com a fila cheia, o evento é descartado."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._executar, name="turn-events", daemon=True)
+                    self._thread.start()
+        try:
+            self._fila.put_nowait(dados)
+        except queue.Full:
+            with self._lock:
+                self._contadores["dropped"] += 1
+
+    def parar(self, timeout=30):
+        """Grava o que ainda está na fila e encerra a thread. Chamado no desligamento."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._fila.put(_PARAR)
+        self._thread.join(timeout)
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados["current_file_bytes"] = self._bytes
+        dados["queue_depth"] = self._fila.qsize()
+        return dados
+
+    # --- Métodos internos ---
+
+    def _executar(self):
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            # Arquivos de uma execução anterior: o atual e rotações interrompidas são comprimidos agora
+            if os.path.exists(self.caminho_atual) and os.path.getsize(self.caminho_atual) > 0:
+                self._rotacionar()
+            for pendente in glob.glob(os.path.join(self.diretorio, _PREFIXO_ROTACIONADO + "*.jsonl")):
+                self._comprimir(pendente)
+        except OSError as e:
+            logging.error(f"Erro ao preparar a pasta de eventos {self.diretorio}: {e}")
+        while True:
+            dados = self._fila.get()
+            if dados is _PARAR:
+                self._fechar()
+                return
+            lote = [dados]
+            parar = False
+            while True:
+                try:
+                    dados = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if dados is _PARAR:
+                    parar = True
+                    break
+                lote.append(dados)
+            self._gravar_lote(lote)
+            if parar:
+                self._fechar()
+                return
+
+    def _gravar_lote(self, lote):
+        for dados in lote:
+            dados["ts"] = datetime.fromtimestamp(dados["ts"]).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        conteudo = "".join(json.dumps(dados, ensure_ascii=False, separators=(",", ":")) + "\n" for dados in lote)
+        try:
+            hoje = datetime.now().date()
+            if self._arquivo is not None and (self._dia != hoje or self._bytes >= self.limite_bytes):
+                self._rotacionar()
+            if self._arquivo is None:
+                self._arquivo = open(self.caminho_atual, "a", encoding="utf-8")
+                self._dia = hoje
+                with self._lock:
+                    self._bytes = self._arquivo.tell()
+            self._arquivo.write(conteudo)
+            self._arquivo.flush()
+            with self._lock:
+                self._bytes += len(conteudo.encode("utf-8"))
+                self._contadores["events"] += len(lote)
+        except OSError as e:
+            with self._lock:
+                self._contadores["failed"] += len(lote)
+            logging.error(f"Erro ao gravar os eventos por mensagem: {e}")
+
+    def _fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def _rotacionar(self):
+        inicio = time.monotonic()
+        self._fechar()
+        rotacionado = os.path.join(
+            self.diretorio, f"{_PREFIXO_ROTACIONADO}{datetime.now().strftime('%Y-%m-%d_%H-%M-%S-%f')}.jsonl"
+        )
+        os.replace(self.caminho_atual, rotacionado)
+        with self._lock:
+            self._bytes = 0
+        self._comprimir(rotacionado)
+        duracao = time.monotonic() - inicio
+        with self._lock:
+            self._contadores["rotations"] += 1
+            self._contadores["rotation_seconds_last"] = duracao
+        self._apagar_antigos()
+
+    def _comprimir(self, caminho):
+        destino = caminho + ".gz"
+        if not os.path.exists(destino):
+            temporario = destino + ".tmp"
+            with open(caminho, "rb") as origem, gzip.open(temporario, "wb", compresslevel=6) as saida:
+                shutil.copyfileobj(origem, saida)
+            os.replace(temporario, destino)
+        os.remove(caminho)
+
+    def _apagar_antigos(self):
+        if self.maximo_arquivos <= 0:
+            return
+        comprimidos = sorted(glob.glob(os.path.join(self.diretorio, _PREFIXO_ROTACIONADO + "*.jsonl.gz")))
+        for caminho in comprimidos[:-self.maximo_arquivos]:
+            try:
+                os.remove(caminho)
+            except OSError as e:
+                logging.error(f"Erro ao apagar o arquivo de eventos {caminho}: {e}")
+
+
+registro_eventos = RegistroEventos()
+atexit.register(registro_eventos.parar)
@@ -1,66 +1,74 @@
 import logging
 import random
-from flask import Flask, current_app, request, jsonify
-import json
-import requests
-import re
+import sys
+import threading
+import time
+import types
 import os
-import google.generativeai as genai
-import pyodbc
-from datetime import datetime, date
-
-# Configuração do Gemini
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = r"credenciais_google.json"
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
+from datetime import datetime
+from .session_store import criar_backend, SessaoAlterada
+from .session_locks import travas_sessao
+from .metrics import duracao_mensagens
+from . import profiling
+from . import turn_events
+from .profiling import etapa
+from . import log_index
+from .log_writer import log_writer
+from .gemini_quota import MODELOS_GEMINI
+from . import gemini_client
+from .gemini_executor import executor_gemini, GeminiSobrecarregado
+from .gemini_history import historico_para_envio, limitar_historico
+from .fast_path import RoteadorIntencoes
+from . import catalogo
+from .response_cache import GEMINI_RESPONSE_CACHE_MAX_TURNS, cache_respostas, chave_resposta
+
+# Configuração do Gemini: o SDK (google.generativeai) só é importado e configurado pelo gemini_client
+# na primeira chamada ou no aquecimento (aquecer), para não pesar na importação deste módulo
 
 #model = genai.GenerativeModel('gemini-1.5-flash-latest') #500 requisições por dia e 15 por minuto
 #model = genai.GenerativeModel('gemini-2.0-flash') #1000 requisições por dia e 15 por minuto
 #model = genai.GenerativeModel('gemini-2.0-flash-lite') #1500 requisições por dia e 30 por minuto
 #model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-06-17') #500 requisições por dia e 15 por minuto
+# Os níveis usados e seus limites ficam em gemini_quota.MODELOS_GEMINI
 
 def get_active_model_name():
     """
-    Verifica a contagem de requisições e retorna o nome do modelo apropriado
-    em uma estratégia de 3 níveis para maximizar a cota diária.
+    Retorna o primeiro modelo da estratégia de 3 níveis que ainda tem cota por minuto e por dia
+    (contadores compartilhados do gemini_quota) e cujo circuit breaker não está aberto.
+    Se nenhum estiver disponível, retorna o último nível.
     """
-    global model_request_count, last_request_date
-
-    # Lógica para resetar o contador diariamente (permanece a mesma)
-    today = date.today()
-    if today != last_request_date:
-        model_request_count = 0
-        last_request_date = today
-        logging.info("Novo dia, contador de requisições do Gemini resetado.")
-
-    # --- LÓGICA DE TROCA DE MODELO EM 3 NÍVEIS ---
-
-    # Nível 1: Até 1500 requisições
-    if model_request_count < 1500:
-        # Usa o modelo principal (Alto RPM, 1500/dia)
-        return 'gemini-2.0-flash-lite'
-    
-    # Nível 2: De 1500 até 2500 requisições
-    elif model_request_count < 2500: # 1500 (nível 1) + 1000 (nível 2)
-        # Usa o modelo de backup 1 (1000/dia)
-        logging.warning(f"Cota do modelo principal atingida. Trocando para o backup 1: gemini-2.0-flash")
-        return 'gemini-2.0-flash'
-    
-    # Nível 3: Acima de 2500 requisições
-    else:
-        # Usa o modelo de backup final (500/dia)
-        logging.warning(f"Cota do backup 1 atingida. Trocando para o backup 2: gemini-1.5-flash")
-        return 'gemini-1.5-flash'
-
-model_request_count = 0
-last_request_date = date.today()
-
-chats = {}
-gemini_chats = {}
-customer_data = {}
-historico_conversas = {}
-tipo_atendimento = {}
-respostas_questionario = {}
+    return gemini_client.modelo_ativo() or MODELOS_GEMINI[-1][0]
+
+
+# Estados da sessão. As strings são internadas para que as buscas na tabela de handlers
+# (_HANDLERS_ESTADO) se resolvam pela identidade da chave, sem comparar o texto.
+ESTADO_AGUARDANDO = sys.intern("aguardando_interacao")
+ESTADO_TRADICIONAL = sys.intern("tradicional")
+ESTADO_INTELIGENTE = sys.intern("inteligente")
+ESTADO_FAZER_PEDIDO = sys.intern("fazer_pedido")
+ESTADO_CAPTURAR_QUANTIDADE = sys.intern("capturar_quantidade")
+ESTADO_ADICIONAR_ITENS = sys.intern("adicionar_itens")
+ESTADO_CAPTURAR_NOME = sys.intern("capturar_nome")
+ESTADO_CONSULTAR_PEDIDO = sys.intern("consultar_pedido")
+ESTADO_MODIFICAR_PEDIDO = sys.intern("modificar_pedido")
+ESTADO_EXCLUIR_ITEM = sys.intern("excluir_item")
+ESTADO_ALTERAR_QUANTIDADE_ITEM = sys.intern("alterar_quantidade_item")
+ESTADO_ALTERAR_QUANTIDADE_VALOR = sys.intern("alterar_quantidade_valor")
+ESTADO_AVALIACAO = sys.intern("avaliacao")
+ESTADO_QUESTIONARIO_1 = sys.intern("questionario_1")
+ESTADO_QUESTIONARIO_2 = sys.intern("questionario_2")
+ESTADO_QUESTIONARIO_3 = sys.intern("questionario_3")
+ESTADO_QUESTIONARIO_4 = sys.intern("questionario_4")
+
+ESTADOS_QUESTIONARIO = frozenset({ESTADO_QUESTIONARIO_1, ESTADO_QUESTIONARIO_2, ESTADO_QUESTIONARIO_3, ESTADO_QUESTIONARIO_4})
+# Estados em que a conversa já foi gravada (ou ainda não começou)
+ESTADOS_CONVERSA_ENCERRADA = ESTADOS_QUESTIONARIO | {ESTADO_AVALIACAO, ESTADO_AGUARDANDO}
+
+# Respostas aceitas nas perguntas de sim/não
+RESPOSTAS_SIM = frozenset({"sim", "s", "quero", "claro", "pode", "pode ser"})
+RESPOSTAS_NAO = frozenset({"não", "nao", "n", "nao quero", "não quero"})
+RESPOSTAS_FINALIZAR = RESPOSTAS_NAO | {"finalizar", "fechar"}
+RESPOSTAS_VOLTAR = frozenset({"9", "nove", "voltar"})
 
 MENU_PRINCIPAL_TEXT = (
     "Olá! 😊 Que bom ter você por aqui! *Por favor, escolha uma opção:*\n"
@@ -70,6 +78,30 @@ MENU_PRINCIPAL_TEXT = (
     "4. Cancelar Atendimento"
 )
 
+# Instrução de sistema da atendente Sara, enviada uma única vez por modelo (e não como primeira mensagem do chat).
+# A lista de itens e preços vem do catálogo, a mesma usada pelo fluxo tradicional.
+INSTRUCOES_SARA = f"""Você é um atendente humano de uma pamonharia de delivery chamada Pamonha Express, em Uberlândia-MG. Essa pamonharia é fictícia e por isso não será feita nenhuma cobrança ou entrega de produtos, mas o atendimento deve simular um atendimento real. Responda como se estivesse anotando pedidos e lidando com dúvidas sobre o cardápio. Não se identifique como modelo de linguagem. Se perguntarem seu nome, diga que se chama Sara.
+Aqui estão os itens do cardápio disponíveis com os preços:
+{catalogo.catalogo.texto_prompt}
+Geralmente a primeira mensagem do cliente será o nome dele, caso não seja, pergunte como ele gostaria de ser chamado. Se o cliente enviar a primeira mensagem já com o pedido, atenda o pedido normalmente.
+Não pergunte endereços. Após o cliente confirmar o pedido, diga apenas que o pedido foi confirmado. Se o cliente perguntar sobre o status do pedido, diga que este atendimento é apenas para fins acadêmicos e que não há pedidos reais, mostre outras opções de cardapio ou pergunte se ele deseja fazer um novo pedido. Somente nesse caso fale sobre os fins acadêmicos. Sempre pergunte a quantidade de cada item após o cliente selecionar o que deseja. Pergunte também se ele deseja adicionar mais itens ou se já pode fechar o pedido. Sempre confirme as informações do pedido antes de dizer que está concluído. Para acompanhar pedidos, informe que o pedido está em preparação ou a caminho. Seja amigável e educado. Adapte seu tom ao humor do cliente (formal ou informal) e use emoticons de forma moderada. Trate endereços ou outras informações sensíveis apenas como dados logísticos para entrega e evite associá-los a interpretações adicionais. Peça desculpas ao cometer erros ou parecer insistente com alguma informação. NÃO se identifique como modelo de linguagem ou IA. Você deve parecer um atendente humano. Não minta. Não invente informações que você não tenha certeza. Use emoticons algumas vezes, mas NÃO exagere e nem use-os repetidamente. Você está respondendo no WhatsApp, um aplicativo de mensagens instantâneas no celular. Se receber mensagem com piadas ou que relacionem "cu" com curau, fique bravo, diga que é uma pamonharia de respeito, que está trabalhando e não aceita esse tipo de gracinha. Se o cliente insistir com essas brincadeiras ou piadas envolvendo "cu", diga que o atendimento está encerrado. Se receber uma mensagem com o texto "Mensagem de áudio recebida." diga que não consegue ouvir áudios no momento.
+Se alguém perguntar a receita das pamonhas diga que é um segredo de família, mas que o sabor é incrível. Se insistirem, diga o básico sobre receitas de pamonha. Se perguntarem se tem queijo, diga que é opcional mas temos sim pamonhas com queijo e sem queijo. Se perguntarem sobre a pamonha apimentada, diga que pode escolher entre doce apimentada ou salgada apimentada.
+Se perguntarem sobre o trabalho, diga que tem um link no rodapé do site falando sobre o projeto. Se perguntarem como fazer para testar um novo chat, diga que é necessário digitar "sair" para encerrar o atendimento.
+"""
+
+roteador_intencoes = RoteadorIntencoes(catalogo.catalogo.itens)
+
+MENSAGEM_INSTABILIDADE = "Um momento, por favor, estou com uma instabilidade no sistema."
+MENSAGEM_SESSAO_OCUPADA = "Um momento, por favor, ainda estou respondendo sua mensagem anterior."
+# Frase com que a Sara encerra o atendimento (ver as instruções acima)
+FRASE_ENCERRAMENTO = "atendimento está encerrado"
+
+# Linha gravada no histórico antes de cada resposta de erro; o log_summary e o analise_dados contam
+# os erros do bot por ela, e não pelo texto das respostas
+MARCADOR_ERRO = "--- Resposta com erro: {tipo} ---"
+# Tipo do erro da resposta da mensagem em andamento nesta thread (ver _resposta_de_erro)
+_erro_resposta = threading.local()
+
 MENU_MODIFICAR_PEDIDO_TEXT = (
     "\n*O que você gostaria de fazer?*\n"
     "1. Alterar a quantidade de um item\n"
@@ -78,96 +110,245 @@ MENU_MODIFICAR_PEDIDO_TEXT = (
     "4. Voltar ao menu principal"
 )
 
-class ChatSession:
-    def __init__(self, status):
-        self.status = status
+def aquecer_gemini():
+    """Importa o SDK do Gemini e cria o modelo do nível ativo antes do primeiro atendimento (usado pelo run.py)."""
+    return gemini_client.aquecer(INSTRUCOES_SARA)
 
-def start_gemini_chat(session_id):
+def start_gemini_chat(session_id, sessao):
     try:
         active_model_name = get_active_model_name()
-        
-        model = genai.GenerativeModel(active_model_name)
 
-        chat = model.start_chat(history=[])
-        
-        gemini_chats[session_id] = chat
+        # A sessão guarda apenas o nome do modelo e o histórico (dados serializáveis), para poder
+        # ser compartilhada entre processos. O chat do Gemini é recriado a partir deles a cada mensagem.
+        sessao["gemini_modelo"] = active_model_name
+        sessao["gemini_historico"] = []
+        sessao["gemini_resumo"] = None
+        sessao["contexto_pedido"] = False
+        sessao["gemini_tokens"] = {"requisicoes": 0, "prompt": 0, "resposta": 0, "cache": 0, "resumos": 0}
         logging.info(f"Chat com Gemini iniciado para {session_id} usando o modelo {active_model_name}.")
     except Exception as e:
         logging.error(f"Erro ao iniciar chat com Gemini para {session_id}: {e}")
         raise
 
 
-def send_message_to_gemini(session_id, message):
-    
-    global model_request_count 
-    try:
-        if session_id not in gemini_chats:
-            start_gemini_chat(session_id)
+def _resumidor(session_id, sessao):
+    """Função de resumo passada ao `limitar_historico`; os tokens do resumo entram na conta da sessão."""
+    def resumir(prompt):
+        uso = {}
+        modelo, resumo = executor_gemini.executar(gemini_client.enviar, [], prompt, None, uso, True)
+        _registrar_tokens(session_id, sessao, modelo, uso, resumo=True)
+        return resumo
+    return resumir
 
-        model_request_count += 1
-        logging.info(f"Contagem de requisições do Gemini: {model_request_count}")
 
-        response = gemini_chats[session_id].send_message(message)
-        logging.info(f"Mensagem enviada para Gemini. Resposta: {response.text}")
-        return response.text
+def _registrar_tokens(session_id, sessao, modelo, uso, resumo=False):
+    if resumo:
+        turn_events.registrar_resumo(uso)
+    else:
+        turn_events.registrar_modelo(modelo, uso)
+    if not uso:
+        return
+    tokens = sessao.setdefault("gemini_tokens", {"requisicoes": 0, "prompt": 0, "resposta": 0, "cache": 0, "resumos": 0})
+    tokens["requisicoes"] += 1
+    tokens["prompt"] += uso["prompt_tokens"]
+    tokens["resposta"] += uso["response_tokens"]
+    tokens["cache"] += uso["cached_tokens"]
+    if resumo:
+        tokens["resumos"] = tokens.get("resumos", 0) + 1
+    logging.info(
+        f"Tokens Gemini ({modelo}{', resumo' if resumo else ''}) [session_id: {session_id}]: prompt={uso['prompt_tokens']}, "
+        f"resposta={uso['response_tokens']}, cache={uso['cached_tokens']} | sessão: {tokens['requisicoes']} requisições, "
+        f"prompt={tokens['prompt']}, resposta={tokens['resposta']}"
+    )
+
+
+def _verificar_encerramento(response_text):
+    # As instruções da Sara mandam encerrar o atendimento quando o cliente insiste em brincadeiras
+    if FRASE_ENCERRAMENTO in response_text.lower():
+        turn_events.marcar_encerramento_pelo_bot()
+
+
+def send_message_to_gemini(session_id, sessao, message):
+    
+    try:
+        if sessao["gemini_modelo"] is None:
+            start_gemini_chat(session_id, sessao)
+
+        # O gemini_client escolhe o nível com cota e circuito fechado e faz o failover em caso de erro;
+        # o histórico da sessão permite continuar a conversa em outro modelo quando o nível muda.
+        # Mensagens antigas são condensadas em um resumo para limitar os tokens enviados a cada turno.
+        with etapa("history_trim"):
+            limitar_historico(sessao, _resumidor(session_id, sessao))
+        uso = {}
+        # A chamada roda no executor do Gemini, com tempo limite e limite de chamadas simultâneas
+        with etapa("gemini"):
+            modelo, response_text = executor_gemini.executar(
+                gemini_client.enviar, historico_para_envio(sessao), message, INSTRUCOES_SARA, uso
+            )
+        sessao["gemini_modelo"] = modelo
+        logging.info(f"Mensagem enviada para Gemini ({modelo}). Resposta: {response_text}")
+        _registrar_tokens(session_id, sessao, modelo, uso)
+        _verificar_encerramento(response_text)
+        sessao["gemini_historico"].append({"role": "user", "parts": [message]})
+        sessao["gemini_historico"].append({"role": "model", "parts": [response_text]})
+        return response_text
     except Exception as e:
         logging.error(f"Erro ao enviar mensagem para Gemini: {e}")
         raise
 
+def send_message_to_gemini_stream(session_id, sessao, message):
+    """
+    Como `send_message_to_gemini`, mas retorna um gerador com os trechos da resposta assim que chegam do Gemini.
+    A requisição entra no executor do Gemini já nesta chamada (GeminiSobrecarregado sai daqui, não do gerador).
+    """
+    if sessao["gemini_modelo"] is None:
+        start_gemini_chat(session_id, sessao)
+
+    with etapa("history_trim"):
+        limitar_historico(sessao, _resumidor(session_id, sessao))
+    uso = {}
+    trechos = executor_gemini.executar_stream(
+        gemini_client.enviar_stream, historico_para_envio(sessao), message, INSTRUCOES_SARA, uso
+    )
+
+    def gerar():
+        partes = []
+        for modelo, trecho in trechos:
+            sessao["gemini_modelo"] = modelo
+            partes.append(trecho)
+            yield trecho
+
+        response_text = "".join(partes)
+        logging.info(f"Mensagem enviada para Gemini ({sessao['gemini_modelo']}) em streaming. Resposta: {response_text}")
+        _registrar_tokens(session_id, sessao, sessao["gemini_modelo"], uso)
+        _verificar_encerramento(response_text)
+        sessao["gemini_historico"].append({"role": "user", "parts": [message]})
+        sessao["gemini_historico"].append({"role": "model", "parts": [response_text]})
+
+    return gerar()
+
+
+def responder_com_gemini(session_id, sessao, message, stream=False):
+    """
+    Envia a mensagem ao Gemini e retorna a resposta (a troca entra no histórico do Gemini da sessão).
+    Com `stream=True` retorna um gerador de trechos; o histórico é atualizado quando ele termina.
+    Perguntas de cardápio, preço e mensagens de áudio são respondidas localmente, sem chamar o Gemini,
+    e o início das conversas pode ser servido pelo cache de respostas (GEMINI_RESPONSE_CACHE).
+    Com o executor do Gemini cheio, GeminiSobrecarregado é repassado para a mensagem ser recusada (HTTP 429).
+    """
+    if sessao["gemini_modelo"] is None:
+        start_gemini_chat(session_id, sessao)
+    # Depois que a conversa fala de itens, quantidades ou pedidos, nenhuma resposta vem do cache
+    if not sessao.get("contexto_pedido") and roteador_intencoes.menciona_pedido(message):
+        sessao["contexto_pedido"] = True
+
+    resposta_local = roteador_intencoes.responder(message)
+    if resposta_local is not None:
+        turn_events.marcar_origem(turn_events.ORIGEM_RESPOSTA_LOCAL)
+        return _registrar_resposta_sem_gemini(sessao, message, resposta_local[1])
+
+    chave_cache = None
+    if (cache_respostas.ativo and not sessao["contexto_pedido"] and not sessao.get("gemini_resumo")
+            and len(sessao["gemini_historico"]) < GEMINI_RESPONSE_CACHE_MAX_TURNS * 2):
+        chave_cache = chave_resposta(message, sessao["gemini_historico"])
+        resposta_cache = cache_respostas.obter(chave_cache)
+        if resposta_cache is not None:
+            logging.info(f"Resposta do Gemini servida pelo cache para {session_id}.")
+            turn_events.marcar_origem(turn_events.ORIGEM_CACHE)
+            return _registrar_resposta_sem_gemini(sessao, message, resposta_cache)
+
+    if not stream:
+        try:
+            response_text = send_message_to_gemini(session_id, sessao, message)
+            if chave_cache is not None:
+                cache_respostas.guardar(chave_cache, response_text)
+            return response_text
+        except GeminiSobrecarregado:
+            raise
+        except Exception as e:
+            logging.error(f"Erro ao processar mensagem com Gemini: {e}")
+            return _resposta_de_erro("gemini_failure", MENSAGEM_INSTABILIDADE)
+
+    try:
+        trechos = send_message_to_gemini_stream(session_id, sessao, message)
+    except GeminiSobrecarregado:
+        raise
+    except Exception as e:
+        logging.error(f"Erro ao processar mensagem com Gemini em streaming: {e}")
+        return _resposta_de_erro("gemini_failure", MENSAGEM_INSTABILIDADE)
+
+    def gerar():
+        partes = []
+        try:
+            for trecho in trechos:
+                partes.append(trecho)
+                yield trecho
+        except Exception as e:
+            logging.error(f"Erro ao processar mensagem com Gemini em streaming: {e}")
+            if not partes:
+                yield _resposta_de_erro("gemini_failure", MENSAGEM_INSTABILIDADE)
+            return
+        if chave_cache is not None:
+            cache_respostas.guardar(chave_cache, "".join(partes))
+
+    return gerar()
+
+
+def _registrar_resposta_sem_gemini(sessao, message, response_text):
+    # A troca entra no histórico do Gemini para que a conversa continue coerente nas próximas mensagens
+    sessao["gemini_historico"].append({"role": "user", "parts": [message]})
+    sessao["gemini_historico"].append({"role": "model", "parts": [response_text]})
+    return response_text
+
+
+# Último segundo formatado: várias linhas do histórico caem no mesmo segundo e o strftime é o passo mais caro
+_segundo_formatado = (None, "")
+
+
 def formatar_historico(autor, mensagem):
-    agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    return f"[{agora}] {autor}: {mensagem}"
+    # Chamada duas vezes por mensagem: só entra na medição de etapas quando há uma requisição sendo perfilada
+    if profiling.em_andamento:
+        with etapa("history_format"):
+            return _formatar_historico(autor, mensagem)
+    return _formatar_historico(autor, mensagem)
+
+
+def _formatar_historico(autor, mensagem):
+    global _segundo_formatado
+    segundo = int(time.time())
+    if _segundo_formatado[0] != segundo:
+        _segundo_formatado = (segundo, datetime.fromtimestamp(segundo).strftime('%Y-%m-%d %H:%M:%S'))
+    return f"[{_segundo_formatado[1]}] {autor}: {mensagem}"
 
 # --- Funções de Fluxo ---
 
-def fluxo_tradicional(session_id, message):
-    response = MENU_PRINCIPAL_TEXT
-    chats[session_id] = ChatSession("tradicional")
-    if session_id in historico_conversas:
-        historico_conversas[session_id].append(formatar_historico("Bot", response))
-    return response
+def fluxo_tradicional(session_id, sessao, message, stream=False):
+    sessao["status"] = ESTADO_TRADICIONAL
+    return MENU_PRINCIPAL_TEXT
 
 
-def fluxo_inteligente(session_id, first_message):
-    start_gemini_chat(session_id)
-    chats[session_id] = ChatSession("inteligente")
+def fluxo_inteligente(session_id, sessao, first_message, stream=False):
+    start_gemini_chat(session_id, sessao)
+    sessao["status"] = ESTADO_INTELIGENTE
     logging.info(f"Fluxo inteligente iniciado para {session_id} com a primeira mensagem: '{first_message}'")
 
+    # As instruções da Sara vão como instrução de sistema do modelo; o chat começa direto pela mensagem do cliente
     try:
-        prompt = f"""<instruções>
-                    Você é um atendente humano de uma pamonharia de delivery chamada Pamonha Express, em Uberlândia-MG. Essa pamonharia é fictícia e por isso não será feita nenhuma cobrança ou entrega de produtos, mas o atendimento deve simular um atendimento real. Responda como se estivesse anotando pedidos e lidando com dúvidas sobre o cardápio. Não se identifique como modelo de linguagem. Se perguntarem seu nome, diga que se chama Sara.
-                    Aqui estão os itens do cardápio disponíveis com os preços:
-                    - Pamonha doce: R$ 10,00
-                    - Pamonha salgada: R$ 10,00
-                    - Pamonha apimentada: R$ 12,00
-                    - Curau clássico: R$ 8,00
-                    - Milho cozido: R$ 6,00
-                    - Bebidas:
-                    - Suco: R$ 5,00
-                    - Coca-Cola (lata): R$ 6,00
-                    - Água: R$ 3,00
-                    Geralmente a primeira mensagem do cliente será o nome dele, caso não seja, pergunte como ele gostaria de ser chamado. Se o cliente enviar a primeira mensagem já com o pedido, atenda o pedido normalmente.
-                    Não pergunte endereços. Após o cliente confirmar o pedido, diga apenas que o pedido foi confirmado. Se o cliente perguntar sobre o status do pedido, diga que este atendimento é apenas para fins acadêmicos e que não há pedidos reais, mostre outras opções de cardapio ou pergunte se ele deseja fazer um novo pedido. Somente nesse caso fale sobre os fins acadêmicos. Sempre pergunte a quantidade de cada item após o cliente selecionar o que deseja. Pergunte também se ele deseja adicionar mais itens ou se já pode fechar o pedido. Sempre confirme as informações do pedido antes de dizer que está concluído. Para acompanhar pedidos, informe que o pedido está em preparação ou a caminho. Seja amigável e educado. Adapte seu tom ao humor do cliente (formal ou informal) e use emoticons de forma moderada. Trate endereços ou outras informações sensíveis apenas como dados logísticos para entrega e evite associá-los a interpretações adicionais. Peça desculpas ao cometer erros ou parecer insistente com alguma informação. NÃO se identifique como modelo de linguagem ou IA. Você deve parecer um atendente humano. Não minta. Não invente informações que você não tenha certeza. Use emoticons algumas vezes, mas NÃO exagere e nem use-os repetidamente. Você está respondendo no WhatsApp, um aplicativo de mensagens instantâneas no celular. Se receber mensagem com piadas ou que relacionem "cu" com curau, fique bravo, diga que é uma pamonharia de respeito, que está trabalhando e não aceita esse tipo de gracinha. Se o cliente insistir com essas brincadeiras ou piadas envolvendo "cu", diga que o atendimento está encerrado. Se receber uma mensagem com o texto "Mensagem de áudio recebida." diga que não consegue ouvir áudios no momento.
-                    Se alguém perguntar a receita das pamonhas diga que é um segredo de família, mas que o sabor é incrível. Se insistirem, diga o básico sobre receitas de pamonha. Se perguntarem se tem queijo, diga que é opcional mas temos sim pamonhas com queijo e sem queijo. Se perguntarem sobre a pamonha apimentada, diga que pode escolher entre doce apimentada ou salgada apimentada.
-                    Se perguntarem sobre o trabalho, diga que tem um link no rodapé do site falando sobre o projeto. Se perguntarem como fazer para testar um novo chat, diga que é necessário digitar "sair" para encerrar o atendimento.
-                    </fim das instruções>
-                    Pergunta do usuário: {first_message}"""
-        
-        response_text = send_message_to_gemini(session_id, prompt)
-        historico_conversas[session_id].append(formatar_historico("Bot", response_text))
-        return response_text
+        return responder_com_gemini(session_id, sessao, first_message, stream)
+    except GeminiSobrecarregado:
+        raise
     except Exception as e:
         logging.error(f"Erro ao processar a primeira mensagem com Gemini: {e}")
-        return "Um momento, por favor, estou com uma instabilidade no sistema."
+        return _resposta_de_erro("gemini_failure", MENSAGEM_INSTABILIDADE)
 
-def iniciar_fluxo_aleatorio(session_id, first_message):
+def iniciar_fluxo_aleatorio(session_id, sessao, first_message, stream=False):
     fluxo = random.choice([fluxo_tradicional, fluxo_inteligente])
-    tipo_atendimento[session_id] = "tradicional" if fluxo == fluxo_tradicional else "inteligente"
-    return fluxo(session_id, first_message)
+    sessao["tipo_atendimento"] = "tradicional" if fluxo == fluxo_tradicional else "inteligente"
+    return fluxo(session_id, sessao, first_message, stream)
 
-def iniciar_questionario(session_id):
+def iniciar_questionario(session_id, sessao):
     """Inicia o questionário de avaliação com botões de estrela."""
-    chats[session_id] = ChatSession("questionario_1")
+    sessao["status"] = ESTADO_QUESTIONARIO_1
         
     response_data = {
         "reply": "Obrigado por aceitar responder ao nosso questionário! 😊\n\n*Pergunta 1:* Em uma escala de 1 a 5, como você avalia sua satisfação nessa conversa?",
@@ -181,424 +362,630 @@ def iniciar_questionario(session_id):
     }
     return response_data
 
-def process_web_message(session_id, message_body):
+def _finalizar_sessao_expirada(session_id, sessao, ultimo_acesso):
+    """Salva o histórico parcial de uma sessão removida do armazenamento por inatividade ou limite."""
+    historico = sessao["historico"]
+    # Conversas já encerradas (avaliação/questionário) ou sem mensagens novas não geram um novo arquivo
+    status = sessao["status"]
+    if len(historico) <= sessao["historico_salvo"] or status in ESTADOS_CONVERSA_ENCERRADA:
+        return
+    hora_fim = datetime.fromtimestamp(ultimo_acesso).strftime('%Y-%m-%d %H:%M:%S')
+    historico.append(f"--- Fim da interação: {hora_fim} ---")
+    salvar_historico_conversa(session_id, historico, sessao["tipo_atendimento"] or "Desconhecido")
+    # Se a sessão voltar ao armazenamento (uma mensagem ainda em andamento no desligamento a grava de novo
+    # no diário, que a restaura no reinício), o que já foi gravado não gera um segundo arquivo
+    sessao["historico_salvo"] = len(historico)
+
+
+sessoes = criar_backend(ao_expirar=_finalizar_sessao_expirada)
+
+
+def encerrar_conversas_abertas():
+    """
+    Grava em logs/ o histórico de todas as conversas em andamento e as remove do armazenamento.
+    Chamado no desligamento do servidor, depois de as mensagens em andamento terminarem. Retorna quantas sessões havia.
+    """
+    abertas = sessoes.listar()
+    for session_id, sessao, ultimo_acesso in abertas:
+        try:
+            _finalizar_sessao_expirada(session_id, sessao, ultimo_acesso)
+        except Exception as e:
+            logging.error(f"Erro ao gravar a conversa aberta {session_id}: {e}")
+        sessoes.remover(session_id)
+    return len(abertas)
+
+
+def process_web_message(session_id, message_body, stream=False):
+    """
+    Processa uma mensagem do chat web e retorna a resposta (texto ou dicionário com botões).
+
+    Com `stream=True`, respostas do Gemini são retornadas como um iterador de trechos de texto
+    (RespostaEmStreaming); nesse caso a sessão só é salva quando ele termina.
+
+    Mensagens da mesma sessão são processadas uma de cada vez (travas_sessao): um clique duplo ou
+    um reenvio do front-end espera a mensagem anterior terminar em vez de disputar a mesma sessão.
+    Se a mensagem precisar do Gemini e o executor dele estiver cheio, GeminiSobrecarregado é repassado.
+    """
 
     logging.info(f"Recebido de [session_id: {session_id}]: {message_body}")
 
+    with etapa("lock"):
+        liberar = travas_sessao.adquirir(session_id)
+    if liberar is None:
+        return MENSAGEM_SESSAO_OCUPADA
+
+    sessao = None
+    resposta = None
+    salva = True
+    turno = turn_events.novo_turno(session_id)
+    try:
+        with etapa("session_load"):
+            sessao = sessoes.obter(session_id)
+        estado = sessao["status"] or ESTADO_AGUARDANDO
+        contexto_turno = (estado, sessao["tipo_atendimento"], message_body)
+        inicio = time.perf_counter()
+        with etapa("dispatch"), turn_events.ativo(turno):
+            resposta = _processar_mensagem(session_id, sessao, message_body, stream)
+        # Em streaming, o tempo medido vai até o início da resposta
+        duracao_mensagens.observar(time.perf_counter() - inicio, estado, sessao["tipo_atendimento"] or "nenhum")
+        if isinstance(resposta, types.GeneratorType):
+            # A trava, o salvamento da sessão e o evento da mensagem passam para o iterador, que os finaliza no fim do stream
+            resposta = RespostaEmStreaming(session_id, sessao, resposta, liberar, turno, contexto_turno)
+    finally:
+        if not isinstance(resposta, RespostaEmStreaming):
+            try:
+                if sessao is not None:
+                    with etapa("session_save"):
+                        salva = _salvar_sessao(session_id, sessao)
+            finally:
+                liberar()
+            if turno is not None and sessao is not None:
+                # Mensagem recusada pelo executor do Gemini ou que terminou em exceção também gera o evento
+                erro = sys.exc_info()[1]
+                if erro is not None and turno.erro is None:
+                    turno.erro = "overloaded" if isinstance(erro, GeminiSobrecarregado) else "exception"
+                elif not salva and turno.erro is None:
+                    turno.erro = "session_conflict"
+                _emitir_evento(turno, sessao, contexto_turno, _tamanho_resposta(resposta))
+    # Com a sessão alterada por outro worker, a mensagem conta como não processada e o cliente a reenvia
+    return resposta if salva else MENSAGEM_SESSAO_OCUPADA
+
+
+def _salvar_sessao(session_id, sessao):
+    """Grava a sessão. Retorna False se outro worker a alterou durante esta mensagem (as alterações são descartadas)."""
+    try:
+        sessoes.salvar(session_id, sessao)
+        return True
+    except SessaoAlterada:
+        logging.warning(f"Sessão {session_id} alterada por outro processo durante a mensagem. Alterações descartadas.")
+        return False
+
+
+def _fase(estado):
+    if estado in ESTADOS_QUESTIONARIO:
+        return turn_events.FASE_QUESTIONARIO
+    if estado == ESTADO_AVALIACAO:
+        return turn_events.FASE_AVALIACAO
+    return turn_events.FASE_CONVERSA
+
+
+def _tamanho_resposta(resposta):
+    if resposta is None:
+        return None
+    return len(resposta["reply"] if isinstance(resposta, dict) else resposta)
+
+
+def _emitir_evento(turno, sessao, contexto_turno, caracteres_resposta, stream=False):
+    """Evento estruturado da mensagem (turn_events), com os dados da sessão depois do processamento."""
+    estado, tipo_antes, message_body = contexto_turno
+    try:
+        fase = _fase(estado)
+        mensagem = message_body.strip()
+        turn_events.registro_eventos.emitir(turn_events.evento(
+            turno,
+            # O questionário termina limpando o tipo de atendimento da sessão
+            bot_type=sessao["tipo_atendimento"] or tipo_antes,
+            conversa_inicio=sessao.get("conversa_inicio"),
+            conversa_turno=sessao.get("conversa_turnos"),
+            fase=fase,
+            estado_antes=estado,
+            estado_depois=sessao["status"] or ESTADO_AGUARDANDO,
+            caracteres_usuario=len(mensagem),
+            caracteres_resposta=caracteres_resposta,
+            stream=stream,
+            resposta_questionario=mensagem.lower() if fase == turn_events.FASE_QUESTIONARIO else None,
+        ))
+    except Exception as e:
+        logging.error(f"Erro ao registrar o evento da mensagem: {e}")
+
+
+class RespostaEmStreaming:
+    """
+    Trechos de uma resposta em streaming. Quando o último trecho é entregue, ou quando o stream é
+    fechado antes disso (cliente desconectou), salva a sessão e libera a trava dela uma única vez.
+    """
+
+    def __init__(self, session_id, sessao, trechos, liberar, turno=None, contexto_turno=None):
+        self.session_id = session_id
+        self.sessao = sessao
+        self._trechos = trechos
+        self._liberar = liberar
+        self._fechado = False
+        self._turno = turno
+        self._contexto_turno = contexto_turno
+        self._caracteres = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            # O fim da resposta (tokens, modelo e erros do Gemini) é registrado dentro do iterador
+            with turn_events.ativo(self._turno):
+                trecho = next(self._trechos)
+        except BaseException:
+            self.close()
+            raise
+        if self._turno is not None:
+            if self._turno.primeiro_trecho is None:
+                self._turno.primeiro_trecho = time.perf_counter()
+            self._caracteres += len(trecho)
+        return trecho
+
+    def close(self):
+        if self._fechado:
+            return
+        self._fechado = True
+        try:
+            self._trechos.close()
+            # A resposta já foi entregue; um conflito com outro worker só é registrado no log
+            _salvar_sessao(self.session_id, self.sessao)
+        finally:
+            self._liberar()
+            if self._turno is not None:
+                _emitir_evento(self._turno, self.sessao, self._contexto_turno, self._caracteres, stream=True)
+
+    def __del__(self):
+        self.close()
+
+
+def _processar_mensagem(session_id, sessao, message_body, stream=False):
+    """Registra a mensagem do usuário, executa o handler do estado atual e registra a resposta."""
+
     message_body = message_body.strip().lower()
+    _erro_resposta.tipo = None
 
-    if session_id not in historico_conversas:
-        historico_conversas[session_id] = []
+    tamanho_historico = len(sessao["historico"])
+    if not sessao["historico"]:
         hora_inicio = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        historico_conversas[session_id].append(f"--- Início da interação: {hora_inicio} ---")
+        sessao["historico"].append(f"--- Início da interação: {hora_inicio} ---")
+        sessao["conversa_inicio"] = hora_inicio
+        sessao["conversa_turnos"] = 0
     
-    historico_conversas[session_id].append(formatar_historico("Usuário", message_body))
+    sessao["historico"].append(formatar_historico("Usuário", message_body))
 
+    estado_anterior = sessao["status"]
+    if estado_anterior is not None:
+        # Sessões vindas do backend SQLite trazem o estado como uma string nova
+        estado_anterior = sessao["status"] = sys.intern(estado_anterior)
     # O comando universal "sair" é verificado primeiro e de forma isolada
     if message_body == "sair":
+        sessao["status"] = ESTADO_AVALIACAO
+        resposta = _resposta_encerramento()
+    else:
+        handler = _HANDLERS_ESTADO.get(estado_anterior, _estado_desconhecido)
+        try:
+            resposta = handler(session_id, sessao, message_body, stream)
+        except GeminiSobrecarregado:
+            # A mensagem não foi atendida e será reenviada pelo cliente: ela sai do histórico da conversa
+            del sessao["historico"][tamanho_historico:]
+            raise
+    sessao["conversa_turnos"] = sessao.get("conversa_turnos", 0) + 1
+    return _registrar_resposta(session_id, sessao, estado_anterior, resposta)
+
+
+def _registrar_resposta(session_id, sessao, estado_anterior, resposta):
+    """
+    Único ponto em que as respostas do bot entram no histórico da conversa.
+
+    As respostas do questionário ficam de fora (ele é gravado em um arquivo próprio). Ao entrar no
+    estado de avaliação, a conversa é encerrada e o histórico é gravado.
+    """
+    if estado_anterior in ESTADOS_QUESTIONARIO or sessao["status"] in ESTADOS_QUESTIONARIO:
+        return resposta
+    if isinstance(resposta, types.GeneratorType):
+        return _registrar_ao_final(sessao, resposta)
+
+    _registrar_fala_do_bot(sessao, resposta["reply"] if isinstance(resposta, dict) else resposta)
+    if sessao["status"] == ESTADO_AVALIACAO and estado_anterior != ESTADO_AVALIACAO:
         hora_fim = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        historico_conversas[session_id].append(f"--- Fim da interação: {hora_fim} ---")
-        response_data = {
-            "reply": "Conversa encerrada. Se precisar de algo, estamos à disposição! 👋\n\nGostaria de responder a um breve questionário de avaliação?",
-            "buttons": [{"label": "Sim", "value": "sim"}, {"label": "Não", "value": "nao"}]
-        }
-        chats[session_id] = ChatSession("avaliacao")
-        historico_conversas[session_id].append(formatar_historico("Bot", response_data['reply']))
-        tipo_chatbot = tipo_atendimento.get(session_id, "Desconhecido")
-        salvar_historico_conversa(session_id, historico_conversas[session_id], tipo_chatbot)
-        return response_data
-    
-    current_status = chats.get(session_id, ChatSession(None)).status
-
-    if current_status is None:
-        return iniciar_fluxo_aleatorio(session_id, message_body)
-
-    elif current_status == "aguardando_interacao":
-        return iniciar_fluxo_aleatorio(session_id, message_body)
-
-    elif current_status == "tradicional":
-        if session_id not in customer_data:
-            customer_data[session_id] = {"pedido": [], "nome": None, "valor_total": 0.0}
-
-        # Opção 1: Ver Cardápio
-        if message_body in ["1", "um", "cardapio", "cardápio", "ver cardapio", "ver cardápio", "menu"]:
-            response = ("📋 *Cardápio*\n\n"
-                        "1 - Pamonha Doce: R$ 10,00\n2 - Pamonha Salgada: R$ 10,00\n"
-                        "3 - Pamonha Apimentada: R$ 12,00\n4 - Curau Clássico: R$ 8,00\n"
-                        "5 - Milho Cozido: R$ 6,00\n6 - Suco: R$ 5,00\n"
-                        "7 - Coca-Cola Lata: R$ 6,00\n8 - Água Mineral: R$ 3,00\n\n"
-                        "Para fazer um pedido, informe o número do item desejado.\n\n Ou digite *9* para voltar ao menu principal.")
-            chats[session_id] = ChatSession("fazer_pedido")
-            historico_conversas[session_id].append(formatar_historico("Bot", response))
-            return response
-
-        # Opção 2: Fazer Pedido
-        elif message_body in ["2", "dois", "pedido", "fazer pedido", "pedir", "fazer um pedido"]:
-            response = "Por favor, informe o número do item que deseja pedir ou digite *9* para voltar ao menu principal e ver o cardápio."
-            chats[session_id] = ChatSession("fazer_pedido")
-            historico_conversas[session_id].append(formatar_historico("Bot", response))
-            return response
-
-        # Opção 3: Ver meu pedido
-        elif message_body in ["3", "três", "ver pedido", "meu pedido", "acompanhar", "status"]:
-            if session_id in customer_data and customer_data[session_id]["pedido"]:
-                pedido_atual = customer_data[session_id]["pedido"]
-                valor_total = customer_data[session_id]["valor_total"]
-                response_parts = ["*Seu pedido atual:*"]
-                for item in pedido_atual:
-                    response_parts.append(f"- {item['quantidade']}x {item['item']}")
-                response_parts.append(f"\n*Valor Total: R$ {valor_total:.2f}*")
-                pedido_formatado = "\n".join(response_parts)
-                response = f"{pedido_formatado}\n\n{MENU_MODIFICAR_PEDIDO_TEXT}"
-                chats[session_id] = ChatSession("modificar_pedido")
-                historico_conversas[session_id].append(formatar_historico("Bot", response))
-                return response
-            else:
-                aviso = "Você ainda não realizou um pedido."
-                response = f"{aviso}\n\n{MENU_PRINCIPAL_TEXT}"
-                historico_conversas[session_id].append(formatar_historico("Bot", response))
-                return response
-
-        elif message_body in ["4", "quatro", "cancelar", "cancelar atendimento"]:
-            response_data = {
-                "reply": "Conversa encerrada. Se precisar de algo, estamos à disposição! 👋\n\nGostaria de responder a um breve questionário de avaliação?",
-                "buttons": [{"label": "Sim", "value": "sim"}, {"label": "Não", "value": "nao"}]
-            }
-            chats[session_id] = ChatSession("avaliacao")
-            historico_conversas[session_id].append(formatar_historico("Bot", response_data['reply']))
-            hora_fim = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            historico_conversas[session_id].append(f"--- Fim da interação: {hora_fim} ---")
-            tipo_chatbot = tipo_atendimento.get(session_id, "Desconhecido")
-            salvar_historico_conversa(session_id, historico_conversas[session_id], tipo_chatbot)
-            return response_data
-            
+        sessao["historico"].append(f"--- Fim da interação: {hora_fim} ---")
+        with etapa("log_write"):
+            salvar_historico_conversa(session_id, sessao["historico"], sessao["tipo_atendimento"] or "Desconhecido")
+        sessao["historico_salvo"] = len(sessao["historico"])
+    return resposta
+
+
+def _registrar_ao_final(sessao, trechos):
+    # Respostas em streaming entram no histórico completas, quando o último trecho é entregue
+    partes = []
+    try:
+        for trecho in trechos:
+            partes.append(trecho)
+            yield trecho
+    finally:
+        if partes:
+            _registrar_fala_do_bot(sessao, "".join(partes))
+
+
+def _registrar_fala_do_bot(sessao, texto):
+    tipo_erro = getattr(_erro_resposta, "tipo", None)
+    if tipo_erro is not None:
+        sessao["historico"].append(MARCADOR_ERRO.format(tipo=tipo_erro))
+    sessao["historico"].append(formatar_historico("Bot", texto))
+
+
+# --- Máquina de estados ---
+# Cada estado tem um handler registrado em _HANDLERS_ESTADO, com a assinatura
+# (session_id, sessao, mensagem, stream), que retorna a resposta e ajusta sessao["status"].
+
+_HANDLERS_ESTADO = {}
+
+
+def _estado(*estados):
+    def registrar(handler):
+        for estado in estados:
+            _HANDLERS_ESTADO[estado] = handler
+        return handler
+    return registrar
+
+
+def _tabela_opcoes(opcoes):
+    """{ação: palavras} -> {palavra: ação}, para escolher a opção de um menu com uma única busca."""
+    return {palavra: acao for acao, palavras in opcoes.items() for palavra in palavras}
+
+
+def _resposta_encerramento():
+    return {
+        "reply": "Conversa encerrada. Se precisar de algo, estamos à disposição! 👋\n\nGostaria de responder a um breve questionário de avaliação?",
+        "buttons": [{"label": "Sim", "value": "sim"}, {"label": "Não", "value": "nao"}]
+    }
+
+
+def _resposta_de_erro(tipo, resposta):
+    """
+    Resposta do bot a uma mensagem que ele não conseguiu atender; o evento da mensagem e o histórico
+    da conversa (MARCADOR_ERRO) saem marcados com o erro.
+    """
+    _erro_resposta.tipo = tipo
+    turn_events.marcar_erro(tipo)
+    return resposta
+
+
+def _estado_desconhecido(session_id, sessao, message_body, stream):
+    return _resposta_de_erro("unknown_state", "Desculpe, não entendi o que você quis dizer.")
+
+
+@_estado(None, ESTADO_AGUARDANDO)
+def _estado_inicio(session_id, sessao, message_body, stream):
+    return iniciar_fluxo_aleatorio(session_id, sessao, message_body, stream)
+
+
+@_estado(ESTADO_INTELIGENTE)
+def _estado_inteligente(session_id, sessao, message_body, stream):
+    return responder_com_gemini(session_id, sessao, message_body, stream)
+
+
+# Menu principal
+
+def _opcao_ver_cardapio(session_id, sessao):
+    sessao["status"] = ESTADO_FAZER_PEDIDO
+    return catalogo.catalogo.texto_cardapio
+
+
+def _opcao_fazer_pedido(session_id, sessao):
+    sessao["status"] = ESTADO_FAZER_PEDIDO
+    return "Por favor, informe o número do item que deseja pedir ou digite *9* para voltar ao menu principal e ver o cardápio."
+
+
+def _opcao_ver_pedido(session_id, sessao):
+    if not sessao["customer_data"]["pedido"]:
+        return f"Você ainda não realizou um pedido.\n\n{MENU_PRINCIPAL_TEXT}"
+    sessao["status"] = ESTADO_MODIFICAR_PEDIDO
+    return f"{catalogo.resumo_pedido(sessao['customer_data'])}\n\n{MENU_MODIFICAR_PEDIDO_TEXT}"
+
+
+def _opcao_cancelar_atendimento(session_id, sessao):
+    sessao["status"] = ESTADO_AVALIACAO
+    return _resposta_encerramento()
+
+
+OPCOES_MENU_PRINCIPAL = _tabela_opcoes({
+    _opcao_ver_cardapio: ("1", "um", "cardapio", "cardápio", "ver cardapio", "ver cardápio", "menu"),
+    _opcao_fazer_pedido: ("2", "dois", "pedido", "fazer pedido", "pedir", "fazer um pedido"),
+    _opcao_ver_pedido: ("3", "três", "ver pedido", "meu pedido", "acompanhar", "status"),
+    _opcao_cancelar_atendimento: ("4", "quatro", "cancelar", "cancelar atendimento"),
+})
+
+
+@_estado(ESTADO_TRADICIONAL)
+def _estado_tradicional(session_id, sessao, message_body, stream):
+    if sessao["customer_data"] is None:
+        sessao["customer_data"] = catalogo.novo_pedido()
+    opcao = OPCOES_MENU_PRINCIPAL.get(message_body)
+    if opcao is None:
         # Nenhuma opção válida
-        else:
-            return fluxo_tradicional(session_id, message_body)
+        return _resposta_de_erro("invalid_option", fluxo_tradicional(session_id, sessao, message_body))
+    return opcao(session_id, sessao)
 
-    elif current_status == "fazer_pedido":
-        if message_body in ["9", "nove", "voltar"]:
-            return fluxo_tradicional(session_id, message_body)
-        try:
-            item = int(message_body)
-            cardapio = {1:("Pamonha Doce",10.00), 2:("Pamonha Salgada",10.00), 3:("Pamonha Apimentada",12.00), 4:("Curau Clássico",8.00), 5:("Milho Cozido",6.00), 6:("Suco",5.00), 7:("Coca-Cola Lata",6.00), 8:("Água Mineral",3.00)}
-            if item in cardapio:
-                response = f"Você escolheu {cardapio[item][0]} por R$ {cardapio[item][1]:.2f}.\nQuantas unidades deseja?"
-                customer_data[session_id]["pedido"].append({"item": cardapio[item][0], "quantidade": 0, "preco": cardapio[item][1]})
-                chats[session_id] = ChatSession("capturar_quantidade")
-            else:
-                response = "Não temos um item com esse número. Por favor, escolha um item válido do cardápio ou digite *9* para voltar ao menu principal."
-        except ValueError:
-            response = "Por favor, escolha um item válido do cardápio ou digite *9* para voltar ao menu principal."
-        
-        historico_conversas[session_id].append(formatar_historico("Bot", response))
-        return response
 
-    elif current_status == "capturar_quantidade":
-        try:
-            quantidade = int(message_body)
-            if quantidade > 0:
-                ultimo_item = customer_data[session_id]["pedido"][-1]
-                total_item = ultimo_item["preco"] * quantidade
-                customer_data[session_id]["valor_total"] += total_item
-                customer_data[session_id]["pedido"][-1]["quantidade"] = quantidade
-                
-                response = {
-                    "reply": f"Adicionado {quantidade}x {ultimo_item['item']} ao pedido.\nDeseja adicionar mais itens?",
-                    "buttons": [{"label": "Sim", "value": "sim"}, {"label": "Não", "value": "nao"}]
-                }
-                chats[session_id] = ChatSession("adicionar_itens")
-            else:
-                response = "Quantidade inválida. Por favor, insira um número maior que zero."
-        except ValueError:
-            response = "Por favor, informe apenas a quantidade em números."
-
-        response_text = response['reply'] if isinstance(response, dict) else response
-        historico_conversas[session_id].append(formatar_historico("Bot", response_text))
-        return response
-    
-    elif current_status == "adicionar_itens":
-        if message_body in ["sim", "s", "quero", "claro", "pode", "pode ser"]:
-            response = "Por favor, escolha o próximo item do cardápio."
-            chats[session_id] = ChatSession("fazer_pedido")
-        elif message_body in ["não", "nao", "n", "nao quero", "não quero", "finalizar", "fechar"]:
-            response = "Qual o seu nome? Só para deixar registrado aqui no sistema."
-            chats[session_id] = ChatSession("capturar_nome")
-        else:
-
-            response = {
-                "reply": "Desculpa, não entendi. Deseja adicionar mais itens?",
-                "buttons": [{"label": "Sim", "value": "sim"}, {"label": "Não", "value": "nao"}]
-            }
-        
-        response_text = response['reply'] if isinstance(response, dict) else response
-        historico_conversas[session_id].append(formatar_historico("Bot", response_text))
-        return response
-
-    elif current_status == "capturar_nome":
-        customer_data[session_id]["nome"] = message_body.title()
-        aviso = f"Obrigado, {customer_data[session_id]['nome']}! Seu pedido foi recebido com sucesso! Obrigado por escolher a Pamonha Express! 😊"
-        response = f"{aviso}\n\n{MENU_PRINCIPAL_TEXT}"
-        chats[session_id] = ChatSession("tradicional")
-        
-        historico_conversas[session_id].append(formatar_historico("Bot", response))
-        return response
-
-    elif current_status == "consultar_pedido":
-        response = "Desculpe, ainda não implementamos a consulta de pedidos."
-        chats[session_id] = ChatSession("tradicional")
-        historico_conversas[session_id].append(formatar_historico("Bot", response))
-        return response
-
-    elif current_status == "modificar_pedido":
-        if message_body in ["1", "um", "alterar", "quantidade", "alterar quantidade"]:
-            pedido_atual = customer_data[session_id]["pedido"]
-            response_parts = ["*Qual item você deseja alterar a quantidade?*"]
-            for i, item in enumerate(pedido_atual, start=1):
-                response_parts.append(f"{i}. {item['quantidade']}x {item['item']}")
-            response = "\n".join(response_parts)
-            chats[session_id] = ChatSession("alterar_quantidade_item")
-            historico_conversas[session_id].append(formatar_historico("Bot", response))
-            return response
-        elif message_body in ["2", "dois", "excluir", "remover", "excluir item"]:
-            pedido_atual = customer_data[session_id]["pedido"]
-            response_parts = ["*Qual item você deseja excluir do pedido?*"]
-            for i, item in enumerate(pedido_atual, start=1):
-                response_parts.append(f"{i}. {item['item']}")
-            response = "\n".join(response_parts)
-            chats[session_id] = ChatSession("excluir_item")
-            historico_conversas[session_id].append(formatar_historico("Bot", response))
-            return response
-        elif message_body in ["3", "três", "cancelar", "cancelar tudo", "cancelar pedido"]:
-            customer_data[session_id]["pedido"] = []
-            customer_data[session_id]["valor_total"] = 0.0
-            response = "Seu pedido foi cancelado com sucesso."
-            chats[session_id] = ChatSession("tradicional")
-            historico_conversas[session_id].append(formatar_historico("Bot", response))
-            return f"{response}\n\n{MENU_PRINCIPAL_TEXT}"
-        elif message_body in ["4", "quatro", "voltar", "menu principal"]:
-            return fluxo_tradicional(session_id, message_body)
-        else:
-            return f"Opção inválida.\n{MENU_MODIFICAR_PEDIDO_TEXT}"
-
-    elif current_status == "excluir_item":
-        try:
-            item_index = int(message_body) - 1
-            pedido_atual = customer_data[session_id]["pedido"]
-            if 0 <= item_index < len(pedido_atual):
-                item_removido = pedido_atual.pop(item_index)
-                novo_total = sum(item['preco'] * item['quantidade'] for item in pedido_atual)
-                customer_data[session_id]["valor_total"] = novo_total
-                response = f"Item '{item_removido['item']}' removido do seu pedido."
-                if not pedido_atual:
-                    chats[session_id] = ChatSession("tradicional")
-                    historico_conversas[session_id].append(formatar_historico("Bot", response))
-                    return f"{response}\nSeu pedido agora está vazio.\n\n{MENU_PRINCIPAL_TEXT}"
-                else:
-                    chats[session_id] = ChatSession("modificar_pedido")
-                    historico_conversas[session_id].append(formatar_historico("Bot", response))
-                    return f"{response}{MENU_MODIFICAR_PEDIDO_TEXT}"
-            else:
-                return "Número inválido. Por favor, escolha um número da lista."
-        except ValueError:
-            return "Por favor, informe um número válido."
-            
-    elif current_status == "alterar_quantidade_item":
-        try:
-            item_index = int(message_body) - 1
-            pedido_atual = customer_data[session_id]["pedido"]
-            if 0 <= item_index < len(pedido_atual):
-                customer_data[session_id]["item_para_alterar"] = item_index
-                item_nome = pedido_atual[item_index]["item"]
-                chats[session_id] = ChatSession("alterar_quantidade_valor")
-                response = f"Qual a nova quantidade para *{item_nome}*?"
-                
-                historico_conversas[session_id].append(formatar_historico("Bot", response))
-                return response
-            else:
-                response = "Número inválido. Por favor, escolha um número da lista."
-        except ValueError:
-            response = "Por favor, informe um número válido."
-        
-        # Log e return para os casos de erro
-        historico_conversas[session_id].append(formatar_historico("Bot", response))
-        return response
+# Pedido
+
+@_estado(ESTADO_FAZER_PEDIDO)
+def _estado_fazer_pedido(session_id, sessao, message_body, stream):
+    if message_body in RESPOSTAS_VOLTAR:
+        return fluxo_tradicional(session_id, sessao, message_body)
+    try:
+        item = catalogo.catalogo.item(int(message_body))
+    except ValueError:
+        return _resposta_de_erro("invalid_input", "Por favor, escolha um item válido do cardápio ou digite *9* para voltar ao menu principal.")
+    if item is None:
+        return _resposta_de_erro("invalid_item", "Não temos um item com esse número. Por favor, escolha um item válido do cardápio ou digite *9* para voltar ao menu principal.")
+    # O item só entra no pedido quando a quantidade for informada
+    sessao["customer_data"]["item_pendente"] = item.numero
+    sessao["status"] = ESTADO_CAPTURAR_QUANTIDADE
+    return f"Você escolheu {item.nome} por R$ {item.preco:.2f}.\nQuantas unidades deseja?"
+
+
+@_estado(ESTADO_CAPTURAR_QUANTIDADE)
+def _estado_capturar_quantidade(session_id, sessao, message_body, stream):
+    try:
+        quantidade = int(message_body)
+    except ValueError:
+        return _resposta_de_erro("invalid_input", "Por favor, informe apenas a quantidade em números.")
+    if quantidade <= 0:
+        return _resposta_de_erro("invalid_quantity", "Quantidade inválida. Por favor, insira um número maior que zero.")
+    item = catalogo.catalogo.item(sessao["customer_data"].pop("item_pendente", None))
+    if item is None:
+        sessao["status"] = ESTADO_FAZER_PEDIDO
+        return _resposta_de_erro("invalid_item", "Por favor, escolha um item válido do cardápio ou digite *9* para voltar ao menu principal.")
+    catalogo.adicionar_item(sessao["customer_data"], item, quantidade)
+    sessao["status"] = ESTADO_ADICIONAR_ITENS
+    return {
+        "reply": f"Adicionado {quantidade}x {item.nome} ao pedido.\nDeseja adicionar mais itens?",
+        "buttons": [{"label": "Sim", "value": "sim"}, {"label": "Não", "value": "nao"}]
+    }
+
+
+@_estado(ESTADO_ADICIONAR_ITENS)
+def _estado_adicionar_itens(session_id, sessao, message_body, stream):
+    if message_body in RESPOSTAS_SIM:
+        sessao["status"] = ESTADO_FAZER_PEDIDO
+        return "Por favor, escolha o próximo item do cardápio."
+    if message_body in RESPOSTAS_FINALIZAR:
+        sessao["status"] = ESTADO_CAPTURAR_NOME
+        return "Qual o seu nome? Só para deixar registrado aqui no sistema."
+    return _resposta_de_erro("invalid_option", {
+        "reply": "Desculpa, não entendi. Deseja adicionar mais itens?",
+        "buttons": [{"label": "Sim", "value": "sim"}, {"label": "Não", "value": "nao"}]
+    })
+
+
+@_estado(ESTADO_CAPTURAR_NOME)
+def _estado_capturar_nome(session_id, sessao, message_body, stream):
+    sessao["customer_data"]["nome"] = message_body.title()
+    sessao["status"] = ESTADO_TRADICIONAL
+    aviso = f"Obrigado, {sessao['customer_data']['nome']}! Seu pedido foi recebido com sucesso! Obrigado por escolher a Pamonha Express! 😊"
+    return f"{aviso}\n\n{MENU_PRINCIPAL_TEXT}"
+
+
+@_estado(ESTADO_CONSULTAR_PEDIDO)
+def _estado_consultar_pedido(session_id, sessao, message_body, stream):
+    sessao["status"] = ESTADO_TRADICIONAL
+    return "Desculpe, ainda não implementamos a consulta de pedidos."
+
+
+# Modificação do pedido
+
+def _opcao_alterar_quantidade(session_id, sessao):
+    response_parts = ["*Qual item você deseja alterar a quantidade?*"]
+    for i, item in enumerate(sessao["customer_data"]["pedido"], start=1):
+        response_parts.append(f"{i}. {item['quantidade']}x {item['item']}")
+    sessao["status"] = ESTADO_ALTERAR_QUANTIDADE_ITEM
+    return "\n".join(response_parts)
+
+
+def _opcao_excluir_item(session_id, sessao):
+    response_parts = ["*Qual item você deseja excluir do pedido?*"]
+    for i, item in enumerate(sessao["customer_data"]["pedido"], start=1):
+        response_parts.append(f"{i}. {item['item']}")
+    sessao["status"] = ESTADO_EXCLUIR_ITEM
+    return "\n".join(response_parts)
+
+
+def _opcao_cancelar_pedido(session_id, sessao):
+    catalogo.cancelar_pedido(sessao["customer_data"])
+    sessao["status"] = ESTADO_TRADICIONAL
+    return f"Seu pedido foi cancelado com sucesso.\n\n{MENU_PRINCIPAL_TEXT}"
+
+
+def _opcao_voltar_menu(session_id, sessao):
+    return fluxo_tradicional(session_id, sessao, None)
+
+
+OPCOES_MODIFICAR_PEDIDO = _tabela_opcoes({
+    _opcao_alterar_quantidade: ("1", "um", "alterar", "quantidade", "alterar quantidade"),
+    _opcao_excluir_item: ("2", "dois", "excluir", "remover", "excluir item"),
+    _opcao_cancelar_pedido: ("3", "três", "cancelar", "cancelar tudo", "cancelar pedido"),
+    _opcao_voltar_menu: ("4", "quatro", "voltar", "menu principal"),
+})
+
+
+@_estado(ESTADO_MODIFICAR_PEDIDO)
+def _estado_modificar_pedido(session_id, sessao, message_body, stream):
+    opcao = OPCOES_MODIFICAR_PEDIDO.get(message_body)
+    if opcao is None:
+        return _resposta_de_erro("invalid_option", f"Opção inválida.\n{MENU_MODIFICAR_PEDIDO_TEXT}")
+    return opcao(session_id, sessao)
+
+
+@_estado(ESTADO_EXCLUIR_ITEM)
+def _estado_excluir_item(session_id, sessao, message_body, stream):
+    try:
+        item_index = int(message_body) - 1
+    except ValueError:
+        return _resposta_de_erro("invalid_input", "Por favor, informe um número válido.")
+    pedido_atual = sessao["customer_data"]["pedido"]
+    if not 0 <= item_index < len(pedido_atual):
+        return _resposta_de_erro("invalid_option", "Número inválido. Por favor, escolha um número da lista.")
+    item_removido = catalogo.remover_item(sessao["customer_data"], item_index)
+    response = f"Item '{item_removido['item']}' removido do seu pedido."
+    if not pedido_atual:
+        sessao["status"] = ESTADO_TRADICIONAL
+        return f"{response}\nSeu pedido agora está vazio.\n\n{MENU_PRINCIPAL_TEXT}"
+    sessao["status"] = ESTADO_MODIFICAR_PEDIDO
+    return f"{response}{MENU_MODIFICAR_PEDIDO_TEXT}"
+
+
+@_estado(ESTADO_ALTERAR_QUANTIDADE_ITEM)
+def _estado_alterar_quantidade_item(session_id, sessao, message_body, stream):
+    try:
+        item_index = int(message_body) - 1
+    except ValueError:
+        return _resposta_de_erro("invalid_input", "Por favor, informe um número válido.")
+    pedido_atual = sessao["customer_data"]["pedido"]
+    if not 0 <= item_index < len(pedido_atual):
+        return _resposta_de_erro("invalid_option", "Número inválido. Por favor, escolha um número da lista.")
+    sessao["customer_data"]["item_para_alterar"] = item_index
+    sessao["status"] = ESTADO_ALTERAR_QUANTIDADE_VALOR
+    return f"Qual a nova quantidade para *{pedido_atual[item_index]['item']}*?"
+
+
+@_estado(ESTADO_ALTERAR_QUANTIDADE_VALOR)
+def _estado_alterar_quantidade_valor(session_id, sessao, message_body, stream):
+    try:
+        nova_quantidade = int(message_body)
+    except ValueError:
+        return _resposta_de_erro("invalid_input", "Por favor, informe um número válido para a quantidade.")
+    item_index = sessao["customer_data"]["item_para_alterar"]
+    sessao["status"] = ESTADO_MODIFICAR_PEDIDO
+    if nova_quantidade <= 0:
+        item_removido = catalogo.remover_item(sessao["customer_data"], item_index)
+        return f"Item '{item_removido['item']}' removido do seu pedido.{MENU_MODIFICAR_PEDIDO_TEXT}"
+    catalogo.alterar_quantidade(sessao["customer_data"], item_index, nova_quantidade)
+    return f"Quantidade alterada com sucesso!\n\n{catalogo.resumo_pedido(sessao['customer_data'])}\n{MENU_MODIFICAR_PEDIDO_TEXT}"
+
+
+# Avaliação e questionário
+
+@_estado(ESTADO_AVALIACAO)
+def _estado_avaliacao(session_id, sessao, message_body, stream):
+    # Caminho para iniciar o questionário
+    if message_body in RESPOSTAS_SIM:
+        return iniciar_questionario(session_id, sessao)
+    # Caminho para NÃO responder o questionário
+    if message_body in RESPOSTAS_NAO:
+        sessao["status"] = ESTADO_AGUARDANDO
+        return "Tudo bem! Agradecemos pelo seu tempo. Até logo! 👋\n\n Para iniciar um novo atendimento, envie uma nova mensagem."
+    # Caminho para resposta inválida
+    return _resposta_de_erro("invalid_option", {
+        "reply": "Desculpe, não entendi. Por favor, responda com 'Sim' ou 'Não'.",
+        "buttons": [
+            {"label": "Sim, quero responder", "value": "sim"},
+            {"label": "Não, obrigado(a)", "value": "nao"}
+        ]
+    })
+
+
+@_estado(ESTADO_QUESTIONARIO_1)
+def _estado_questionario_1(session_id, sessao, message_body, stream):
+    sessao["respostas_questionario"] = {"Pergunta 1": message_body}
+    sessao["status"] = ESTADO_QUESTIONARIO_2
+    return {
+        "reply": "Pergunta 2: Você conseguiu realizar o que desejava nesta conversa (ex: ver o cardápio, fazer um pedido, etc.)?",
+        "buttons": [
+            {"label": "Sim, consegui", "value": "Sim, consegui"},
+            {"label": "Parcialmente", "value": "Parcialmente"},
+            {"label": "Não consegui", "value": "Não consegui"}
+        ]
+    }
+
+
+@_estado(ESTADO_QUESTIONARIO_2)
+def _estado_questionario_2(session_id, sessao, message_body, stream):
+    sessao["respostas_questionario"]["Pergunta 2"] = message_body
+    sessao["status"] = ESTADO_QUESTIONARIO_3
+    return {
+        "reply": "Pergunta 3: Em um cenário real, você iria preferir utilizar este chatbot ou um atendimento humano?",
+        "buttons": [
+            {"label": "Usaria este chatbot ou um semelhante", "value": "Usaria o chatbot"},
+            {"label": "Ainda prefiro atendimento humano", "value": "Prefiro humano"}
+        ]
+    }
+
+
+@_estado(ESTADO_QUESTIONARIO_3)
+def _estado_questionario_3(session_id, sessao, message_body, stream):
+    sessao["respostas_questionario"]["Pergunta 3"] = message_body
+    sessao["status"] = ESTADO_QUESTIONARIO_4
+    return "Para finalizar, você tem alguma sugestão, crítica ou feedback sobre sua experiência?"
+
+
+@_estado(ESTADO_QUESTIONARIO_4)
+def _estado_questionario_4(session_id, sessao, message_body, stream):
+    sessao["respostas_questionario"]["Pergunta 4 (Feedback)"] = message_body
+    salvar_respostas_questionario(session_id, sessao)
+    sessao["status"] = ESTADO_AGUARDANDO
+    return "Obrigado por suas respostas e pelo seu feedback! Sua opinião é muito importante. Até logo! 👋\n\n Para iniciar um novo atendimento, envie uma nova mensagem."
 
-    elif current_status == "alterar_quantidade_valor":
-        try:
-            nova_quantidade = int(message_body)
-            item_index = customer_data[session_id]["item_para_alterar"]
-            if nova_quantidade > 0:
-                customer_data[session_id]["pedido"][item_index]["quantidade"] = nova_quantidade
-                novo_total = sum(item['preco'] * item['quantidade'] for item in customer_data[session_id]["pedido"])
-                customer_data[session_id]["valor_total"] = novo_total
-                response = "Quantidade alterada com sucesso!"
-                chats[session_id] = ChatSession("modificar_pedido")
-                pedido_atual = customer_data[session_id]["pedido"]
-                response_parts = ["*Seu pedido atual:*"]
-                for item in pedido_atual:
-                    response_parts.append(f"- {item['quantidade']}x {item['item']}")
-                response_parts.append(f"\n*Valor Total: R$ {novo_total:.2f}*")
-                pedido_formatado = "\n".join(response_parts)
-                historico_conversas[session_id].append(formatar_historico("Bot", response))
-                return f"{response}\n\n{pedido_formatado}\n{MENU_MODIFICAR_PEDIDO_TEXT}"
-            else:
-                item_removido = customer_data[session_id]["pedido"].pop(item_index)
-                novo_total = sum(item['preco'] * item['quantidade'] for item in customer_data[session_id]["pedido"])
-                customer_data[session_id]["valor_total"] = novo_total
-                chats[session_id] = ChatSession("modificar_pedido")
-                return f"Item '{item_removido['item']}' removido do seu pedido.{MENU_MODIFICAR_PEDIDO_TEXT}"
-        except ValueError:
-            return "Por favor, informe um número válido para a quantidade."
-
-    elif current_status == "avaliacao":
-        # Caminho para iniciar o questionário
-        if message_body in ["sim", "s", "quero", "claro", "pode", "pode ser"]:
-            return iniciar_questionario(session_id)
-        
-        # Caminho para NÃO responder o questionário
-        elif message_body in ["não", "nao", "n", "nao quero", "não quero"]:
-            response = "Tudo bem! Agradecemos pelo seu tempo. Até logo! 👋\n\n Para iniciar um novo atendimento, envie uma nova mensagem."
-            chats[session_id] = ChatSession("aguardando_interacao")
-            historico_conversas[session_id].append(formatar_historico("Bot", response))
-            return response
-        
-        # Caminho para resposta inválida
-        else:
-            response_data = {
-                "reply": "Desculpe, não entendi. Por favor, responda com 'Sim' ou 'Não'.",
-                "buttons": [
-                    {"label": "Sim, quero responder", "value": "sim"},
-                    {"label": "Não, obrigado(a)", "value": "nao"}
-                ]
-            }            
-            return response_data
-
-    elif current_status.startswith("questionario"):
-        if current_status == "questionario_1":
-            respostas_questionario[session_id] = {"Pergunta 1": message_body}
-            chats[session_id] = ChatSession("questionario_2")
-            return {
-                "reply": "Pergunta 2: Você conseguiu realizar o que desejava nesta conversa (ex: ver o cardápio, fazer um pedido, etc.)?",
-                "buttons": [
-                    {"label": "Sim, consegui", "value": "Sim, consegui"},
-                    {"label": "Parcialmente", "value": "Parcialmente"},
-                    {"label": "Não consegui", "value": "Não consegui"}
-                ]
-            }
-        elif current_status == "questionario_2":
-            respostas_questionario[session_id]["Pergunta 2"] = message_body
-            chats[session_id] = ChatSession("questionario_3")
-
-            return {
-                "reply": "Pergunta 3: Em um cenário real, você iria preferir utilizar este chatbot ou um atendimento humano?",
-                "buttons": [
-                    {"label": "Usaria este chatbot ou um semelhante", "value": "Usaria o chatbot"},
-                    {"label": "Ainda prefiro atendimento humano", "value": "Prefiro humano"}
-                ]
-            }
-        elif current_status == "questionario_3":
-            respostas_questionario[session_id]["Pergunta 3"] = message_body
-            chats[session_id] = ChatSession("questionario_4")
-            return "Para finalizar, você tem alguma sugestão, crítica ou feedback sobre sua experiência?"
-        elif current_status == "questionario_4":
-            respostas_questionario[session_id]["Pergunta 4 (Feedback)"] = message_body
-            salvar_respostas_questionario(session_id)
-            
-            chats[session_id] = ChatSession("aguardando_interacao")
-            
-            return "Obrigado por suas respostas e pelo seu feedback! Sua opinião é muito importante. Até logo! 👋\n\n Para iniciar um novo atendimento, envie uma nova mensagem."
-    
-    elif current_status == "inteligente":
-        try:
-            response_text = send_message_to_gemini(session_id, message_body)
-            historico_conversas[session_id].append(formatar_historico("Bot", response_text))
-            return response_text
-        except Exception as e:
-            logging.error(f"Erro ao processar mensagem com Gemini: {e}")
-            return "Um momento, por favor, estou com uma instabilidade no sistema."
-    return "Desculpe, não entendi o que você quis dizer."
 
 def salvar_historico_conversa(session_id, historico, tipo_chatbot):
     try:        
         project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
                 
         log_conversations_dir = os.path.join(project_root, 'logs', 'conversations')
-        os.makedirs(log_conversations_dir, exist_ok=True)
         
         nome_arquivo = f"{session_id}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt"
         caminho_arquivo_conversa = os.path.join(log_conversations_dir, nome_arquivo)
 
-        with open(caminho_arquivo_conversa, "w", encoding="utf-8") as arquivo:
-            arquivo.write(f"Tipo de Atendimento: {tipo_chatbot}\n\n")
-            arquivo.write("\n".join(historico))
-        logging.info(f"Histórico da conversa salvo em: {caminho_arquivo_conversa}")
-        
-        log_main_dir = os.path.join(project_root, 'logs')
-        log_list_path = os.path.join(log_main_dir, "log-list.json")
-
-        log_list = []
-        if os.path.exists(log_list_path):
-            with open(log_list_path, "r", encoding="utf-8") as f:
-                log_list = json.load(f)
-
-        log_list.insert(0, nome_arquivo)
-
-        with open(log_list_path, "w", encoding="utf-8") as f:
-            json.dump(log_list, f, indent=2, ensure_ascii=False)
-        logging.info("Arquivo de índice 'log-list.json' atualizado com sucesso.")
+        # O conteúdo é montado agora e a gravação em disco fica com a thread do log_writer
+        conteudo = f"Tipo de Atendimento: {tipo_chatbot}\n\n" + "\n".join(historico)
+        log_writer.enfileirar(caminho_arquivo_conversa, conteudo, log_index.INDICE_CONVERSAS, nome_arquivo)
+        logging.info(f"Histórico da conversa enfileirado para gravação em: {caminho_arquivo_conversa}")
 
     except Exception as e:
         logging.error(f"Erro ao salvar histórico ou atualizar índice: {e}")
         
-def salvar_respostas_questionario(session_id):
+def salvar_respostas_questionario(session_id, sessao):
     try:        
         project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         diretorio_logs = os.path.join(project_root, "logs", "questionarios")
-        os.makedirs(diretorio_logs, exist_ok=True)
         
         nome_arquivo = f"questionario_{session_id}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt"
         caminho_arquivo = os.path.join(diretorio_logs, nome_arquivo)
-        tipo_chatbot = tipo_atendimento.get(session_id, "Desconhecido")
-
-        with open(caminho_arquivo, "w", encoding="utf-8") as arquivo:
-            arquivo.write(f"Tipo de Atendimento: {tipo_chatbot}\n")
-            arquivo.write("Respostas do Questionário:\n\n")
-            perguntas = [
-                "Pergunta 1: Em uma escala de 1 a 5, como você avalia sua satisfação nessa conversa?",
-                "Pergunta 2: Você conseguiu realizar o que desejava nesta conversa (ex: ver o cardápio, fazer um pedido, etc.)?",
-                "Pergunta 3: Em um cenário real, você iria preferir utilizar este chatbot ou um atendimento humano?",
-                "Pergunta 4 (Feedback): Para finalizar, você tem alguma sugestão, crítica ou feedback para nos dar sobre sua experiência?"
-            ]
-            for i, pergunta in enumerate(perguntas, start=1):
-                key = f"Pergunta {i}" if i <= 3 else "Pergunta 4 (Feedback)"
-                resposta = respostas_questionario[session_id].get(key, "Não respondida")
-                arquivo.write(f"{pergunta}\nResposta: {resposta}\n\n")
-
-        logging.info(f"Respostas do questionário salvas em: {caminho_arquivo}")
-        
-        log_main_dir = os.path.join(project_root, 'logs')
-        log_list_path = os.path.join(log_main_dir, "questionario-list.json")
-
-        log_list = []
-
-        if os.path.exists(log_list_path):
-            with open(log_list_path, "r", encoding="utf-8") as f:
-                log_list = json.load(f)
-        
-        log_list.insert(0, nome_arquivo)
+        tipo_chatbot = sessao["tipo_atendimento"] or "Desconhecido"
+
+        partes = [f"Tipo de Atendimento: {tipo_chatbot}\n", "Respostas do Questionário:\n\n"]
+        perguntas = [
+            "Pergunta 1: Em uma escala de 1 a 5, como você avalia sua satisfação nessa conversa?",
+            "Pergunta 2: Você conseguiu realizar o que desejava nesta conversa (ex: ver o cardápio, fazer um pedido, etc.)?",
+            "Pergunta 3: Em um cenário real, você iria preferir utilizar este chatbot ou um atendimento humano?",
+            "Pergunta 4 (Feedback): Para finalizar, você tem alguma sugestão, crítica ou feedback para nos dar sobre sua experiência?"
+        ]
+        for i, pergunta in enumerate(perguntas, start=1):
+            key = f"Pergunta {i}" if i <= 3 else "Pergunta 4 (Feedback)"
+            resposta = sessao["respostas_questionario"].get(key, "Não respondida")
+            partes.append(f"{pergunta}\nResposta: {resposta}\n\n")
 
-        # Salva a lista atualizada de volta no arquivo JSON
-        with open(log_list_path, "w", encoding="utf-8") as f:
-            json.dump(log_list, f, indent=2, ensure_ascii=False)
-        
-        logging.info("Arquivo de índice 'questionario-list.json' atualizado.")
+        log_writer.enfileirar(caminho_arquivo, "".join(partes), log_index.INDICE_QUESTIONARIOS, nome_arquivo)
+        logging.info(f"Respostas do questionário enfileiradas para gravação em: {caminho_arquivo}")
         
-        if session_id in respostas_questionario: del respostas_questionario[session_id]
-        if session_id in tipo_atendimento: del tipo_atendimento[session_id]
-        if session_id in historico_conversas: del historico_conversas[session_id]
+        sessao["respostas_questionario"] = None
+        sessao["tipo_atendimento"] = None
+        sessao["historico"] = []
+        sessao["historico_salvo"] = 0
         
-        chats[session_id] = ChatSession("aguardando_interacao")
+        sessao["status"] = ESTADO_AGUARDANDO
 
     except Exception as e:
         logging.error(f"Erro ao salvar respostas do questionário ou atualizar índice: {e}")
\ No newline at end of file
@@ -1,9 +1,101 @@
+import gzip
+import hashlib
+import hmac
+import json
 import logging
-from flask import Blueprint, request, jsonify
-from .utils.whatsapp_utils import process_web_message
+import time
+from flask import Blueprint, Response, g, request, jsonify, send_file, stream_with_context
+from .utils.whatsapp_utils import process_web_message, roteador_intencoes, sessoes, MENSAGEM_SESSAO_OCUPADA
+from .utils.session_locks import travas_sessao
+from .utils.idempotency import tabela_idempotencia
+from .utils import gemini_client
+from .utils.gemini_executor import executor_gemini, GeminiSobrecarregado
+from .utils.response_cache import cache_respostas
+from .utils.log_writer import log_writer
+from .utils.lifecycle import ciclo_de_vida, SHUTDOWN_RETRY_AFTER
+from .utils import log_summary
+from .utils.log_summary import catalogo_logs
+from .utils import log_search
+from .utils.log_search import indice_busca
+from .utils.turn_events import registro_eventos
+from .utils.metrics import registro, requisicoes_http
+from .utils import profiling
 
 webhook_blueprint = Blueprint("webhook", __name__)
 
+# Rotas cujas mensagens são esperadas pelo desligamento gracioso (e recusadas durante ele)
+_ROTAS_CHAT = frozenset({"webhook.handle_chat", "webhook.handle_chat_stream"})
+
+
+@webhook_blueprint.before_request
+def _iniciar_mensagem():
+    if request.method != "POST" or request.endpoint not in _ROTAS_CHAT:
+        return None
+    if not ciclo_de_vida.iniciar_requisicao():
+        response = jsonify({"status": "error", "message": "O servidor está reiniciando. Tente novamente em instantes."})
+        response.headers["Retry-After"] = str(SHUTDOWN_RETRY_AFTER)
+        return response, 503
+    g.mensagem_em_andamento = True
+    return None
+
+
+@webhook_blueprint.teardown_request
+def _finalizar_mensagem(_erro):
+    # Em streaming, o contexto da requisição (e este teardown) só termina depois do último trecho
+    if g.pop("mensagem_em_andamento", False):
+        ciclo_de_vida.finalizar_requisicao()
+
+
+@webhook_blueprint.after_request
+def _contar_requisicao(response):
+    rota = request.url_rule.rule if request.url_rule is not None else "desconhecida"
+    requisicoes_http.incrementar(rota, request.method, str(response.status_code))
+    medicao = g.get("medicao")
+    if medicao is not None:
+        # Etapas da requisição, visíveis na aba Network das ferramentas de desenvolvedor do navegador
+        response.headers["Server-Timing"] = medicao.server_timing()
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+def _processar(session_id, user_message, stream=False):
+    """process_web_message com a medição de etapas, quando o profiling está ligado (PROFILING ou X-Profile)."""
+    with profiling.requisicao(profiling.ativo_para(request.headers), session_id) as medicao:
+        g.medicao = medicao
+        return process_web_message(session_id, user_message, stream=stream)
+
+
+# Tamanho máximo do messageId enviado pelo cliente
+_MAX_MESSAGE_ID = 128
+
+
+def _message_id_valido(message_id):
+    return message_id is None or (isinstance(message_id, str) and 0 < len(message_id) <= _MAX_MESSAGE_ID)
+
+
+def _resposta_repetida(entrada):
+    """Resposta da mensagem original para um reenvio com o mesmo messageId, ou None se não há uma."""
+    resposta = tabela_idempotencia.aguardar(entrada)
+    if resposta is None:
+        logging.warning("Reenvio de mensagem sem resposta da original (falhou ou ainda em andamento).")
+    return resposta
+
+
+def _envelope(response_data):
+    # Se for texto simples, envolve no formato padrão {"reply": "..."}
+    return response_data if isinstance(response_data, dict) else {"reply": response_data}
+
+
+_ERRO_REPETIDA = {"status": "error", "message": "A mensagem original ainda não terminou de ser processada"}
+
+
+def _resposta_sobrecarga(erro):
+    """429 com Retry-After quando o executor do Gemini está cheio (a mensagem não foi processada)."""
+    logging.warning(f"Mensagem recusada: {erro}")
+    response = jsonify({"status": "error", "message": "Muitas mensagens no momento. Tente novamente em instantes."})
+    response.headers["Retry-After"] = str(erro.retry_after)
+    return response, 429
+
 @webhook_blueprint.route("/chat", methods=["POST", "OPTIONS"])
 def handle_chat():    
     if request.method == "OPTIONS":
@@ -11,7 +103,7 @@ def handle_chat():
         #response.headers.add("Access-Control-Allow-Origin", "https://DOMINIO-FRONT-END")
         response.headers.add("Access-Control-Allow-Origin", "*")
         response.headers.add("Access-Control-Allow-Methods", "POST, OPTIONS")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type, X-Profile")
         return response, 200
 
     # Lógica para as requisições POST
@@ -19,20 +111,398 @@ def handle_chat():
         data = request.get_json()
         session_id = data.get("sessionId")
         user_message = data.get("message")
+        message_id = data.get("messageId")
 
         if not session_id or not user_message:
             return jsonify({"status": "error", "message": "sessionId e message são obrigatórios"}), 400
-        
-        response_data = process_web_message(session_id, user_message)
+        if not _message_id_valido(message_id):
+            return jsonify({"status": "error", "message": "messageId inválido"}), 400
 
-        # Verifica se a resposta da sua lógica já é um dicionário (ex: com botões)
-        if isinstance(response_data, dict):
-            # Se for, apenas o converte para JSON
-            return jsonify(response_data)
-        else:
-            # Se for texto simples, envolve no formato padrão {"reply": "..."}
-            return jsonify({"reply": response_data})
+        # Com messageId, um reenvio da mesma mensagem recebe a resposta original em vez de ser processado de novo
+        entrada = None
+        if message_id:
+            entrada, nova = tabela_idempotencia.iniciar(session_id, message_id)
+            if not nova:
+                resposta = _resposta_repetida(entrada)
+                return jsonify(resposta) if resposta is not None else (jsonify(_ERRO_REPETIDA), 409)
+
+        try:
+            response_data = _processar(session_id, user_message)
+        except Exception:
+            if entrada is not None:
+                tabela_idempotencia.descartar(session_id, message_id, entrada)
+            raise
+
+        resposta = _envelope(response_data)
+        if entrada is not None:
+            if response_data is MENSAGEM_SESSAO_OCUPADA:
+                # Não foi processada: um reenvio deve tentar de novo
+                tabela_idempotencia.descartar(session_id, message_id, entrada)
+            else:
+                tabela_idempotencia.concluir(entrada, resposta)
+        return jsonify(resposta)
+
+    except GeminiSobrecarregado as e:
+        return _resposta_sobrecarga(e)
+    except Exception as e:
+        logging.error(f"Erro ao processar a mensagem do chat: {e}")
+        return jsonify({"status": "error", "message": "Ocorreu um erro interno no servidor"}), 500
+
+
+def _evento_sse(evento, dados):
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+@webhook_blueprint.route("/chat/stream", methods=["POST", "OPTIONS"])
+def handle_chat_stream():
+    """
+    Mesmo contrato do /chat, mas a resposta é um stream SSE (text/event-stream).
+
+    Respostas do Gemini chegam como eventos `chunk` ({"delta": "..."}) assim que são geradas;
+    todas as respostas terminam com um evento `done` com o mesmo JSON que o /chat retornaria.
+    Um reenvio com o mesmo messageId recebe só o evento `done` com a resposta original.
+    """
+    if request.method == "OPTIONS":
+        response = jsonify({"status": "ok"})
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        response.headers.add("Access-Control-Allow-Methods", "POST, OPTIONS")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type, X-Profile")
+        return response, 200
+
+    try:
+        data = request.get_json()
+        session_id = data.get("sessionId")
+        user_message = data.get("message")
+        message_id = data.get("messageId")
+
+        if not session_id or not user_message:
+            return jsonify({"status": "error", "message": "sessionId e message são obrigatórios"}), 400
+        if not _message_id_valido(message_id):
+            return jsonify({"status": "error", "message": "messageId inválido"}), 400
 
+        entrada = None
+        if message_id:
+            entrada, nova = tabela_idempotencia.iniciar(session_id, message_id)
+            if not nova:
+                resposta = _resposta_repetida(entrada)
+                if resposta is None:
+                    return jsonify(_ERRO_REPETIDA), 409
+                return _resposta_sse(iter([_evento_sse("done", resposta)]))
+
+        try:
+            response_data = _processar(session_id, user_message, stream=True)
+        except Exception:
+            if entrada is not None:
+                tabela_idempotencia.descartar(session_id, message_id, entrada)
+            raise
+    except GeminiSobrecarregado as e:
+        return _resposta_sobrecarga(e)
     except Exception as e:
         logging.error(f"Erro ao processar a mensagem do chat: {e}")
-        return jsonify({"status": "error", "message": "Ocorreu um erro interno no servidor"}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": "Ocorreu um erro interno no servidor"}), 500
+
+    def concluir(resposta):
+        if entrada is None:
+            return
+        if resposta is None or response_data is MENSAGEM_SESSAO_OCUPADA:
+            tabela_idempotencia.descartar(session_id, message_id, entrada)
+        else:
+            tabela_idempotencia.concluir(entrada, resposta)
+
+    if isinstance(response_data, (dict, str)):
+        resposta = _envelope(response_data)
+        concluir(resposta)
+        return _resposta_sse(iter([_evento_sse("done", resposta)]))
+
+    def gerar():
+        partes = []
+        completo = False
+        try:
+            for trecho in response_data:
+                partes.append(trecho)
+                yield _evento_sse("chunk", {"delta": trecho})
+            completo = True
+        except Exception as e:
+            logging.error(f"Erro durante o streaming da resposta: {e}")
+        finally:
+            # Salva a sessão e libera a trava dela mesmo se o cliente desconectar no meio do stream
+            response_data.close()
+            # Só uma resposta completa é entregue a reenvios; os demais casos liberam o messageId
+            concluir({"reply": "".join(partes)} if completo else None)
+        yield _evento_sse("done", {"reply": "".join(partes)})
+
+    return _resposta_sse(gerar())
+
+
+def _resposta_sse(eventos):
+    response = Response(stream_with_context(eventos), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+@webhook_blueprint.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: o processo está de pé e atendendo requisições."""
+    return jsonify({"status": "ok", "uptime_seconds": ciclo_de_vida.estatisticas()["uptime_seconds"]})
+
+
+@webhook_blueprint.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: Gemini aquecido, gravação de logs funcionando e servidor fora do desligamento (senão, 503)."""
+    pronto, verificacoes = ciclo_de_vida.prontidao(log_writer.saudavel())
+    return jsonify({"status": "ready" if pronto else "not_ready", "checks": verificacoes}), 200 if pronto else 503
+
+
+@webhook_blueprint.route("/status/sessions", methods=["GET"])
+def sessions_status():
+    """Armazenamento das sessões (entradas, memória, expirações), espera nas travas por sessão e reenvios deduplicados."""
+    return jsonify({
+        "store": sessoes.estatisticas(),
+        "locks": travas_sessao.estatisticas(),
+        "idempotency": tabela_idempotencia.estatisticas(),
+    })
+
+
+@webhook_blueprint.route("/status/gemini", methods=["GET"])
+def gemini_status():
+    """Situação dos modelos do Gemini (circuit breaker, latência p95 e cota), das respostas locais, do cache de respostas e do executor."""
+    return jsonify({
+        **gemini_client.estado(),
+        "fast_path": roteador_intencoes.estatisticas(),
+        "response_cache": cache_respostas.estatisticas(),
+        "executor": executor_gemini.estatisticas(),
+    })
+
+
+# Respostas JSON menores que isso não compensam a compressão
+_GZIP_MINIMO = 1024
+
+
+def _logs_autorizado():
+    """Com LOGS_API_TOKEN definido, a API de logs exige o cabeçalho Authorization: Bearer <token>."""
+    if not log_summary.LOGS_API_TOKEN:
+        return True
+    cabecalho = request.headers.get("Authorization", "")
+    return hmac.compare_digest(cabecalho.encode("utf-8"), f"Bearer {log_summary.LOGS_API_TOKEN}".encode("utf-8"))
+
+
+def _inteiro(nome, padrao, minimo, maximo):
+    try:
+        valor = int(request.args.get(nome, padrao))
+    except ValueError:
+        valor = padrao
+    return max(minimo, min(valor, maximo))
+
+
+def _resposta_cacheavel(dados, etag):
+    """JSON com ETag fraca, revalidado a cada uso (no-cache) e comprimido com gzip quando o cliente aceita."""
+    corpo = json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    response = Response(corpo, mimetype="application/json")
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    if len(corpo) >= _GZIP_MINIMO and "gzip" in request.accept_encodings:
+        response.set_data(gzip.compress(corpo, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@webhook_blueprint.route("/logs/search", methods=["GET"])
+def logs_search():
+    """
+    Busca textual nas falas dos logs (índice FTS5 atualizado a cada gravação).
+
+    Parâmetros: q (palavras obrigatórias, "frase exata" ou prefixo*), type (conversations ou
+    questionnaires), speaker (user ou bot), bot_type, from e to (AAAA-MM-DD), order (recent ou
+    relevance), page e per_page. Cada item é uma fala com o arquivo de origem e um trecho com os
+    termos entre [ ]; `has_more` indica se há uma próxima página. A ordem por relevância precisa
+    pontuar todas as falas encontradas, então é mais lenta para termos muito comuns.
+    """
+    if not _logs_autorizado():
+        return jsonify({"status": "error", "message": "Não autorizado"}), 401
+    if not log_search.LOG_SEARCH:
+        return jsonify({"status": "error", "message": "Busca desativada (LOG_SEARCH=0)"}), 404
+    tipo = request.args.get("type") or None
+    autor = request.args.get("speaker") or None
+    ordem = request.args.get("order") or log_search.ORDEM_RECENTES
+    if (tipo is not None and tipo not in log_summary.TIPOS) or (autor is not None and autor not in log_search.AUTORES) \
+            or ordem not in (log_search.ORDEM_RECENTES, log_search.ORDEM_RELEVANCIA):
+        return jsonify({"status": "error", "message": "type, speaker ou order inválido"}), 400
+
+    pagina = _inteiro("page", 1, 1, 1_000_000)
+    por_pagina = _inteiro("per_page", log_summary.LOGS_API_PER_PAGE, 1, log_summary.LOGS_API_MAX_PER_PAGE)
+    inicio = time.perf_counter()
+    try:
+        itens, ha_mais = indice_busca.buscar(
+            request.args.get("q", ""),
+            tipo=tipo,
+            autor=autor,
+            tipo_atendimento=(request.args.get("bot_type") or "").strip().lower() or None,
+            data_inicial=request.args.get("from") or None,
+            data_final=request.args.get("to") or None,
+            ordem=ordem,
+            limite=por_pagina,
+            deslocamento=(pagina - 1) * por_pagina,
+        )
+    except ValueError:
+        return jsonify({"status": "error", "message": "q é obrigatório"}), 400
+    response = jsonify({
+        "query": request.args.get("q"),
+        "page": pagina,
+        "per_page": por_pagina,
+        "has_more": ha_mais,
+        "took_ms": round((time.perf_counter() - inicio) * 1000, 2),
+        "items": itens,
+    })
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@webhook_blueprint.route("/logs/<tipo>", methods=["GET"])
+def logs_list(tipo):
+    """
+    Resumos paginados dos logs (`conversations` ou `questionnaires`), do mais recente para o mais antigo.
+
+    Filtros (query string): from e to (AAAA-MM-DD, inclusive), bot_type (tradicional ou inteligente),
+    outcome (success, success_with_errors ou failure; só conversas) e q (trecho do nome do arquivo).
+    Paginação: page (a partir de 1) e per_page (até LOGS_API_MAX_PER_PAGE). A ETag muda quando um log
+    novo é registrado no índice; com If-None-Match igual, a resposta é 304 sem corpo.
+    """
+    if not _logs_autorizado():
+        return jsonify({"status": "error", "message": "Não autorizado"}), 401
+    if tipo not in log_summary.TIPOS:
+        return jsonify({"status": "error", "message": "Tipo de log inválido"}), 404
+
+    pagina = _inteiro("page", 1, 1, 1_000_000)
+    por_pagina = _inteiro("per_page", log_summary.LOGS_API_PER_PAGE, 1, log_summary.LOGS_API_MAX_PER_PAGE)
+    filtros = {
+        "data_inicial": request.args.get("from") or None,
+        "data_final": request.args.get("to") or None,
+        "tipo_atendimento": (request.args.get("bot_type") or "").strip().lower() or None,
+        "resultado": request.args.get("outcome") or None,
+        "busca": (request.args.get("q") or "").strip().lower() or None,
+    }
+    if filtros["resultado"] is not None and filtros["resultado"] not in log_summary.RESULTADOS:
+        return jsonify({"status": "error", "message": "outcome inválido"}), 400
+
+    # A versão do índice é só um stat dos arquivos: a revalidação não monta a lista
+    consulta = json.dumps([tipo, pagina, por_pagina, sorted(filtros.items())], ensure_ascii=False)
+    assinatura = hashlib.sha1(consulta.encode("utf-8")).hexdigest()[:16]
+    etag = f"{catalogo_logs.versao(tipo)}-{assinatura}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    versao, resumos = catalogo_logs.listar(tipo)
+    etag = f"{versao}-{assinatura}"
+    selecionados = log_summary.filtrar(resumos, **filtros)
+    inicio = (pagina - 1) * por_pagina
+    return _resposta_cacheavel({
+        "type": tipo,
+        "page": pagina,
+        "per_page": por_pagina,
+        "total": len(selecionados),
+        "pages": (len(selecionados) + por_pagina - 1) // por_pagina,
+        "items": selecionados[inicio:inicio + por_pagina],
+    }, etag)
+
+
+@webhook_blueprint.route("/logs/<tipo>/<nome_arquivo>", methods=["GET"])
+def logs_file(tipo, nome_arquivo):
+    """Conteúdo de um arquivo de log, baixado pelo visualizador só quando ele é aberto (com ETag e Last-Modified)."""
+    if not _logs_autorizado():
+        return jsonify({"status": "error", "message": "Não autorizado"}), 401
+    caminho = catalogo_logs.caminho(tipo, nome_arquivo)
+    if caminho is None:
+        return jsonify({"status": "error", "message": "Log não encontrado"}), 404
+    response = send_file(caminho, mimetype="text/plain; charset=utf-8", conditional=True, max_age=0)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+_ESTADOS_BREAKER = {"closed": 0, "half_open": 1, "open": 2}
+
+
+@registro.coletor
+def _coletar_estado():
+    """Valores já mantidos pelos componentes (sessões, travas, Gemini, cache, fila de logs), lidos a cada /metrics."""
+    store = sessoes.estatisticas()
+    travas = travas_sessao.estatisticas()
+    idempotencia = tabela_idempotencia.estatisticas()
+    gemini = gemini_client.estado()
+    executor = executor_gemini.estatisticas()
+    cache = cache_respostas.estatisticas()
+    fast_path = roteador_intencoes.estatisticas()
+    logs = log_writer.estatisticas()
+    busca = indice_busca.estatisticas()
+    eventos = registro_eventos.estatisticas()
+    ciclo = ciclo_de_vida.estatisticas()
+    pronto, _ = ciclo_de_vida.prontidao(log_writer.saudavel())
+
+    diario = store.get("journal", {})
+    backend = {"store": store["backend"]}
+    modelos = gemini["models"]
+    return [
+        ("chatbot_ready", "gauge", "Se o processo está pronto para receber mensagens (/readyz).", [({}, int(pronto))]),
+        ("chatbot_chat_in_flight", "gauge", "Mensagens do chat em processamento.", [({}, ciclo["in_flight"])]),
+        ("chatbot_chat_rejected_draining_total", "counter", "Mensagens recusadas durante o desligamento.",
+         [({}, ciclo["rejected_while_draining"])]),
+        ("chatbot_sessions_active", "gauge", "Sessões no armazenamento.", [(backend, store["entries"])]),
+        ("chatbot_sessions_evicted_total", "counter", "Sessões removidas por limite de entradas.", [(backend, store["evictions"])]),
+        ("chatbot_sessions_expired_total", "counter", "Sessões removidas por inatividade.", [(backend, store["expirations"])]),
+        ("chatbot_session_journal_bytes", "gauge", "Tamanho do diário de sessões desde a última compactação.",
+         [({}, diario.get("journal_bytes"))]),
+        ("chatbot_session_journal_records_total", "counter", "Registros gravados no diário de sessões.", [({}, diario.get("records"))]),
+        ("chatbot_session_lock_acquisitions_total", "counter", "Mensagens que passaram pela trava da sessão.", [({}, travas["acquisitions"])]),
+        ("chatbot_session_lock_contended_total", "counter", "Mensagens que esperaram outra da mesma sessão.", [({}, travas["contended"])]),
+        ("chatbot_session_lock_timeouts_total", "counter", "Mensagens recusadas por espera longa na trava.", [({}, travas["timeouts"])]),
+        ("chatbot_session_lock_wait_seconds_total", "counter", "Tempo total de espera nas travas.", [({}, travas["wait_seconds_total"])]),
+        ("chatbot_idempotency_entries", "gauge", "Mensagens na tabela de deduplicação.", [({}, idempotencia["entries"])]),
+        ("chatbot_idempotency_hits_total", "counter", "Reenvios atendidos com a resposta original.", [({}, idempotencia["hits"])]),
+        ("chatbot_gemini_requests_total", "counter", "Chamadas ao Gemini com resposta, por modelo.",
+         [({"model": m["model"]}, m["tokens"]["requests"]) for m in modelos]),
+        ("chatbot_gemini_tokens_total", "counter", "Tokens consumidos no Gemini, por modelo e tipo.",
+         [({"model": m["model"], "kind": tipo}, m["tokens"][f"{tipo}_tokens"]) for m in modelos for tipo in ("prompt", "response", "cached")]),
+        ("chatbot_gemini_summary_requests_total", "counter", "Chamadas ao Gemini para resumir o histórico, por modelo.",
+         [({"model": m["model"]}, m["tokens"]["summary_requests"]) for m in modelos]),
+        ("chatbot_gemini_summary_tokens_total", "counter", "Tokens das chamadas de resumo (incluídos no total), por modelo e tipo.",
+         [({"model": m["model"], "kind": tipo}, m["tokens"][f"summary_{tipo}_tokens"]) for m in modelos for tipo in ("prompt", "response")]),
+        ("chatbot_gemini_quota_rpm_available", "gauge", "Requisições disponíveis no minuto atual, por modelo.",
+         [({"model": m["model"]}, m["quota"]["rpm_available"]) for m in modelos]),
+        ("chatbot_gemini_quota_rpd_used", "gauge", "Requisições usadas hoje, por modelo.",
+         [({"model": m["model"]}, m["quota"]["rpd_used"]) for m in modelos]),
+        ("chatbot_gemini_quota_rpd_remaining", "gauge", "Requisições restantes hoje, por modelo.",
+         [({"model": m["model"]}, m["quota"]["rpd_remaining"]) for m in modelos]),
+        ("chatbot_gemini_breaker_state", "gauge", "Circuit breaker de cada modelo (0 fechado, 1 meio aberto, 2 aberto).",
+         [({"model": m["model"]}, _ESTADOS_BREAKER.get(m["breaker"]["state"])) for m in modelos]),
+        ("chatbot_gemini_active_model", "gauge", "Modelo que atende a próxima mensagem (1) entre os níveis.",
+         [({"model": m["model"]}, int(m["model"] == gemini["active_model"])) for m in modelos]),
+        ("chatbot_gemini_executor_in_flight", "gauge", "Chamadas ao Gemini em execução.", [({}, executor["in_flight"])]),
+        ("chatbot_gemini_executor_queued", "gauge", "Chamadas ao Gemini esperando uma vaga.", [({}, executor["queued"])]),
+        ("chatbot_gemini_executor_rejected_total", "counter", "Mensagens recusadas com 429 (executor cheio).", [({}, executor["rejected"])]),
+        ("chatbot_gemini_executor_timeouts_total", "counter", "Chamadas ao Gemini abandonadas por tempo limite.", [({}, executor["timeouts"])]),
+        ("chatbot_fast_path_hits_total", "counter", "Mensagens respondidas localmente, por intenção.",
+         [({"intent": intencao}, total) for intencao, total in sorted(fast_path["hits"].items())]),
+        ("chatbot_response_cache_hits_total", "counter", "Respostas servidas pelo cache de respostas.", [({}, cache["hits"])]),
+        ("chatbot_response_cache_misses_total", "counter", "Consultas ao cache de respostas sem resultado.", [({}, cache["misses"])]),
+        ("chatbot_log_writer_queue_depth", "gauge", "Logs esperando gravação.", [({}, logs["queue_depth"])]),
+        ("chatbot_log_writer_written_total", "counter", "Logs gravados.", [({}, logs["written"])]),
+        ("chatbot_log_writer_failed_total", "counter", "Logs que falharam na gravação.", [({}, logs["failed"])]),
+        ("chatbot_log_writer_sync_fallbacks_total", "counter", "Logs gravados de forma síncrona (fila cheia).", [({}, logs["sync_fallbacks"])]),
+        ("chatbot_log_search_indexed_total", "counter", "Arquivos de log indexados para a busca textual.", [({}, busca["indexed_documents"])]),
+        ("chatbot_log_search_failed_total", "counter", "Arquivos de log que falharam na indexação.", [({}, busca["failed"])]),
+        ("chatbot_log_search_db_bytes", "gauge", "Tamanho do banco da busca textual.", [({}, busca["db_bytes"])]),
+        ("chatbot_turn_events_total", "counter", "Eventos por mensagem gravados.", [({}, eventos["events"])]),
+        ("chatbot_turn_events_dropped_total", "counter", "Eventos por mensagem descartados (fila cheia).", [({}, eventos["dropped"])]),
+        ("chatbot_turn_events_failed_total", "counter", "Eventos por mensagem que falharam na gravação.", [({}, eventos["failed"])]),
+        ("chatbot_turn_events_rotations_total", "counter", "Rotações do arquivo de eventos.", [({}, eventos["rotations"])]),
+    ]
+
+
+@webhook_blueprint.route("/metrics", methods=["GET"])
+def metrics():
+    """Métricas no formato texto do Prometheus."""
+    return Response(registro.exposicao(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,238 @@
+"""
+Teste de carga do /chat: sobe o app real no waitress, com o Gemini substituído por um modelo falso
+(benchmarks/gemini_falso.py), e simula usuários simultâneos conversando com o bot.
+
+Cada usuário abre conversas em sequência. O primeiro "oi" sorteia o tipo de atendimento (como em
+produção) e o resto da conversa segue o roteiro do fluxo sorteado: o roteiro completo do pedido no
+fluxo tradicional (o mesmo do bench_maquina_estados) ou perguntas e pedido no fluxo inteligente.
+As conversas não são encerradas, então nenhum log é gravado.
+
+O resultado (vazão, latência p50/p95/p99 total e por estado, códigos HTTP e crescimento do RSS do
+processo) é impresso e gravado em JSON para comparar execuções.
+
+Uso (na pasta Back-end):
+    python -m benchmarks.bench_carga [--usuarios 20] [--conversas 10] [--latencia 0.3] [--taxa-erro 0.02]
+                                     [--threads 16] [--saida benchmarks/resultados/carga.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from benchmarks import gemini_falso
+
+ROTEIRO_INTELIGENTE = [
+    "qual o cardápio?",
+    "quanto custa a pamonha?",
+    "quero 2 pamonhas e um suco de laranja",
+    "pode trocar o suco por um refrigerante?",
+    "meu nome é maria",
+    "obrigado!",
+]
+
+ESTADO_INICIO = "aguardando"
+
+
+def rss_mb():
+    """Memória residente do processo (servidor e clientes), em MB."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return round(int(linha.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def estados_do_roteiro(roteiro, whatsapp_utils, nova_sessao):
+    """Estado do bot antes de cada mensagem do roteiro tradicional, obtido executando o roteiro uma vez."""
+    sessao = nova_sessao()
+    sessao["status"] = sessao["tipo_atendimento"] = "tradicional"
+    estados = []
+    for mensagem in roteiro:
+        estados.append(sessao["status"])
+        whatsapp_utils._processar_mensagem("bench-estados", sessao, mensagem)
+    return estados
+
+
+class Usuario(threading.Thread):
+    def __init__(self, numero, porta, conversas, roteiro_tradicional, resultados):
+        super().__init__(name=f"usuario-{numero}", daemon=True)
+        self.numero = numero
+        self.porta = porta
+        self.conversas = conversas
+        self.roteiro_tradicional = roteiro_tradicional  # [(mensagem, estado)]
+        self.resultados = resultados
+
+    def enviar(self, conexao, session_id, mensagem, estado):
+        corpo = json.dumps({"sessionId": session_id, "message": mensagem})
+        inicio = time.perf_counter()
+        try:
+            conexao.request("POST", "/chat", corpo, {"Content-Type": "application/json"})
+            resposta = conexao.getresponse()
+            dados = resposta.read()
+            status = resposta.status
+        except (OSError, http.client.HTTPException):
+            conexao.close()
+            status, dados = "erro_conexao", b""
+        self.resultados.registrar(estado, time.perf_counter() - inicio, status)
+        if status != 200:
+            return None
+        return json.loads(dados).get("reply", "")
+
+    def run(self):
+        from app.utils.whatsapp_utils import MENU_PRINCIPAL_TEXT
+
+        conexao = http.client.HTTPConnection("127.0.0.1", self.porta, timeout=120)
+        for conversa in range(self.conversas):
+            session_id = f"carga-{self.numero}-{conversa}"
+            primeira = self.enviar(conexao, session_id, "oi", ESTADO_INICIO)
+            if primeira is None:
+                continue
+            if primeira == MENU_PRINCIPAL_TEXT:
+                self.resultados.conversa("tradicional")
+                for mensagem, estado in self.roteiro_tradicional:
+                    self.enviar(conexao, session_id, mensagem, estado)
+            else:
+                self.resultados.conversa("inteligente")
+                for mensagem in ROTEIRO_INTELIGENTE:
+                    self.enviar(conexao, session_id, mensagem, "inteligente")
+        conexao.close()
+
+
+class Resultados:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {}  # estado -> [segundos]
+        self.status = {}
+        self.conversas = {"tradicional": 0, "inteligente": 0}
+
+    def registrar(self, estado, segundos, status):
+        with self._lock:
+            self.latencias.setdefault(estado, []).append(segundos)
+            self.status[str(status)] = self.status.get(str(status), 0) + 1
+
+    def conversa(self, tipo):
+        with self._lock:
+            self.conversas[tipo] += 1
+
+
+def resumo_latencias(valores, percentil):
+    return {
+        "count": len(valores),
+        "mean_ms": round(sum(valores) / len(valores) * 1000, 2),
+        "p50_ms": round(percentil(valores, 50) * 1000, 2),
+        "p95_ms": round(percentil(valores, 95) * 1000, 2),
+        "p99_ms": round(percentil(valores, 99) * 1000, 2),
+        "max_ms": round(max(valores) * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, default=20, help="usuários simultâneos")
+    parser.add_argument("--conversas", type=int, default=10, help="conversas por usuário")
+    parser.add_argument("--latencia", type=float, default=0.3, help="latência média do Gemini falso (s)")
+    parser.add_argument("--variacao", type=float, default=0.1, help="variação da latência para mais ou para menos (s)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração das chamadas ao Gemini que falham")
+    parser.add_argument("--threads", type=int, default=16, help="threads do waitress")
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument("--saida", default=None, help="arquivo JSON do resultado (padrão: benchmarks/resultados/)")
+    args = parser.parse_args(argv)
+
+    # Cota em um banco temporário, para não consumir (nem ser limitada pela) cota real
+    diretorio_tmp = tempfile.mkdtemp(prefix="bench-carga-")
+    os.environ["GEMINI_QUOTA_DB"] = os.path.join(diretorio_tmp, "gemini_quota.db")
+    # As sessões do teste não vão para o diário (nem são restauradas de execuções anteriores)
+    os.environ["SESSION_JOURNAL"] = "0"
+    # Os eventos por mensagem continuam ligados (o custo deles faz parte da carga), mas em uma pasta temporária
+    os.environ["TURN_EVENTS_DIR"] = os.path.join(diretorio_tmp, "events")
+    gemini_falso.instalar(args.latencia, args.variacao, args.taxa_erro, args.semente)
+
+    import logging
+    from waitress.server import create_server
+    from app import create_app
+    from app.utils import gemini_client, whatsapp_utils
+    from app.utils.circuit_breaker import percentil
+    from app.utils.gemini_executor import executor_gemini
+    from app.utils.gemini_quota import GeminiQuota, MODELOS_GEMINI
+    from app.utils.session_store import nova_sessao
+    from benchmarks.bench_maquina_estados import ROTEIRO
+
+    app = create_app()
+    logging.disable(logging.ERROR)
+    gemini_client.quota = GeminiQuota(
+        os.environ["GEMINI_QUOTA_DB"], [(modelo, 10**6, 10**9) for modelo, _, _ in MODELOS_GEMINI]
+    )
+    roteiro_tradicional = list(zip(ROTEIRO, estados_do_roteiro(ROTEIRO, whatsapp_utils, nova_sessao)))
+
+    servidor = create_server(app, host="127.0.0.1", port=0, threads=args.threads)
+    threading.Thread(target=servidor.run, name="waitress", daemon=True).start()
+    porta = servidor.effective_port
+
+    rss_inicio = rss_mb()
+    resultados = Resultados()
+    usuarios = [Usuario(n, porta, args.conversas, roteiro_tradicional, resultados) for n in range(args.usuarios)]
+    inicio = time.perf_counter()
+    for usuario in usuarios:
+        usuario.start()
+    for usuario in usuarios:
+        usuario.join()
+    duracao = time.perf_counter() - inicio
+    rss_fim = rss_mb()
+    servidor.close()
+
+    todas = [valor for valores in resultados.latencias.values() for valor in valores]
+    relatorio = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "users": args.usuarios,
+            "conversations_per_user": args.conversas,
+            "gemini_latency_s": args.latencia,
+            "gemini_jitter_s": args.variacao,
+            "gemini_error_rate": args.taxa_erro,
+            "waitress_threads": args.threads,
+            "gemini_max_concurrent": executor_gemini.max_simultaneas,
+            "gemini_max_queue": executor_gemini.max_fila,
+        },
+        "duration_s": round(duracao, 3),
+        "requests": len(todas),
+        "throughput_rps": round(len(todas) / duracao, 1),
+        "sessions_per_s": round(sum(resultados.conversas.values()) / duracao, 2),
+        "conversations": resultados.conversas,
+        "status_codes": resultados.status,
+        "latency": resumo_latencias(todas, percentil),
+        "latency_by_state": {
+            estado: resumo_latencias(valores, percentil) for estado, valores in sorted(resultados.latencias.items())
+        },
+        "rss_mb": {"start": rss_inicio, "end": rss_fim, "growth": round(rss_fim - rss_inicio, 1)},
+        "gemini_fake": {"requests": gemini_falso.configuracao.requisicoes, "errors": gemini_falso.configuracao.erros},
+        "gemini_executor": executor_gemini.estatisticas(),
+    }
+
+    saida = args.saida or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "resultados", f"carga_{datetime.now():%Y-%m-%d_%H-%M-%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+    print(f"Requisições: {relatorio['requests']} em {relatorio['duration_s']}s "
+          f"({relatorio['throughput_rps']} req/s, {relatorio['sessions_per_s']} sessões/s)")
+    print(f"Conversas: {resultados.conversas} | códigos HTTP: {resultados.status}")
+    print(f"{'estado':<26}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for estado, dados in [("(todas)", relatorio["latency"])] + list(relatorio["latency_by_state"].items()):
+        print(f"{estado:<26}{dados['count']:>7}{dados['p50_ms']:>10}{dados['p95_ms']:>10}{dados['p99_ms']:>10}")
+    print(f"RSS: {rss_inicio} MB -> {rss_fim} MB | resultado gravado em {saida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
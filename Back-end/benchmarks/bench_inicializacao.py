@@ -0,0 +1,175 @@
+"""
+Benchmark do tempo de inicialização do backend (o que o run.py faz antes de atender a primeira mensagem).
+
+Cada repetição roda em um processo Python novo, com `-X importtime`, e mede as fases:
+    import_app      - `from app import create_app` (Flask, módulos do app e suas dependências);
+    create_app      - criação do app e registro do blueprint (importa views e whatsapp_utils);
+    session_restore - restauração do diário de sessões (vazio, em uma pasta temporária), como no run.py;
+    first_request   - primeira mensagem (POST /chat) de uma conversa no fluxo tradicional;
+    second_request  - a mensagem seguinte, já com tudo carregado, para comparação;
+    gemini_warmup   - aquecimento do Gemini (importação do SDK e criação do modelo, sem chamar a API).
+
+Também soma o tempo de importação (self) de cada pacote, a partir da saída do `-X importtime`, para
+mostrar quais dependências pesam na partida. O resultado é a mediana das repetições.
+
+Uso (na pasta Back-end):
+    python -m benchmarks.bench_inicializacao [--repeticoes 5] [--gemini real|falso] [--pacotes 12]
+                                             [--saida benchmarks/resultados/inicializacao.json]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FASES = ["import_app", "create_app", "session_restore", "first_request", "second_request", "gemini_warmup"]
+MARCADOR = "RESULTADO_INICIALIZACAO "
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _filho(gemini):
+    """Executado no processo novo: mede as fases e imprime o resultado em uma linha com MARCADOR."""
+    tempos = {}
+    if gemini == "falso":
+        from benchmarks import gemini_falso
+        gemini_falso.instalar()
+
+    inicio = time.perf_counter()
+    from app import create_app
+    tempos["import_app"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    app = create_app()
+    tempos["create_app"] = time.perf_counter() - inicio
+
+    import logging
+    from app.utils import whatsapp_utils
+    from app.utils.session_store import ligar_diario
+
+    inicio = time.perf_counter()
+    ligar_diario(whatsapp_utils.sessoes)
+    tempos["session_restore"] = time.perf_counter() - inicio
+
+    logging.disable(logging.CRITICAL)
+    # A conversa segue o fluxo tradicional em vez de sortear (o inteligente chamaria a API)
+    def fluxo_tradicional(session_id, sessao, first_message, stream=False):
+        sessao["tipo_atendimento"] = "tradicional"
+        return whatsapp_utils.fluxo_tradicional(session_id, sessao, first_message, stream)
+
+    whatsapp_utils.iniciar_fluxo_aleatorio = fluxo_tradicional
+    cliente = app.test_client()
+    for fase, mensagem in (("first_request", "oi"), ("second_request", "1")):
+        inicio = time.perf_counter()
+        resposta = cliente.post("/chat", json={"sessionId": "bench-inicializacao", "message": mensagem})
+        tempos[fase] = time.perf_counter() - inicio
+        if resposta.status_code != 200:
+            raise RuntimeError(f"/chat respondeu {resposta.status_code} na fase {fase}")
+
+    inicio = time.perf_counter()
+    whatsapp_utils.aquecer_gemini()
+    tempos["gemini_warmup"] = time.perf_counter() - inicio
+
+    print(MARCADOR + json.dumps(tempos), flush=True)
+
+
+def importacoes_por_pacote(saida_importtime):
+    """Soma o tempo próprio (self, em segundos) das importações de cada pacote de primeiro nível."""
+    pacotes = {}
+    for linha in saida_importtime.splitlines():
+        encontrada = _IMPORTTIME.match(linha)
+        if encontrada is None:
+            continue
+        pacote = encontrada.group(4).split(".")[0]
+        pacotes[pacote] = pacotes.get(pacote, 0.0) + int(encontrada.group(1)) / 1e6
+    return pacotes
+
+
+def executar(gemini, diretorio_tmp):
+    """Roda uma repetição em um processo novo. Retorna (tempos das fases, importações por pacote, duração do processo)."""
+    ambiente = dict(os.environ)
+    # Cota e diário de sessões em arquivos temporários, para não tocar nos dados reais
+    ambiente["GEMINI_QUOTA_DB"] = os.path.join(diretorio_tmp, "gemini_quota.db")
+    ambiente["SESSION_JOURNAL_DIR"] = tempfile.mkdtemp(prefix="sessoes-", dir=diretorio_tmp)
+    ambiente["GEMINI_CONTEXT_CACHE"] = "0"
+    comando = [sys.executable, "-X", "importtime", "-m", "benchmarks.bench_inicializacao", "--filho", "--gemini", gemini]
+    inicio = time.perf_counter()
+    processo = subprocess.run(comando, cwd=PROJECT_ROOT, env=ambiente, capture_output=True, text=True)
+    duracao = time.perf_counter() - inicio
+    linhas = [linha for linha in processo.stdout.splitlines() if linha.startswith(MARCADOR)]
+    if processo.returncode != 0 or not linhas:
+        erros = [linha for linha in processo.stderr.splitlines() if not linha.startswith("import time:")]
+        raise RuntimeError("Falha no processo de medição:\n" + "\n".join(erros[-20:]))
+    return json.loads(linhas[-1][len(MARCADOR):]), importacoes_por_pacote(processo.stderr), duracao
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--gemini", choices=["real", "falso"], default="real",
+                        help="SDK real (mede a importação dele) ou o módulo falso dos benchmarks")
+    parser.add_argument("--pacotes", type=int, default=12, help="pacotes listados no detalhamento das importações")
+    parser.add_argument("--saida", default=None, help="arquivo JSON com o resultado")
+    parser.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.filho:
+        _filho(args.gemini)
+        return 0
+
+    diretorio_tmp = tempfile.mkdtemp(prefix="bench-inicializacao-")
+    fases = {fase: [] for fase in FASES}
+    pacotes = {}
+    processos = []
+    try:
+        for _ in range(args.repeticoes):
+            tempos, importacoes, duracao = executar(args.gemini, diretorio_tmp)
+            for fase in FASES:
+                fases[fase].append(tempos[fase])
+            for pacote, segundos in importacoes.items():
+                pacotes.setdefault(pacote, []).append(segundos)
+            processos.append(duracao)
+    finally:
+        shutil.rmtree(diretorio_tmp, ignore_errors=True)
+
+    medianas = {fase: statistics.median(valores) for fase, valores in fases.items()}
+    ate_primeira_resposta = sum(medianas[fase] for fase in ("import_app", "create_app", "session_restore", "first_request"))
+    importacoes = sorted(
+        ((pacote, statistics.median(valores + [0.0] * (args.repeticoes - len(valores)))) for pacote, valores in pacotes.items()),
+        key=lambda item: item[1], reverse=True,
+    )
+    relatorio = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "repetitions": args.repeticoes,
+        "gemini": args.gemini,
+        "phases_ms": {fase: round(segundos * 1000, 1) for fase, segundos in medianas.items()},
+        "to_first_reply_ms": round(ate_primeira_resposta * 1000, 1),
+        "process_ms": round(statistics.median(processos) * 1000, 1),
+        "imports_self_ms": {pacote: round(segundos * 1000, 1) for pacote, segundos in importacoes[:args.pacotes]},
+    }
+
+    print(f"Mediana de {args.repeticoes} processos (Gemini {args.gemini}):")
+    for fase, milissegundos in relatorio["phases_ms"].items():
+        print(f"  {fase:<16}{milissegundos:>10.1f} ms")
+    print(f"  {'até a 1ª resposta':<16}{relatorio['to_first_reply_ms']:>10.1f} ms (processo inteiro: {relatorio['process_ms']} ms)")
+    print("Importações por pacote (tempo próprio, em todas as fases):")
+    for pacote, milissegundos in relatorio["imports_self_ms"].items():
+        print(f"  {pacote:<24}{milissegundos:>10.1f} ms")
+
+    if args.saida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
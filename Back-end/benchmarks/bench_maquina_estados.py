@@ -0,0 +1,62 @@
+"""
+Micro-benchmark da máquina de estados do atendimento tradicional.
+
+Mede o custo por mensagem de `_processar_mensagem` (sem rede, sem Gemini e sem gravação de logs)
+em uma conversa roteirizada que passa por todos os estados do pedido. Para comparar duas versões,
+rode o script em cada uma delas (por exemplo, antes e depois de um `git checkout`).
+
+Uso (na pasta Back-end):
+    python -m benchmarks.bench_maquina_estados [--conversas 2000] [--repeticoes 5]
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from app.utils import whatsapp_utils
+from app.utils.session_store import nova_sessao
+
+# Uma volta completa pelo fluxo tradicional, terminando de volta no menu principal (a conversa não é encerrada,
+# então nenhum log é gravado)
+ROTEIRO = [
+    "1", "3", "2", "sim", "5", "2", "nao", "maria",
+    "3", "1", "1", "4", "3", "2", "1", "4",
+    "2", "7", "1", "s", "8", "3", "n", "joao",
+    "3", "3", "xyz", "9",
+]
+
+
+def executar(conversas):
+    """Processa `conversas` vezes o roteiro e retorna (mensagens processadas, segundos)."""
+    mensagens = 0
+    inicio = time.perf_counter()
+    for numero in range(conversas):
+        sessao = nova_sessao()
+        sessao["status"] = "tradicional"
+        sessao["tipo_atendimento"] = "tradicional"
+        session_id = f"bench-{numero}"
+        for mensagem in ROTEIRO:
+            whatsapp_utils._processar_mensagem(session_id, sessao, mensagem)
+            mensagens += 1
+    return mensagens, time.perf_counter() - inicio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversas", type=int, default=2000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    executar(50)  # aquecimento
+    tempos = []
+    for _ in range(args.repeticoes):
+        mensagens, segundos = executar(args.conversas)
+        tempos.append(segundos / mensagens * 1e6)
+
+    print(f"Mensagens por repetição: {mensagens}")
+    print(f"Custo por mensagem: mediana {statistics.median(tempos):.2f} µs | mínimo {min(tempos):.2f} µs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Benchmark do diário de sessões (app/utils/session_journal.py): custo de registrar as mudanças de sessão,
+tamanho do diário e do snapshot, e tempo de restauração na inicialização.
+
+As sessões são geradas pela máquina de estados real, com o roteiro do fluxo tradicional (o mesmo do
+bench_maquina_estados): cada mensagem processada vira um registro no diário, como no `salvar` do
+armazenamento em memória. São medidos:
+    - o custo por registro na thread da requisição (serialização + enfileiramento);
+    - o tempo até a thread de gravação esvaziar a fila e o tamanho do diário resultante;
+    - a restauração só a partir do diário (pior caso, antes de qualquer compactação);
+    - a compactação e a restauração a partir do snapshot.
+
+Tudo é gravado em uma pasta temporária. Uso (na pasta Back-end):
+    python -m benchmarks.bench_restauracao [--sessoes 5000] [--mensagens 20] [--repeticoes 3] [--saida restauracao.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+
+def gerar_registros(sessoes, mensagens, roteiro, whatsapp_utils, nova_sessao, serializar, diario):
+    """Processa `mensagens` mensagens do roteiro em cada sessão e registra cada estado no diário. Retorna segundos no chamador."""
+    gasto = 0.0
+    estados = {}
+    for numero in range(sessoes):
+        sessao = nova_sessao()
+        sessao["status"] = sessao["tipo_atendimento"] = "tradicional"
+        estados[f"bench-{numero}"] = sessao
+    # As sessões avançam intercaladas, como conversas simultâneas
+    for indice in range(mensagens):
+        mensagem = roteiro[indice % len(roteiro)]
+        for session_id, sessao in estados.items():
+            whatsapp_utils._processar_mensagem(session_id, sessao, mensagem)
+            inicio = time.perf_counter()
+            diario.salvar(session_id, serializar(session_id, sessao, time.time()))
+            gasto += time.perf_counter() - inicio
+    return gasto
+
+
+def esperar_fila(diario):
+    inicio = time.perf_counter()
+    while diario.estatisticas()["queue_depth"] > 0:
+        time.sleep(0.005)
+    # A fila esvazia antes de o último lote terminar de ser gravado
+    registros = diario.estatisticas()["records"]
+    while True:
+        time.sleep(0.02)
+        atual = diario.estatisticas()["records"]
+        if atual == registros:
+            return time.perf_counter() - inicio
+        registros = atual
+
+
+def tamanho(caminho):
+    return os.path.getsize(caminho) if os.path.exists(caminho) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessoes", type=int, default=5000)
+    parser.add_argument("--mensagens", type=int, default=20, help="mensagens (registros no diário) por sessão")
+    parser.add_argument("--repeticoes", type=int, default=3, help="repetições de cada restauração")
+    parser.add_argument("--saida", default=None, help="arquivo JSON com o resultado")
+    args = parser.parse_args(argv)
+
+    # O armazenamento do app não usa o diário aqui; o benchmark cria o seu em uma pasta temporária
+    os.environ["SESSION_JOURNAL"] = "0"
+    import logging
+    from app.utils import whatsapp_utils
+    from app.utils.session_journal import DiarioSessoes, serializar
+    from app.utils.session_store import MemorySessionBackend, nova_sessao
+    from benchmarks.bench_maquina_estados import ROTEIRO
+
+    logging.disable(logging.INFO)
+    diretorio = tempfile.mkdtemp(prefix="bench-restauracao-")
+    try:
+        # Limite de compactação alto, para medir o diário inteiro antes da primeira compactação
+        diario = DiarioSessoes(diretorio, limite_compactacao=float("inf"))
+        diario.restaurar()
+        gasto = gerar_registros(args.sessoes, args.mensagens, ROTEIRO, whatsapp_utils, nova_sessao, serializar, diario)
+        drenagem = esperar_fila(diario)
+        registros = diario.estatisticas()["records"]
+        bytes_diario = tamanho(diario.caminho_diario)
+        diario.parar()
+
+        def restaurar():
+            inicio = time.perf_counter()
+            novo = DiarioSessoes(diretorio, limite_compactacao=float("inf"))
+            sessoes = novo.restaurar()
+            lido = time.perf_counter()
+            MemorySessionBackend(max_entradas=args.sessoes).restaurar(sessoes)
+            fim = time.perf_counter()
+            return novo, len(sessoes), lido - inicio, fim - inicio
+
+        tempos_diario = []
+        for _ in range(args.repeticoes):
+            novo, restauradas, leitura, total = restaurar()
+            tempos_diario.append((leitura, total))
+
+        # A thread de gravação compacta o que foi restaurado ao iniciar; um registro a mais a inicia
+        novo.salvar("bench-compactacao", serializar("bench-compactacao", nova_sessao(), time.time()))
+        esperar_fila(novo)
+        compactacao = novo.estatisticas()["compaction_seconds_last"]
+        novo.parar()
+        bytes_snapshot = tamanho(novo.caminho_snapshot)
+
+        tempos_snapshot = []
+        for _ in range(args.repeticoes):
+            _, restauradas_snapshot, leitura, total = restaurar()
+            tempos_snapshot.append((leitura, total))
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    def resumo(tempos):
+        return {
+            "read_ms": round(statistics.median(leitura for leitura, _ in tempos) * 1000, 1),
+            "total_ms": round(statistics.median(total for _, total in tempos) * 1000, 1),
+        }
+
+    relatorio = {
+        "sessions": args.sessoes,
+        "records": registros,
+        "record_cost_us": round(gasto / registros * 1e6, 2),
+        "writer_drain_ms": round(drenagem * 1000, 1),
+        "journal_mb": round(bytes_diario / 1024 / 1024, 2),
+        "restore_from_journal": dict(resumo(tempos_diario), sessions=restauradas),
+        "compaction_ms": round(compactacao * 1000, 1),
+        "snapshot_mb": round(bytes_snapshot / 1024 / 1024, 2),
+        "restore_from_snapshot": dict(resumo(tempos_snapshot), sessions=restauradas_snapshot),
+    }
+
+    print(f"Sessões: {args.sessoes} | registros no diário: {registros} ({relatorio['journal_mb']} MB)")
+    print(f"Custo por registro na requisição: {relatorio['record_cost_us']} µs | fila esvaziada "
+          f"{relatorio['writer_drain_ms']} ms depois do último registro")
+    print(f"Restauração pelo diário: {relatorio['restore_from_journal']['total_ms']} ms "
+          f"(leitura {relatorio['restore_from_journal']['read_ms']} ms)")
+    print(f"Compactação: {relatorio['compaction_ms']} ms | snapshot: {relatorio['snapshot_mb']} MB")
+    print(f"Restauração pelo snapshot: {relatorio['restore_from_snapshot']['total_ms']} ms "
+          f"(leitura {relatorio['restore_from_snapshot']['read_ms']} ms)")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Substituto local do `google.generativeai` para benchmarks e replays, sem rede e sem consumir cota.
+
+`instalar()` precisa ser chamado antes de importar o `app`: ele registra em sys.modules um módulo com
+`configure` e `GenerativeModel` (start_chat/send_message, com e sem stream, e usage_metadata), cujas
+respostas têm latência e taxa de erro configuráveis.
+"""
+import random
+import sys
+import threading
+import time
+import types
+
+RESPOSTA_PADRAO = (
+    "Claro! Temos pamonha, curau, milho cozido e bolo de milho, além de sucos e refrigerantes. "
+    "Posso anotar o seu pedido?"
+)
+
+
+class ErroGeminiFalso(RuntimeError):
+    """Falha simulada (equivalente a um erro da API)."""
+
+
+class Configuracao:
+    def __init__(self, latencia=0.0, variacao=0.0, taxa_erro=0.0, resposta=RESPOSTA_PADRAO, semente=None):
+        self.latencia = latencia
+        self.variacao = variacao
+        self.taxa_erro = taxa_erro
+        self.resposta = resposta
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self.requisicoes = 0
+        self.erros = 0
+
+    def sortear(self):
+        """Retorna (latência, falhar) da próxima requisição."""
+        with self._lock:
+            self.requisicoes += 1
+            latencia = max(0.0, self.latencia + self._aleatorio.uniform(-self.variacao, self.variacao))
+            falhar = self._aleatorio.random() < self.taxa_erro
+            if falhar:
+                self.erros += 1
+        return latencia, falhar
+
+
+configuracao = Configuracao()
+
+
+class _Resposta:
+    def __init__(self, texto, prompt_tokens):
+        self.text = texto
+        resposta_tokens = max(1, len(texto) // 4)
+        self.usage_metadata = types.SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=resposta_tokens,
+            cached_content_token_count=0,
+            total_token_count=prompt_tokens + resposta_tokens,
+        )
+
+    def __iter__(self):
+        palavras = self.text.split(" ")
+        for indice, palavra in enumerate(palavras):
+            yield types.SimpleNamespace(text=palavra if indice == len(palavras) - 1 else palavra + " ")
+
+
+class _Chat:
+    def __init__(self, modelo, history):
+        self.modelo = modelo
+        self.history = list(history or [])
+
+    def send_message(self, mensagem, stream=False):
+        latencia, falhar = configuracao.sortear()
+        time.sleep(latencia)
+        if falhar:
+            raise ErroGeminiFalso(f"Erro simulado em {self.modelo.model_name}")
+        caracteres = len(self.modelo.system_instruction or "") + len(str(mensagem))
+        caracteres += sum(len(parte) for item in self.history for parte in item["parts"])
+        return _Resposta(configuracao.resposta, max(1, caracteres // 4))
+
+
+class GenerativeModel:
+    def __init__(self, model_name, system_instruction=None, **_):
+        self.model_name = f"models/{model_name}"
+        self.system_instruction = system_instruction
+
+    def start_chat(self, history=None):
+        return _Chat(self, history)
+
+
+def instalar(latencia=0.0, variacao=0.0, taxa_erro=0.0, semente=None):
+    """Registra o módulo falso como `google.generativeai` e retorna a configuração (ajustável depois)."""
+    configuracao.latencia = latencia
+    configuracao.variacao = variacao
+    configuracao.taxa_erro = taxa_erro
+    configuracao._aleatorio.seed(semente)
+
+    modulo = types.ModuleType("google.generativeai")
+    modulo.configure = lambda **_: None
+    modulo.GenerativeModel = GenerativeModel
+    try:
+        import google
+    except ImportError:
+        google = types.ModuleType("google")
+        google.__path__ = []
+        sys.modules["google"] = google
+    google.generativeai = modulo
+    sys.modules["google.generativeai"] = modulo
+    return configuracao
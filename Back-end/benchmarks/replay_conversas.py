@@ -0,0 +1,258 @@
+"""
+Replay das conversas gravadas em logs/conversations/*.txt: as mensagens dos usuários são reenviadas ao
+bot (process_web_message), com o Gemini falso (benchmarks/gemini_falso.py) ou com o modelo real.
+
+Serve como benchmark com tráfego real e como teste de regressão: nas conversas do fluxo tradicional,
+cada resposta do bot é comparada com a resposta gravada no log, e as diferenças são listadas (o script
+termina com código 1 se houver alguma). As respostas do fluxo inteligente não são comparadas.
+
+Modos de tempo:
+    original  - respeita os intervalos gravados entre as mensagens (e entre o início das conversas);
+    acelerado - os mesmos intervalos divididos por --fator;
+    maximo    - sem esperas, com até --paralelo conversas ao mesmo tempo.
+
+Cada conversa é reenviada em uma sessão nova, no mesmo tipo de atendimento do log. As conversas
+encerradas durante o replay não são gravadas de novo em logs/.
+
+Uso (na pasta Back-end):
+    python -m benchmarks.replay_conversas [--modo maximo] [--fator 10] [--paralelo 8]
+                                          [--gemini falso|real] [--diretorio logs/conversations] [--saida replay.json]
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks import gemini_falso
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRETORIO_CONVERSAS = os.path.join(PROJECT_ROOT, "logs", "conversations")
+
+_LINHA = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (Usuário|Bot): ?(.*)$")
+
+# turnos: [Turno], na ordem da conversa
+Conversa = namedtuple("Conversa", ["arquivo", "tipo", "turnos"])
+Turno = namedtuple("Turno", ["instante", "mensagem", "resposta"])
+
+
+def ler_conversa(caminho):
+    """Lê um log de conversa. Retorna None se o arquivo não tiver mensagens do usuário."""
+    with open(caminho, "r", encoding="utf-8") as f:
+        linhas = f.read().split("\n")
+
+    tipo = linhas[0].split(":", 1)[1].strip() if linhas and linhas[0].startswith("Tipo de Atendimento:") else None
+    turnos = []  # [instante, mensagem, resposta]
+    atual = None  # lista de partes da entrada sendo lida (as respostas do bot podem ter várias linhas)
+    for linha in linhas[1:]:
+        if linha.startswith("--- Fim da interação"):
+            break
+        encontrada = _LINHA.match(linha)
+        if encontrada is None:
+            if atual is not None and not linha.startswith("--- Início da interação"):
+                atual.append(linha)
+            continue
+        instante, autor, texto = encontrada.groups()
+        atual = [texto]
+        if autor == "Usuário":
+            turnos.append([datetime.strptime(instante, "%Y-%m-%d %H:%M:%S"), atual, None])
+        elif turnos and turnos[-1][2] is None:
+            turnos[-1][2] = atual
+        else:
+            atual = None  # resposta sem mensagem correspondente (não deveria acontecer)
+
+    if not turnos:
+        return None
+    return Conversa(
+        os.path.basename(caminho),
+        tipo,
+        [Turno(instante, "\n".join(mensagem), "\n".join(resposta) if resposta is not None else None)
+         for instante, mensagem, resposta in turnos],
+    )
+
+
+class Replay:
+    def __init__(self, conversas, whatsapp_utils, percentil):
+        self.conversas = conversas
+        self.whatsapp_utils = whatsapp_utils
+        self.percentil = percentil
+        self._lock = threading.Lock()
+        self._tipos = {}  # session_id -> tipo de atendimento do log
+        self.latencias = []
+        self.divergencias = []
+        self.comparadas = 0
+
+        # O primeiro atendimento segue o tipo gravado no log em vez de ser sorteado
+        sortear = whatsapp_utils.iniciar_fluxo_aleatorio
+
+        def fluxo_do_log(session_id, sessao, first_message, stream=False):
+            tipo = self._tipos.get(session_id)
+            if tipo == "tradicional":
+                sessao["tipo_atendimento"] = tipo
+                return whatsapp_utils.fluxo_tradicional(session_id, sessao, first_message, stream)
+            if tipo == "inteligente":
+                sessao["tipo_atendimento"] = tipo
+                return whatsapp_utils.fluxo_inteligente(session_id, sessao, first_message, stream)
+            return sortear(session_id, sessao, first_message, stream)
+
+        whatsapp_utils.iniciar_fluxo_aleatorio = fluxo_do_log
+        # Conversas encerradas no replay não viram logs novos
+        whatsapp_utils.salvar_historico_conversa = lambda *args, **kwargs: None
+
+    def reproduzir(self, indice, conversa, fator=None, pausa_maxima=None):
+        """Reenvia os turnos de uma conversa. Com `fator`, espera entre eles os intervalos gravados divididos por ele."""
+        session_id = f"replay-{indice}"
+        self._tipos[session_id] = conversa.tipo
+        comparar = conversa.tipo == "tradicional"
+        anterior = None
+        for numero, turno in enumerate(conversa.turnos):
+            if fator is not None and anterior is not None:
+                espera = (turno.instante - anterior).total_seconds() / fator
+                if pausa_maxima is not None:
+                    espera = min(espera, pausa_maxima)
+                time.sleep(max(0.0, espera))
+            anterior = turno.instante
+
+            t0 = time.perf_counter()
+            resposta = self.whatsapp_utils.process_web_message(session_id, turno.mensagem)
+            latencia = time.perf_counter() - t0
+            texto = resposta["reply"] if isinstance(resposta, dict) else resposta
+
+            with self._lock:
+                self.latencias.append(latencia)
+                if comparar and turno.resposta is not None:
+                    self.comparadas += 1
+                    if texto != turno.resposta:
+                        self.divergencias.append({
+                            "file": conversa.arquivo,
+                            "turn": numero + 1,
+                            "message": turno.mensagem,
+                            "expected": turno.resposta,
+                            "got": texto,
+                        })
+
+    def executar(self, modo, fator, paralelo, pausa_maxima):
+        inicio = time.perf_counter()
+        if modo == "maximo":
+            with ThreadPoolExecutor(max_workers=paralelo, thread_name_prefix="replay") as executor:
+                for futuro in [executor.submit(self.reproduzir, i, c) for i, c in enumerate(self.conversas)]:
+                    futuro.result()
+        else:
+            # Cada conversa começa no mesmo intervalo (escalado e limitado a pausa_maxima) depois da anterior
+            ordem = sorted(enumerate(self.conversas), key=lambda item: item[1].turnos[0].instante)
+            alvo = inicio
+            anterior = ordem[0][1].turnos[0].instante
+            threads = []
+            for indice, conversa in ordem:
+                alvo += min((conversa.turnos[0].instante - anterior).total_seconds() / fator, pausa_maxima)
+                anterior = conversa.turnos[0].instante
+                time.sleep(max(0.0, alvo - time.perf_counter()))
+                thread = threading.Thread(
+                    target=self.reproduzir, args=(indice, conversa, fator, pausa_maxima), daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+        return time.perf_counter() - inicio
+
+    def relatorio(self, duracao):
+        latencias = self.latencias
+        return {
+            "conversations": len(self.conversas),
+            "messages": len(latencias),
+            "duration_s": round(duracao, 3),
+            "throughput_rps": round(len(latencias) / duracao, 1) if duracao else None,
+            "latency_ms": {
+                "p50": round(self.percentil(latencias, 50) * 1000, 3),
+                "p95": round(self.percentil(latencias, 95) * 1000, 3),
+                "p99": round(self.percentil(latencias, 99) * 1000, 3),
+                "max": round(max(latencias) * 1000, 3),
+            } if latencias else None,
+            "traditional_replies_compared": self.comparadas,
+            "divergences": self.divergencias,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--diretorio", default=DIRETORIO_CONVERSAS, help="pasta com os logs das conversas")
+    parser.add_argument("--modo", choices=["original", "acelerado", "maximo"], default="maximo")
+    parser.add_argument("--fator", type=float, default=10.0, help="aceleração do modo acelerado")
+    parser.add_argument("--pausa-maxima", type=float, default=60.0, help="limite (s) de cada espera entre mensagens")
+    parser.add_argument("--paralelo", type=int, default=8, help="conversas simultâneas no modo maximo")
+    parser.add_argument("--gemini", choices=["falso", "real"], default="falso")
+    parser.add_argument("--latencia", type=float, default=0.0, help="latência do Gemini falso (s)")
+    parser.add_argument("--saida", default=None, help="arquivo JSON com o resultado")
+    args = parser.parse_args(argv)
+
+    conversas = []
+    for caminho in sorted(glob.glob(os.path.join(args.diretorio, "*.txt"))):
+        try:
+            conversa = ler_conversa(caminho)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            print(f"Ignorando {caminho}: {e}", file=sys.stderr)
+            continue
+        if conversa is not None:
+            conversas.append(conversa)
+    if not conversas:
+        print(f"Nenhuma conversa encontrada em {args.diretorio}.", file=sys.stderr)
+        return 2
+
+    # As sessões do replay não vão para o diário (nem são restauradas de execuções anteriores)
+    os.environ["SESSION_JOURNAL"] = "0"
+    os.environ["TURN_EVENTS_DIR"] = tempfile.mkdtemp(prefix="replay-eventos-")
+    if args.gemini == "falso":
+        # Cota em um banco temporário, para o replay não consumir a cota real
+        os.environ["GEMINI_QUOTA_DB"] = os.path.join(tempfile.mkdtemp(prefix="replay-"), "gemini_quota.db")
+        gemini_falso.instalar(latencia=args.latencia)
+    else:
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    import logging
+    from app.config import configure_logging
+    from app.utils import gemini_client, whatsapp_utils
+    from app.utils.circuit_breaker import percentil
+    from app.utils.gemini_quota import GeminiQuota, MODELOS_GEMINI
+
+    configure_logging()
+    logging.disable(logging.ERROR)
+    if args.gemini == "falso":
+        gemini_client.quota = GeminiQuota(
+            os.environ["GEMINI_QUOTA_DB"], [(modelo, 10**6, 10**9) for modelo, _, _ in MODELOS_GEMINI]
+        )
+
+    replay = Replay(conversas, whatsapp_utils, percentil)
+    fator = 1.0 if args.modo == "original" else args.fator
+    duracao = replay.executar(args.modo, fator, args.paralelo, args.pausa_maxima)
+    relatorio = replay.relatorio(duracao)
+    relatorio["mode"] = args.modo
+    relatorio["gemini"] = args.gemini
+
+    print(f"Conversas: {relatorio['conversations']} | mensagens: {relatorio['messages']} em {relatorio['duration_s']}s "
+          f"({relatorio['throughput_rps']} msg/s)")
+    if relatorio["latency_ms"]:
+        latencia = relatorio["latency_ms"]
+        print(f"Latência: p50 {latencia['p50']} ms | p95 {latencia['p95']} ms | p99 {latencia['p99']} ms")
+    print(f"Respostas do fluxo tradicional comparadas: {replay.comparadas} | divergências: {len(replay.divergencias)}")
+    for divergencia in replay.divergencias[:20]:
+        print(f"\n{divergencia['file']} (mensagem {divergencia['turn']}: {divergencia['message']!r})")
+        print(f"  gravada: {divergencia['expected'][:200]!r}")
+        print(f"  atual:   {divergencia['got'][:200]!r}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    return 1 if replay.divergencias else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,80 @@
+import _thread
 import logging
+import os
+import signal
+import threading
 from app import create_app
-from waitress import serve
+from app.utils.lifecycle import ciclo_de_vida, gravar_sessoes_no_desligamento, SHUTDOWN_DRAIN_TIMEOUT
+from app.utils.log_writer import log_writer
+from app.utils.turn_events import registro_eventos
+from waitress import create_server
 
 app = create_app()
 
+
+def restaurar_sessoes():
+    """Religa o diário de sessões e restaura as conversas em andamento no último desligamento."""
+    # Importados depois do create_app, que carrega o .env lido por esses módulos
+    from app.utils.session_store import ligar_diario
+    from app.utils.whatsapp_utils import sessoes
+
+    ligar_diario(sessoes)
+
+
+# Antes da primeira mensagem, mesmo quando o app é servido por outro processo que importa o run.py
+restaurar_sessoes()
+
+# Threads do waitress. Devem ser mais que GEMINI_MAX_CONCURRENT + GEMINI_MAX_QUEUE, para sempre sobrarem
+# threads livres para o fluxo tradicional enquanto mensagens do modo inteligente esperam o Gemini.
+WAITRESS_THREADS = int(os.getenv("WAITRESS_THREADS", "16"))
+# Importa o SDK do Gemini e cria o primeiro modelo logo na partida (o /readyz espera o aquecimento terminar)
+GEMINI_WARMUP = os.getenv("GEMINI_WARMUP", "1") == "1"
+
+
+def aquecer():
+    from app.utils.whatsapp_utils import aquecer_gemini
+
+    ciclo_de_vida.aquecer(aquecer_gemini)
+
+
+def drenar():
+    """Espera as mensagens em andamento terminarem e interrompe o servidor (na thread principal)."""
+    restantes = ciclo_de_vida.drenar(SHUTDOWN_DRAIN_TIMEOUT)
+    if restantes:
+        logging.warning(f"Prazo de desligamento esgotado com {restantes} mensagens ainda em andamento.")
+    _thread.interrupt_main()
+
+
+def ao_receber_sigterm(signum, frame):
+    # A drenagem roda em outra thread: a thread principal precisa continuar no loop do waitress
+    # para entregar as respostas das mensagens em andamento
+    logging.info("SIGTERM recebido. Recusando novas mensagens e aguardando as em andamento...")
+    threading.Thread(target=drenar, name="desligamento", daemon=True).start()
+
+
+def encerrar():
+    """Grava as conversas abertas (se as sessões não sobrevivem ao reinício) e esvazia as filas de logs e de eventos."""
+    from app.utils.whatsapp_utils import encerrar_conversas_abertas, sessoes
+
+    if gravar_sessoes_no_desligamento(sessoes.persistente):
+        logging.info(f"{encerrar_conversas_abertas()} conversas abertas gravadas antes de encerrar.")
+    # Garante que as conversas ainda na fila sejam gravadas antes de encerrar
+    log_writer.parar()
+    registro_eventos.parar()
+
+
 if __name__ == "__main__":
     logging.info("Flask app started")
     #app.run(host="0.0.0.0", port=8000)
-    serve(app, host="0.0.0.0", port=8000)
+    servidor = create_server(app, host="0.0.0.0", port=8000, threads=WAITRESS_THREADS)
+    signal.signal(signal.SIGTERM, ao_receber_sigterm)
+    # O fim da drenagem interrompe o loop do waitress como um Ctrl+C (KeyboardInterrupt); o handler é
+    # reinstalado porque processos iniciados em segundo plano pelo shell herdam o SIGINT ignorado
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    if GEMINI_WARMUP:
+        threading.Thread(target=aquecer, name="aquecimento-gemini", daemon=True).start()
+    try:
+        # Termina com Ctrl+C ou, depois do SIGTERM, quando a drenagem interrompe a thread principal
+        servidor.run()
+    finally:
+        encerrar()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Os testes não usam o diário, os eventos nem o índice de busca do servidor (os que precisam criam os seus em tmp_path)
+os.environ.setdefault("SESSION_JOURNAL", "0")
+os.environ.setdefault("TURN_EVENTS", "0")
+os.environ.setdefault("LOG_SEARCH", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
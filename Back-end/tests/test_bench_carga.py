@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+
+BACK_END = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_bench_carga_gera_o_relatorio(tmp_path):
+    # Em um processo separado: o Gemini falso precisa ser instalado antes de o app ser importado
+    saida = tmp_path / "carga.json"
+    ambiente = dict(os.environ, SESSION_JOURNAL="0", TURN_EVENTS="0", LOG_SEARCH="0")
+    processo = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_carga", "--usuarios", "3", "--conversas", "1",
+         "--latencia", "0", "--variacao", "0", "--threads", "4", "--semente", "1", "--saida", str(saida)],
+        cwd=BACK_END, env=ambiente, capture_output=True, text=True, timeout=120,
+    )
+    assert processo.returncode == 0, processo.stderr
+
+    relatorio = json.loads(saida.read_text(encoding="utf-8"))
+    assert relatorio["requests"] > 3
+    assert relatorio["status_codes"] == {"200": relatorio["requests"]}
+    assert sum(relatorio["conversations"].values()) == 3
+    assert relatorio["latency_by_state"]
+    for dados in relatorio["latency_by_state"].values():
+        assert dados["count"] > 0 and dados["p95_ms"] >= dados["p50_ms"]
+    assert set(relatorio["rss_mb"]) == {"start", "end", "growth"}
@@ -0,0 +1,124 @@
+import types
+
+import pytest
+
+from app.utils import gemini_client
+from app.utils.circuit_breaker import ABERTO, FECHADO, MEIO_ABERTO, TESTE, CircuitBreaker
+from app.utils.gemini_quota import GeminiQuota
+
+
+def _aberto(nome="modelo"):
+    """Circuito aberto por taxa de erro, com tempo_aberto=0 para já poder ser testado."""
+    breaker = CircuitBreaker(nome, minimo_requisicoes=2, taxa_erro=0.5, tempo_aberto=0)
+    breaker.registrar_falha(0.1)
+    breaker.registrar_falha(0.1)
+    assert breaker.estado()["state"] == ABERTO
+    return breaker
+
+
+def test_abre_pela_taxa_de_erro():
+    breaker = CircuitBreaker("modelo", minimo_requisicoes=4, taxa_erro=0.5, tempo_aberto=30)
+    breaker.registrar_sucesso(0.1)
+    breaker.registrar_sucesso(0.1)
+    breaker.registrar_falha(0.1)
+    assert breaker.disponivel()
+    breaker.registrar_falha(0.1)
+    assert breaker.estado()["state"] == ABERTO
+    assert not breaker.disponivel(reservar=True)
+
+
+def test_meio_aberto_libera_um_unico_teste():
+    breaker = _aberto()
+    assert breaker.disponivel(reservar=True) == TESTE
+    assert breaker.estado()["state"] == MEIO_ABERTO
+    assert breaker.disponivel(reservar=True) is False
+    assert breaker.disponivel() is False
+    breaker.registrar_sucesso(0.1)
+    assert breaker.estado()["state"] == FECHADO
+    assert breaker.disponivel(reservar=True) is True
+
+
+def test_teste_com_falha_abre_de_novo():
+    breaker = _aberto()
+    assert breaker.disponivel(reservar=True) == TESTE
+    breaker.registrar_falha(0.1)
+    assert breaker.estado()["state"] == ABERTO
+    assert breaker.estado()["times_opened"] == 2
+
+
+def test_teste_com_latencia_acima_do_limite_abre_de_novo():
+    breaker = _aberto()
+    breaker.p95_maximo = 1
+    assert breaker.disponivel(reservar=True) == TESTE
+    breaker.registrar_sucesso(5)
+    assert breaker.estado()["state"] == ABERTO
+
+
+def test_cancelar_devolve_o_teste():
+    breaker = _aberto()
+    assert breaker.disponivel(reservar=True) == TESTE
+    breaker.cancelar()
+    assert breaker.estado()["state"] == MEIO_ABERTO
+    assert breaker.disponivel(reservar=True) == TESTE
+
+
+def test_cancelar_com_circuito_fechado_nao_faz_nada():
+    breaker = CircuitBreaker("modelo")
+    breaker.cancelar()
+    assert breaker.disponivel(reservar=True) is True
+
+
+class _ModeloFalso:
+    def __init__(self, trechos):
+        self.trechos = trechos
+
+    def start_chat(self, history=None):
+        return self
+
+    def send_message(self, mensagem, stream=False):
+        return [types.SimpleNamespace(text=trecho) for trecho in self.trechos]
+
+
+@pytest.fixture
+def cliente_gemini(tmp_path, monkeypatch):
+    """gemini_client com breakers novos, cota em tmp_path e um modelo falso em todos os níveis."""
+    breakers = {modelo: CircuitBreaker(modelo, minimo_requisicoes=2, tempo_aberto=0) for modelo in gemini_client.ORDEM_MODELOS}
+    monkeypatch.setattr(gemini_client, "breakers", breakers)
+    monkeypatch.setattr(gemini_client, "quota", GeminiQuota(str(tmp_path / "cota.db")))
+    monkeypatch.setattr(gemini_client, "_obter_modelo", lambda modelo, instrucao: _ModeloFalso(["Olá", ", tudo bem?"]))
+    return breakers
+
+
+def test_stream_fechado_no_meio_libera_o_teste(cliente_gemini):
+    modelo = gemini_client.ORDEM_MODELOS[0]
+    breaker = cliente_gemini[modelo]
+    breaker.registrar_falha(0.1)
+    breaker.registrar_falha(0.1)
+
+    trechos = gemini_client.enviar_stream([], "oi")
+    assert next(trechos) == (modelo, "Olá")
+    assert breaker.disponivel(reservar=True) is False  # o teste está com este stream
+    trechos.close()  # cliente desconectado
+    assert breaker.estado()["state"] == MEIO_ABERTO
+    assert breaker.disponivel(reservar=True) == TESTE
+
+
+def test_stream_completo_fecha_o_circuito(cliente_gemini):
+    modelo = gemini_client.ORDEM_MODELOS[0]
+    breaker = cliente_gemini[modelo]
+    breaker.registrar_falha(0.1)
+    breaker.registrar_falha(0.1)
+
+    assert [trecho for _, trecho in gemini_client.enviar_stream([], "oi")] == ["Olá", ", tudo bem?"]
+    assert breaker.estado()["state"] == FECHADO
+
+
+def test_escolher_modelo_devolve_os_testes_dos_niveis_nao_escolhidos(cliente_gemini):
+    primeiro, segundo = gemini_client.ORDEM_MODELOS[:2]
+    breaker = cliente_gemini[segundo]
+    breaker.registrar_falha(0.1)
+    breaker.registrar_falha(0.1)
+
+    # O segundo nível reserva o teste ao ser verificado, mas o primeiro é o escolhido
+    assert gemini_client.escolher_modelo() == primeiro
+    assert breaker.disponivel(reservar=True) == TESTE
@@ -0,0 +1,30 @@
+from app.utils.idempotency import TabelaIdempotencia
+
+
+def test_limite_de_tamanho_nao_remove_mensagem_em_andamento():
+    tabela = TabelaIdempotencia(ttl=60, max_entradas=2)
+    original, nova = tabela.iniciar("s", "m1")
+    assert nova
+    concluida, _ = tabela.iniciar("s", "m2")
+    tabela.concluir(concluida, "ok")
+    tabela.iniciar("s", "m3")
+
+    # A m2 (já concluída) sai no lugar da m1, que ainda está em processamento
+    repeticao, nova = tabela.iniciar("s", "m1")
+    assert not nova and repeticao is original
+    assert tabela.iniciar("s", "m2")[1]
+    assert tabela.estatisticas()["evictions"] >= 1
+
+
+def test_ttl_nao_expira_mensagem_em_andamento():
+    tabela = TabelaIdempotencia(ttl=0, max_entradas=10)
+    original, _ = tabela.iniciar("s", "m1")
+    concluida, _ = tabela.iniciar("s", "m2")
+    tabela.concluir(concluida, "ok")
+
+    repeticao, nova = tabela.iniciar("s", "m1")
+    assert not nova and repeticao is original
+    assert tabela.iniciar("s", "m2")[1]
+
+    tabela.concluir(original, "resposta")
+    assert tabela.iniciar("s", "m1")[1]
@@ -0,0 +1,28 @@
+import json
+
+from app.utils import log_index
+
+
+def test_entradas_registradas_no_intervalo_sao_compactadas_depois(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_index, "LOG_INDEX_COMPACT_INTERVAL", 3600)
+    diretorio = str(tmp_path)
+    log_index.registrar(log_index.INDICE_CONVERSAS, "a_2024-01-01_10-00-00.txt", diretorio)
+    # A segunda gravação fica dentro do intervalo: só vai para o .jsonl
+    log_index.registrar(log_index.INDICE_CONVERSAS, "b_2024-01-02_10-00-00.txt", diretorio)
+    with open(tmp_path / "log-list.json", encoding="utf-8") as f:
+        assert json.load(f) == ["a_2024-01-01_10-00-00.txt"]
+
+    log_index.compactar_pendentes()
+    with open(tmp_path / "log-list.json", encoding="utf-8") as f:
+        assert json.load(f) == ["b_2024-01-02_10-00-00.txt", "a_2024-01-01_10-00-00.txt"]
+
+
+def test_ler_indice_inclui_compactacao_interrompida(tmp_path):
+    diretorio = str(tmp_path)
+    (tmp_path / "log-list.json").write_text(json.dumps(["b_2024-01-03_10-00-00.txt"]), encoding="utf-8")
+    (tmp_path / "log-list.jsonl.1.compactando").write_text(
+        json.dumps({"arquivo": "c_2024-01-04_10-00-00.txt"}) + "\n", encoding="utf-8")
+    (tmp_path / "log-list.jsonl").write_text(json.dumps({"arquivo": "a_2024-01-01_10-00-00.txt"}) + "\n", encoding="utf-8")
+    assert log_index.ler_indice(log_index.INDICE_CONVERSAS, diretorio) == [
+        "c_2024-01-04_10-00-00.txt", "b_2024-01-03_10-00-00.txt", "a_2024-01-01_10-00-00.txt",
+    ]
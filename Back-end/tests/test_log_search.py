@@ -0,0 +1,80 @@
+from app.utils import log_index
+from app.utils.log_search import ORDEM_RELEVANCIA, IndiceBusca
+
+
+def _conversa(session_id, inicio, falas):
+    """(indice, nome_arquivo, conteudo) de um log de conversa; `falas` são (horário, autor, texto)."""
+    linhas = [f"--- Início da interação: {inicio} ---"]
+    linhas += [f"[{momento}] {autor}: {texto}" for momento, autor, texto in falas]
+    conteudo = "Tipo de Atendimento: Tradicional\n\n" + "\n".join(linhas)
+    nome_arquivo = f"{session_id}_{inicio.replace(' ', '_').replace(':', '-')}.txt"
+    return log_index.INDICE_CONVERSAS, nome_arquivo, conteudo
+
+
+ANTIGA = _conversa("antiga", "2024-03-01 09:00:00", [
+    ("2024-03-01 09:00:05", "Usuário", "quero pamonha doce"),
+    ("2024-03-01 09:00:06", "Bot", "Pamonha Doce anotada"),
+])
+RECENTE = _conversa("recente", "2024-05-10 18:30:00", [
+    ("2024-05-10 18:30:02", "Usuário", "tem pamonha salgada?"),
+    ("2024-05-10 18:30:03", "Bot", "Temos pamonha salgada sim"),
+])
+
+
+def test_recentes_seguem_o_horario_das_falas_e_nao_a_ordem_de_indexacao(tmp_path):
+    indice = IndiceBusca(str(tmp_path / "busca.db"))
+    # A conversa recente entra pela indexação ao vivo e a antiga por um reindexar posterior
+    indice.indexar_lote([RECENTE])
+    indice.indexar_lote([ANTIGA])
+
+    itens, ha_mais = indice.buscar("pamonha")
+    assert [item["time"] for item in itens] == [
+        "2024-05-10 18:30:03", "2024-05-10 18:30:02", "2024-03-01 09:00:06", "2024-03-01 09:00:05",
+    ]
+    assert not ha_mais
+    assert itens[0]["session_id"] == "recente"
+    assert "[pamonha]" in itens[0]["snippet"].lower()
+
+
+def test_paginacao_mantem_a_ordem(tmp_path):
+    indice = IndiceBusca(str(tmp_path / "busca.db"))
+    indice.indexar_lote([RECENTE])
+    indice.indexar_lote([ANTIGA])
+
+    primeira, ha_mais = indice.buscar("pamonha", limite=3)
+    segunda, ha_mais_depois = indice.buscar("pamonha", limite=3, deslocamento=3)
+    assert ha_mais and not ha_mais_depois
+    assert [item["time"] for item in primeira + segunda] == [
+        "2024-05-10 18:30:03", "2024-05-10 18:30:02", "2024-03-01 09:00:06", "2024-03-01 09:00:05",
+    ]
+
+
+def test_filtro_de_datas_usa_o_horario_das_falas(tmp_path):
+    indice = IndiceBusca(str(tmp_path / "busca.db"))
+    indice.indexar_lote([RECENTE])
+    indice.indexar_lote([ANTIGA])
+
+    itens, _ = indice.buscar("pamonha", data_inicial="2024-03-01", data_final="2024-03-01")
+    assert {item["session_id"] for item in itens} == {"antiga"}
+    itens, _ = indice.buscar("pamonha", data_inicial="2024-04-01")
+    assert {item["session_id"] for item in itens} == {"recente"}
+    itens, _ = indice.buscar("pamonha", data_final="2024-02-28")
+    assert itens == []
+
+
+def test_filtro_de_autor_e_relevancia(tmp_path):
+    indice = IndiceBusca(str(tmp_path / "busca.db"))
+    indice.indexar_lote([RECENTE, ANTIGA])
+
+    itens, _ = indice.buscar("salgada", autor="user")
+    assert [(item["session_id"], item["speaker"]) for item in itens] == [("recente", "user")]
+    itens, _ = indice.buscar("pamonha", ordem=ORDEM_RELEVANCIA)
+    assert len(itens) == 4
+
+
+def test_arquivo_ja_indexado_e_ignorado(tmp_path):
+    indice = IndiceBusca(str(tmp_path / "busca.db"))
+    assert indice.indexar_lote([ANTIGA]) == 1
+    assert indice.indexar_lote([ANTIGA]) == 0
+    itens, _ = indice.buscar("doce")
+    assert len(itens) == 2
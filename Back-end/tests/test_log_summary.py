@@ -0,0 +1,29 @@
+from app.utils.log_summary import RESULTADO_SUCESSO, RESULTADO_SUCESSO_COM_ERROS, resumir_conversa
+
+CABECALHO = "Tipo de Atendimento: tradicional\n--- Início da interação: 2024-01-01 10:00:00 ---\n"
+
+
+def test_resposta_marcada_conta_um_erro_pelo_marcador():
+    conteudo = CABECALHO + (
+        "[2024-01-01 10:00:01] Usuário: 9\n"
+        "--- Resposta com erro: invalid_option ---\n"
+        "[2024-01-01 10:00:01] Bot: Número inválido. Por favor, escolha um número da lista.\n"
+        "[2024-01-01 10:00:02] Usuário: 0\n"
+        "--- Resposta com erro: invalid_quantity ---\n"
+        "[2024-01-01 10:00:02] Bot: Quantidade inválida. Por favor, insira um número maior que zero.\n"
+    )
+    resumo = resumir_conversa("s1_2024-01-01_10-00-00.txt", conteudo)
+    assert resumo["bot_errors"] == 2
+    assert resumo["bot_messages"] == 2
+    assert resumo["outcome"] == RESULTADO_SUCESSO_COM_ERROS
+
+
+def test_logs_sem_marcador_seguem_contados_pelo_texto():
+    conteudo = CABECALHO + (
+        "[2024-01-01 10:00:01] Usuário: 9\n"
+        "[2024-01-01 10:00:01] Bot: Número inválido. Por favor, escolha um número da lista.\n"
+        "[2024-01-01 10:00:02] Usuário: 0\n"
+        "[2024-01-01 10:00:02] Bot: Quantidade inválida. Por favor, insira um número maior que zero.\n"
+    )
+    assert resumir_conversa("s1_2024-01-01_10-00-00.txt", conteudo)["bot_errors"] == 1
+    assert resumir_conversa("s1_2024-01-01_10-00-00.txt", CABECALHO)["outcome"] == RESULTADO_SUCESSO
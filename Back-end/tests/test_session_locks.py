@@ -0,0 +1,85 @@
+import threading
+import time
+
+from app.utils.session_locks import TravasSessao
+
+
+def _esperar(condicao, timeout=2):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "tempo esgotado"
+        time.sleep(0.005)
+
+
+def test_sessoes_diferentes_nao_esperam_umas_pelas_outras():
+    travas = TravasSessao(timeout=0.05)
+    liberar_a = travas.adquirir("a")
+    inicio = time.monotonic()
+    liberar_b = travas.adquirir("b")
+    assert liberar_b is not None
+    assert time.monotonic() - inicio < 0.05
+    assert travas.estatisticas()["contended"] == 0
+    liberar_b()
+    liberar_a()
+
+
+def test_mesma_sessao_espera_e_desiste_apos_o_timeout():
+    travas = TravasSessao(timeout=0.05)
+    liberar = travas.adquirir("a")
+    assert travas.adquirir("a") is None
+    assert travas.estatisticas()["timeouts"] == 1
+    liberar()
+    liberar = travas.adquirir("a")
+    assert liberar is not None
+    liberar()
+
+
+def test_mensagens_da_mesma_sessao_sao_atendidas_na_ordem_de_chegada():
+    travas = TravasSessao(timeout=5)
+    ordem = []
+
+    def mensagem(numero):
+        liberar = travas.adquirir("a")
+        ordem.append(numero)
+        liberar()
+
+    liberar = travas.adquirir("a")
+    threads = []
+    for numero in range(5):
+        thread = threading.Thread(target=mensagem, args=(numero,))
+        thread.start()
+        threads.append(thread)
+        # A próxima só chega depois que esta já está na fila
+        _esperar(lambda: travas._travas["a"].proxima_senha == numero + 2)
+    liberar()
+    for thread in threads:
+        thread.join(5)
+    assert ordem == [0, 1, 2, 3, 4]
+
+
+def test_desistente_nao_trava_a_fila():
+    travas = TravasSessao(timeout=5)
+    liberar = travas.adquirir("a")
+    travas.timeout = 0.05
+    assert travas.adquirir("a") is None
+    travas.timeout = 5
+    atendida = []
+    thread = threading.Thread(target=lambda: atendida.append(travas.adquirir("a")))
+    thread.start()
+    _esperar(lambda: travas._travas["a"].proxima_senha == 3)
+    liberar()
+    thread.join(5)
+    assert atendida and atendida[0] is not None
+    atendida[0]()
+
+
+def test_trava_e_descartada_quando_ninguem_usa():
+    travas = TravasSessao(timeout=0.05)
+    liberar_a = travas.adquirir("a")
+    liberar_b = travas.adquirir("b")
+    assert travas.estatisticas()["active_sessions"] == 2
+    assert travas.adquirir("a") is None
+    liberar_a()
+    liberar_b()
+    assert travas.estatisticas()["active_sessions"] == 0
+    assert travas._travas == {}
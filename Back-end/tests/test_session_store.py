@@ -0,0 +1,126 @@
+import pytest
+
+from app.utils import whatsapp_utils
+from app.utils.session_journal import DiarioSessoes
+from app.utils.session_store import MemorySessionBackend, SessaoAlterada, SQLiteSessionBackend
+
+
+def _backend_com_diario(diretorio, ttl_segundos=1800):
+    diario = DiarioSessoes(diretorio=str(diretorio))
+    backend = MemorySessionBackend(ttl_segundos=ttl_segundos, ao_expirar=whatsapp_utils._finalizar_sessao_expirada,
+                                   diario=diario)
+    backend.restaurar(diario.restaurar())
+    return backend, diario
+
+
+def test_conversa_gravada_no_desligamento_nao_e_gravada_de_novo_apos_restaurar(tmp_path, monkeypatch):
+    gravadas = []
+    monkeypatch.setattr(whatsapp_utils, "salvar_historico_conversa",
+                        lambda session_id, historico, tipo: gravadas.append(list(historico)))
+    backend, diario = _backend_com_diario(tmp_path)
+    monkeypatch.setattr(whatsapp_utils, "sessoes", backend)
+
+    # Uma mensagem ainda em andamento quando o desligamento grava as conversas abertas
+    sessao = backend.obter("s1")
+    sessao["historico"] += ["[Usuário]: oi", "[Bot]: olá"]
+    assert whatsapp_utils.encerrar_conversas_abertas() == 1
+    backend.salvar("s1", sessao)
+    diario.parar()
+    assert len(gravadas) == 1
+
+    # No reinício, o diário restaura a sessão; ao expirar, a conversa já gravada não gera outro arquivo
+    backend, diario = _backend_com_diario(tmp_path, ttl_segundos=0)
+    assert "s1" in backend
+    backend.expirar()
+    diario.parar()
+    assert len(gravadas) == 1
+
+
+def test_mensagens_novas_apos_restaurar_sao_gravadas_ao_expirar(tmp_path, monkeypatch):
+    gravadas = []
+    monkeypatch.setattr(whatsapp_utils, "salvar_historico_conversa",
+                        lambda session_id, historico, tipo: gravadas.append(list(historico)))
+    backend, diario = _backend_com_diario(tmp_path)
+    monkeypatch.setattr(whatsapp_utils, "sessoes", backend)
+
+    sessao = backend.obter("s1")
+    sessao["historico"] += ["[Usuário]: oi", "[Bot]: olá"]
+    whatsapp_utils.encerrar_conversas_abertas()
+    sessao["historico"] += ["[Usuário]: ainda está aí?"]
+    backend.salvar("s1", sessao)
+    diario.parar()
+
+    backend, diario = _backend_com_diario(tmp_path, ttl_segundos=0)
+    backend.expirar()
+    diario.parar()
+    assert len(gravadas) == 2
+    assert gravadas[1][-2] == "[Usuário]: ainda está aí?"
+
+
+def test_sessao_em_processamento_nao_e_removida_pelo_limite():
+    removidas = []
+    backend = MemorySessionBackend(max_entradas=2, ao_expirar=lambda session_id, sessao, t: removidas.append(session_id))
+    em_uso = backend.obter("a")
+    backend.salvar("b", backend.obter("b"))
+    backend.salvar("c", backend.obter("c"))
+    # "a" é a menos usada recentemente, mas está entre o obter e o salvar
+    assert removidas == ["b"]
+    assert "a" in backend
+    backend.salvar("a", em_uso)
+    assert len(backend) == 2
+
+
+def test_sessao_em_processamento_nao_expira():
+    removidas = []
+    backend = MemorySessionBackend(ttl_segundos=0, ao_expirar=lambda session_id, sessao, t: removidas.append(session_id))
+    sessao = backend.obter("a")
+    assert backend.expirar() == 0
+    backend.salvar("a", sessao)
+    assert backend.expirar() == 1
+    assert removidas == ["a"]
+
+
+def test_sqlite_recusa_gravacao_de_sessao_alterada_por_outro_worker(tmp_path):
+    caminho = str(tmp_path / "sessoes.db")
+    worker_a = SQLiteSessionBackend(caminho)
+    worker_b = SQLiteSessionBackend(caminho)
+
+    sessao_a = worker_a.obter("s1")
+    sessao_b = worker_b.obter("s1")
+    sessao_a["status"] = "pedido"
+    worker_a.salvar("s1", sessao_a)
+    sessao_b["status"] = "cardapio"
+    with pytest.raises(SessaoAlterada):
+        worker_b.salvar("s1", sessao_b)
+
+    assert worker_b.obter("s1")["status"] == "pedido"
+    assert worker_b.estatisticas()["conflicts"] == 1
+
+
+def test_sqlite_recusa_gravacao_de_sessao_removida_durante_a_mensagem(tmp_path):
+    caminho = str(tmp_path / "sessoes.db")
+    worker_a = SQLiteSessionBackend(caminho)
+    worker_b = SQLiteSessionBackend(caminho)
+
+    sessao = worker_a.obter("s1")
+    worker_b.remover("s1")
+    with pytest.raises(SessaoAlterada):
+        worker_a.salvar("s1", sessao)
+    assert "s1" not in worker_a
+
+
+def test_sqlite_limite_nao_remove_sessao_em_uso_em_outro_worker(tmp_path):
+    caminho = str(tmp_path / "sessoes.db")
+    worker_a = SQLiteSessionBackend(caminho, max_entradas=1, em_uso_segundos=60)
+    worker_b = SQLiteSessionBackend(caminho, max_entradas=1, em_uso_segundos=60)
+
+    sessao = worker_a.obter("s1")
+    worker_b.obter("s2")
+    assert len(worker_b) == 2
+    sessao["status"] = "pedido"
+    worker_a.salvar("s1", sessao)
+
+    # Sem a proteção, a menos usada recentemente sai pelo limite
+    worker_c = SQLiteSessionBackend(caminho, max_entradas=1, em_uso_segundos=0)
+    worker_c.obter("s3")
+    assert len(worker_c) == 1 and worker_c.estatisticas()["evictions"] == 2
@@ -13,10 +13,26 @@ document.addEventListener('DOMContentLoaded', () => {
     const summaryInfo = document.getElementById('chat-summary-info');
     const tipoAtendimentoEl = document.getElementById('atendimento-tipo');
     const tempoInteracaoEl = document.getElementById('atendimento-tempo');
+    const filterFrom = document.getElementById('filter-from');
+    const filterTo = document.getElementById('filter-to');
+    const filterBotType = document.getElementById('filter-bot-type');
+    const filterOutcome = document.getElementById('filter-outcome');
+    const pagePrev = document.getElementById('page-prev');
+    const pageNext = document.getElementById('page-next');
+    const pageInfo = document.getElementById('page-info');
+
+    // --- CONFIGURAÇÃO DA API DE LOGS (Back-end, rota /logs) ---
+    const LOGS_API_URL = 'https://SEU-DOMINIO-DO-NGROK.app/logs';
+    const LOGS_API_TOKEN = ''; // Preencha se o LOGS_API_TOKEN estiver definido no .env do Back-end
+    const PER_PAGE = 50;
+    const API_TYPES = { conversas: 'conversations', questionarios: 'questionnaires' };
 
     // --- ESTADO DA APLICAÇÃO ---
-    let allLogs = []; // Array único para guardar todos os logs carregados
     let currentView = 'conversas';
+    let currentPage = 1;
+    let currentItems = []; // Resumos da página atual (vindos do servidor)
+    const contentCache = new Map(); // Conteúdo dos arquivos já abertos (os logs não mudam depois de gravados)
+    let listRequest = 0; // Descarta respostas de listas que chegaram depois de uma mais nova
 
     // --- FUNÇÕES DE RENDERIZAÇÃO ---
 
@@ -64,6 +80,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 } else if ((match = line.match(messageRegex))) {
                     if (currentMessageObject) { messages.push(currentMessageObject); }
                     currentMessageObject = { time: match[1], text: match[3], type: (match[2] === 'Usuário' ? 'received' : 'sent') };
+                } else if (line.startsWith('--- ')) { // Marcações do back-end (ex.: "--- Resposta com erro: ... ---") não são mensagens
                 } else if (currentMessageObject && line.trim() !== '') { currentMessageObject.text += '\n' + line; }
             }
             if (currentMessageObject) { messages.push(currentMessageObject); }
@@ -95,117 +112,132 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- LÓGICA PRINCIPAL ---
 
-    function filterAndDisplayList() {
-        const searchTerm = searchBox.value.toLowerCase();
-        const filteredLogs = allLogs.filter(log => {
-            if (log.type !== currentView) return false;
-            if (searchTerm === '') return true;
-            const filenameMatch = log.filename.toLowerCase().includes(searchTerm);
-            const contentMatch = log.rawContent.toLowerCase().includes(searchTerm);
-            return filenameMatch || contentMatch;
-        });
+    function apiFetch(path) {
+        const headers = LOGS_API_TOKEN ? { 'Authorization': `Bearer ${LOGS_API_TOKEN}` } : {};
+        // A lista vem com ETag: o navegador revalida com If-None-Match e reaproveita a resposta em cache (304)
+        return fetch(`${LOGS_API_URL}/${path}`, { headers });
+    }
 
-        logSelector.innerHTML = '';
-        if (filteredLogs.length === 0) {
-            logSelector.innerHTML = `<option>Nenhum resultado encontrado.</option>`;
-        } else {
-            filteredLogs.forEach(log => {
-                const option = document.createElement('option');
-                option.value = log.filename;
-                option.textContent = log.filename;
-                logSelector.appendChild(option);
-            });
-        }
-        displaySelectedFile();
+    function buildQuery() {
+        const params = new URLSearchParams({ page: currentPage, per_page: PER_PAGE });
+        const filters = {
+            q: searchBox.value.trim(),
+            from: filterFrom.value,
+            to: filterTo.value,
+            bot_type: filterBotType.value,
+            outcome: currentView === 'conversas' ? filterOutcome.value : ''
+        };
+        Object.entries(filters).forEach(([key, value]) => { if (value) params.set(key, value); });
+        return params.toString();
     }
 
-    async function loadAllData() {
+    function formatDuration(seconds) {
+        if (seconds === null || seconds === undefined) return 'N/D';
+        return `${Math.floor(seconds / 60)} min e ${seconds % 60} seg`;
+    }
+
+    async function loadPage() {
+        const requestNumber = ++listRequest;
         currentView = document.querySelector('.view-button.active').dataset.view;
         listTitle.textContent = currentView === 'conversas' ? 'Conversas Salvas' : 'Questionários Salvos';
-        const listUrl = currentView === 'conversas' ? '../Back-end/logs/log-list.json' : '../Back-end/logs/questionario-list.json';
-        const baseUrl = currentView === 'conversas' ? '../Back-end/logs/conversations/' : '../Back-end/logs/questionarios/';
-
-        logSelector.innerHTML = '<option>Carregando e analisando todos os logs...</option>';
+        filterOutcome.classList.toggle('hidden', currentView !== 'conversas');
+        logSelector.innerHTML = '<option>Carregando...</option>';
         displaySelectedFile();
-        
+
         try {
-            const listResponse = await fetch(listUrl);
-            if (!listResponse.ok) throw new Error('Arquivo de índice não encontrado');
-            const filenames = await listResponse.json();
-
-            if (filenames.length === 0) {
-                allLogs = allLogs.filter(log => log.type !== currentView); // Limpa os dados do tipo atual
-                filterAndDisplayList();
-                return;
+            const response = await apiFetch(`${API_TYPES[currentView]}?${buildQuery()}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const data = await response.json();
+            if (requestNumber !== listRequest) return;
+
+            currentItems = data.items;
+            logSelector.innerHTML = '';
+            if (currentItems.length === 0) {
+                logSelector.innerHTML = `<option>Nenhum resultado encontrado.</option>`;
+            } else {
+                currentItems.forEach(item => {
+                    const option = document.createElement('option');
+                    option.value = item.file;
+                    option.textContent = item.file;
+                    logSelector.appendChild(option);
+                });
             }
-
-            const fetchPromises = filenames.map(file => 
-                fetch(baseUrl + file)
-                    .then(res => res.ok ? res.text() : "Erro ao carregar conteúdo")
-                    .then(content => {
-                        const parsedData = parseLogContent(content, currentView);
-                        return { 
-                            filename: file, 
-                            rawContent: content, // Guarda o texto bruto para a pesquisa
-                            type: currentView,
-                            ...parsedData // Adiciona .summary e .messages
-                        };
-                    })
-            );
-
-            const results = await Promise.all(fetchPromises);
-            // Remove os logs antigos do tipo atual e adiciona os novos
-            allLogs = allLogs.filter(log => log.type !== currentView).concat(results);
-            filterAndDisplayList();
+            pageInfo.textContent = data.total ? `Página ${data.page} de ${data.pages} (${data.total})` : '-';
+            pagePrev.disabled = data.page <= 1;
+            pageNext.disabled = data.page >= data.pages;
+            displaySelectedFile();
 
         } catch (error) {
+            if (requestNumber !== listRequest) return;
             console.error(`Erro ao carregar dados:`, error);
             logSelector.innerHTML = `<option>Erro ao carregar.</option>`;
+            pageInfo.textContent = '-';
+        }
+    }
+
+    async function fetchContent(filename) {
+        const key = `${currentView}/${filename}`;
+        if (!contentCache.has(key)) {
+            const response = await apiFetch(`${API_TYPES[currentView]}/${encodeURIComponent(filename)}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            contentCache.set(key, await response.text());
         }
+        return contentCache.get(key);
     }
 
-    function displaySelectedFile() {
+    async function displaySelectedFile() {
         const selectedFile = logSelector.value;
         summaryInfo.classList.toggle('hidden', currentView !== 'conversas');
         chatMessages.innerHTML = ''; // Limpa a tela
-        
-        if (!selectedFile || logSelector.options.length === 0 || logSelector.options[0].textContent.includes('Nenhum')) {
+
+        const item = currentItems.find(log => log.file === selectedFile);
+        if (!item) {
             chatMessages.innerHTML = `<div class="message received"><p>Selecione ou pesquise por um item na lista.</p></div>`;
             return;
         }
-        
-        const logData = allLogs.find(log => log.filename === selectedFile);
 
-        if (logData) {
-            if (currentView === 'conversas') {
-                tipoAtendimentoEl.textContent = logData.summary.tipoAtendimento;
-                tempoInteracaoEl.textContent = logData.summary.tempoInteracao;
-            }
-            logData.messages.forEach(msg => displayMessage(msg));
+        // O resumo vem na lista; o conteúdo do arquivo só é baixado quando ele é aberto
+        if (currentView === 'conversas') {
+            tipoAtendimentoEl.textContent = item.bot_type || 'Não informado';
+            tempoInteracaoEl.textContent = formatDuration(item.duration_seconds);
+        }
+        try {
+            const content = await fetchContent(selectedFile);
+            if (logSelector.value !== selectedFile) return; // Outro arquivo foi selecionado enquanto este carregava
+            chatMessages.innerHTML = '';
+            parseLogContent(content, currentView).messages.forEach(msg => displayMessage(msg));
             chatMessages.scrollTop = chatMessages.scrollHeight;
+        } catch (error) {
+            console.error(`Erro ao carregar o arquivo ${selectedFile}:`, error);
+            chatMessages.innerHTML = `<div class="message received"><p>Erro ao carregar o conteúdo.</p></div>`;
         }
     }
 
+    function reloadFromFirstPage() {
+        currentPage = 1;
+        loadPage();
+    }
+
     // --- EVENT LISTENERS E INICIALIZAÇÃO ---
     viewButtons.forEach(button => {
         button.addEventListener('click', (e) => {
             if (e.target.classList.contains('active')) return;
             viewButtons.forEach(btn => btn.classList.remove('active'));
             e.target.classList.add('active');
-            // Recarrega os dados apenas se eles ainda não foram carregados
-            const currentData = allLogs.filter(log => log.type === e.target.dataset.view);
-            if(currentData.length === 0) {
-                loadAllData();
-            } else {
-                currentView = e.target.dataset.view;
-                listTitle.textContent = currentView === 'conversas' ? 'Conversas Salvas' : 'Questionários Salvos';
-                filterAndDisplayList();
-            }
+            reloadFromFirstPage();
         });
     });
 
-    searchBox.addEventListener('input', filterAndDisplayList);
+    // A pesquisa espera uma pausa na digitação para não pedir uma lista a cada tecla
+    let searchTimer = null;
+    searchBox.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(reloadFromFirstPage, 300);
+    });
+    [filterFrom, filterTo, filterBotType, filterOutcome].forEach(el => el.addEventListener('change', reloadFromFirstPage));
+    pagePrev.addEventListener('click', () => { currentPage -= 1; loadPage(); });
+    pageNext.addEventListener('click', () => { currentPage += 1; loadPage(); });
     logSelector.addEventListener('change', displaySelectedFile);
     
-    loadAllData(); // Carrega os dados iniciais
+    loadPage(); // Carrega a primeira página
 });
\ No newline at end of file
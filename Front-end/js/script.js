@@ -4,6 +4,8 @@ document.addEventListener('DOMContentLoaded', () => {
     if (!chatContainer) { return; }
 
     const BACKEND_URL = 'https://SEU-DOMINIO-DO-NGROK.app/chat';
+    // Endpoint SSE: as respostas do Gemini aparecem à medida que são geradas
+    const STREAM_URL = `${BACKEND_URL}/stream`;
     const chatMessages = document.getElementById('chat-messages');
     const messageInput = document.getElementById('message-input');
     const sendButton = document.getElementById('send-button');
@@ -74,6 +76,24 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Identificador único da mensagem: se ela for reenviada (nova tentativa após falha de rede),
+    // o servidor devolve a resposta original em vez de processá-la de novo
+    function newMessageId() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now().toString(36)}-${Math.random().toString(36).substring(2, 10)}`;
+    }
+
+    // Envia a requisição e tenta mais uma vez, com o mesmo corpo, se a conexão falhar
+    async function postMessage(url, body) {
+        const options = { method: 'POST', headers: { 'Content-Type': 'application/json' }, body };
+        try {
+            return await fetch(url, options);
+        } catch (error) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            return fetch(url, options);
+        }
+    }
+
     async function handleSendMessage(messageTextFromButton = null) {
         const messageText = messageTextFromButton || messageInput.value;
         if (messageText.trim() === '') return;
@@ -84,25 +104,89 @@ document.addEventListener('DOMContentLoaded', () => {
         addMessage(messageText, 'sent');
 
         try {
-            const response = await fetch(BACKEND_URL, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: messageText, sessionId: sessionId })
-            });
-            if (!response.ok) throw new Error(`Erro de rede: ${response.status}`);
-            
-            const data = await response.json();
-            if (data && data.reply) {
-                setTimeout(() => {                    
-                    addMessage(data.reply, 'received', data.buttons || []);
-                }, 1500);
+            const body = JSON.stringify({ message: messageText, sessionId: sessionId, messageId: newMessageId() });
+            const streamResponse = await postMessage(STREAM_URL, body);
+            if (streamResponse.status === 429) {
+                addMessage('Estamos com muitas mensagens no momento. Tente novamente em alguns segundos.', 'received');
+                return;
             }
+            if (streamResponse.status === 503) {
+                addMessage('O atendimento está sendo reiniciado. Tente novamente em alguns segundos.', 'received');
+                return;
+            }
+            // Servidor sem o endpoint de streaming: usa o /chat tradicional
+            if (streamResponse.status === 404 || streamResponse.status === 405) {
+                const response = await postMessage(BACKEND_URL, body);
+                if (!response.ok) throw new Error(`Erro de rede: ${response.status}`);
+
+                const data = await response.json();
+                if (data && data.reply) {
+                    setTimeout(() => {
+                        addMessage(data.reply, 'received', data.buttons || []);
+                    }, 1500);
+                }
+                return;
+            }
+            if (!streamResponse.ok) throw new Error(`Erro de rede: ${streamResponse.status}`);
+            await readStream(streamResponse);
         } catch (error) {
             console.error('Falha ao comunicar com o servidor:', error);
             addMessage('Desculpe, não consegui conectar ao servidor.', 'received');
         }
     }
 
+    // Lê os eventos SSE do /chat/stream: "chunk" traz um trecho da resposta e "done" a resposta final
+    async function readStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let partial = '';
+        let bubble = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let separator;
+            while ((separator = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, separator);
+                buffer = buffer.slice(separator + 2);
+
+                let event = 'message';
+                let dataText = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+                });
+                if (!dataText) continue;
+                const data = JSON.parse(dataText);
+
+                if (event === 'chunk') {
+                    partial += data.delta;
+                    if (!bubble) {
+                        bubble = document.createElement('div');
+                        bubble.classList.add('message', 'received');
+                        bubble.appendChild(document.createElement('p'));
+                        chatMessages.appendChild(bubble);
+                    }
+                    bubble.firstChild.innerHTML = formatTextToHTML(partial);
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                } else if (event === 'done' && data.reply) {
+                    if (bubble) {
+                        // A resposta já foi exibida em partes: troca o balão provisório pela mensagem final
+                        bubble.remove();
+                        addMessage(data.reply, 'received', data.buttons || []);
+                    } else {
+                        setTimeout(() => {
+                            addMessage(data.reply, 'received', data.buttons || []);
+                        }, 1500);
+                    }
+                }
+            }
+        }
+    }
+
     function initializeChat() {
         sessionId = localStorage.getItem('chatSessionId');
         if (!sessionId) {